@@ -0,0 +1,464 @@
+"""
+Measurement backends
+====================
+
+Purpose:
+--------
+This module provides the engines WiFiSpeedTester measures with. Each backend
+runs one measurement as select_server() (which also measures latency into
+.ping), then download() and upload(), both returning Mbps. probe() is the
+cheap tier used between full tests (see probing.py): a TCP connect to the
+server plus one small download. candidates(), measure_latency() and
+measure_download() support fan-out across several servers (see
+WiFiSpeedTester.fan_out).
+
+Backends:
+---------
+SpeedtestCliBackend(db)
+    speedtest.net through speedtest-cli (the default). The best server is
+    cached in config with a TTL; see select_server.
+
+HTTPBackend(url, download_bytes, upload_bytes, streams)
+    Plain HTTP against any endpoint speaking the throughput_server protocol
+    (GET /latency, GET /download?bytes=N, POST /upload). Needs no third-party
+    packages, so with a local throughput_server it runs fully offline.
+
+MeasurementCancelled
+    Raised by a transfer that stopped because backend.cancel was set.
+
+create_backend(db) -> backend
+    Builds the backend named by the measurement_backend config key
+    ('speedtest' or 'http'; 'http' reads measurement_url, a comma-separated
+    list whose first entry is the main endpoint and the rest mirrors).
+
+Usage:
+------
+backend = HTTPBackend('http://127.0.0.1:8080')
+server = backend.select_server()
+print(backend.ping, backend.download(), backend.upload())
+"""
+import json
+import logging
+import os
+import socket
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection, HTTPSConnection
+from urllib.parse import urlparse
+
+# Best-server cache, stored as JSON in config under SERVER_CACHE_KEY. The
+# server list is re-fetched after server_cache_ttl_hours (config, default
+# below); the cached server is replaced sooner if its latency rises above
+# SERVER_LATENCY_TOLERANCE times the latency it was chosen with.
+SERVER_CACHE_KEY = 'best_server_cache'
+DEFAULT_SERVER_CACHE_TTL_HOURS = 24
+SERVER_LATENCY_TOLERANCE = 1.5
+
+# HTTPBackend defaults: bytes moved per direction (split across streams),
+# latency probes per run and the read/write chunk size
+DEFAULT_TRANSFER_BYTES = 25_000_000
+DEFAULT_STREAMS = 4
+LATENCY_SAMPLES = 3
+CHUNK_SIZE = 256 * 1024
+
+
+class MeasurementCancelled(Exception):
+    """A transfer stopped because the backend's cancel event was set"""
+
+
+class SpeedTestBackend:
+    """Interface shared by all measurement backends"""
+    name = None
+    # threading.Event set when the run's deadline passes (see run_control);
+    # transfers check it between chunks and stop early
+    cancel = None
+
+    def cancelled(self):
+        return self.cancel is not None and self.cancel.is_set()
+
+    def select_server(self):
+        """
+        Chooses the server for this measurement and measures latency.
+        Returns:
+            dict: Server with at least sponsor, name, country and latency (ms).
+        """
+        raise NotImplementedError
+
+    @property
+    def ping(self):
+        """Latency of the selected server in ms"""
+        raise NotImplementedError
+
+    def download(self):
+        """Returns download throughput in Mbps"""
+        raise NotImplementedError
+
+    def upload(self):
+        """Returns upload throughput in Mbps"""
+        raise NotImplementedError
+
+    def candidates(self, count):
+        """
+        The servers a fan-out measures, best first; valid after select_server().
+        Returns:
+            list: Up to count server dicts.
+        """
+        raise NotImplementedError
+
+    def server_urls(self, server, max_bytes):
+        """
+        Returns:
+            tuple: (latency_url, download_url) for one candidate server.
+        """
+        raise NotImplementedError
+
+    def measure_latency(self, server, budget=5.0):
+        """Median of LATENCY_SAMPLES round trips to one candidate server, in ms"""
+        latency_url, _ = self.server_urls(server, 0)
+        return http_latency(latency_url, timeout=budget)
+
+    def measure_download(self, server, max_bytes, budget=5.0):
+        """
+        Short download from one candidate server. It stops at budget seconds
+        and the rate covers what arrived by then.
+        Returns:
+            tuple: (download Mbps or None, bytes received)
+        """
+        _, download_url = self.server_urls(server, max_bytes)
+        received, elapsed = timed_download(download_url, max_bytes, budget, time.perf_counter() + budget)
+        return (received * 8 / elapsed / 1_000_000 if received else None), received
+
+    def probe_target(self, max_bytes):
+        """
+        Where probe() connects and downloads from.
+        Returns:
+            tuple | None: (host, port, download_url), or None if no server is known yet.
+        """
+        raise NotImplementedError
+
+    def probe(self, max_bytes, timeout=10):
+        """
+        TCP connect latency to the server plus a download of at most max_bytes.
+        Returns:
+            dict | None: latency_ms, download_mbps, bytes and server, or None
+                when there is no server to probe yet.
+        """
+        target = self.probe_target(max_bytes)
+        if target is None:
+            return None
+        host, port, url = target
+        start = time.perf_counter()
+        socket.create_connection((host, port), timeout=timeout).close()
+        latency = (time.perf_counter() - start) * 1000
+        received, elapsed = timed_download(url, max_bytes, timeout)
+        return {
+            'latency_ms': latency,
+            'download_mbps': received * 8 / elapsed / 1_000_000 if received else None,
+            'bytes': received,
+            'server': host,
+        }
+
+
+def http_latency(url, samples=LATENCY_SAMPLES, timeout=10):
+    """
+    Median round trip in ms of samples GETs of url over one keep-alive
+    connection.
+    """
+    parsed = urlparse(url)
+    connection_class = HTTPSConnection if parsed.scheme == 'https' else HTTPConnection
+    path = parsed.path + (f'?{parsed.query}' if parsed.query else '')
+    conn = connection_class(parsed.hostname, parsed.port, timeout=timeout)
+    times = []
+    try:
+        for _ in range(samples):
+            start = time.perf_counter()
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            times.append((time.perf_counter() - start) * 1000)
+            if response.status != 200:
+                raise IOError(f"{url} answered {response.status} {response.reason}")
+    finally:
+        conn.close()
+    return statistics.median(times)
+
+
+def timed_download(url, max_bytes, timeout=10, deadline=None):
+    """
+    GETs url, stopping after max_bytes or at deadline (perf_counter time).
+    Returns:
+        tuple: (bytes received, seconds from request to last byte)
+    """
+    parsed = urlparse(url)
+    connection_class = HTTPSConnection if parsed.scheme == 'https' else HTTPConnection
+    path = parsed.path + (f'?{parsed.query}' if parsed.query else '')
+    buffer = memoryview(bytearray(CHUNK_SIZE))
+    received = 0
+    start = time.perf_counter()
+    conn = connection_class(parsed.hostname, parsed.port, timeout=timeout)
+    try:
+        conn.request('GET', path)
+        response = conn.getresponse()
+        if response.status != 200:
+            raise IOError(f"{url} answered {response.status} {response.reason}")
+        while received < max_bytes:
+            count = response.readinto(buffer[:min(CHUNK_SIZE, max_bytes - received)])
+            if not count:
+                break
+            received += count
+            if deadline and time.perf_counter() >= deadline:
+                break
+    finally:
+        conn.close()
+    return received, time.perf_counter() - start
+
+
+class SpeedtestCliBackend(SpeedTestBackend):
+    name = 'speedtest'
+
+    def __init__(self, db):
+        """
+        Parameters:
+            db (WiFiSpeedDB): Database holding the server cache.
+        """
+        self.db = db
+        self.st = None
+        self._candidates = []
+
+    def select_server(self):
+        """
+        Starts a speedtest.net session and picks its server.
+        A cached server is probed on its own (three latency requests, no
+        server list download). The cache is refreshed with a full selection
+        when its TTL has expired, and the cached candidates are re-probed when
+        the server's latency has got worse. Hit/miss counts are kept in the
+        cache and logged.
+        Returns:
+            dict: The selected server (sponsor, name, country, latency, ...).
+        """
+        # Imported here so other backends work without speedtest-cli installed
+        import speedtest
+        # speedtest-cli's transfer threads stop when shutdown_event is set
+        st = self.st = speedtest.Speedtest(shutdown_event=self.cancel)
+
+        cache = self._load_server_cache()
+        ttl = self._server_cache_ttl()
+        hits = cache.get('hits', 0)
+        misses = cache.get('misses', 0)
+        best = None
+
+        if cache.get('server') and time.time() - cache['fetched_at'] < ttl:
+            try:
+                best = st.get_best_server([cache['server']])
+                if best['latency'] <= cache['latency'] * SERVER_LATENCY_TOLERANCE:
+                    hits += 1
+                    logging.info(f"Server cache hit: {best.get('sponsor', 'Unknown')} at {best['latency']:.1f} ms "
+                                 f"(hits {hits}, misses {misses})")
+                    cache.update(hits=hits, server=best)
+                    self._save_server_cache(cache)
+                    self._candidates = cache.get('candidates', [best])
+                    return best
+                reason = f"latency {best['latency']:.1f} ms vs {cache['latency']:.1f} ms when selected"
+                best = st.get_best_server(cache['candidates'])
+            except Exception as e:
+                reason = f"cached servers unreachable ({e})"
+                best = None
+        else:
+            reason = "expired" if cache.get('server') else "empty"
+
+        if best is None:
+            best = st.get_best_server()
+            cache['candidates'] = st.closest
+            cache['fetched_at'] = time.time()
+        misses += 1
+        logging.info(f"Server cache miss ({reason}): selected {best.get('sponsor', 'Unknown')} "
+                     f"at {best['latency']:.1f} ms (hits {hits}, misses {misses})")
+        cache.update(hits=hits, misses=misses, server=best, latency=best['latency'])
+        self._save_server_cache(cache)
+        self._candidates = cache['candidates']
+        return best
+
+    def _server_cache_ttl(self):
+        # Seconds; a config value that is not a number falls back to the default
+        return self.db.get_config_number('server_cache_ttl_hours', DEFAULT_SERVER_CACHE_TTL_HOURS) * 3600
+
+    def _load_server_cache(self):
+        try:
+            return json.loads(self.db.get_config(SERVER_CACHE_KEY, '{}'))
+        except ValueError:
+            return {}
+
+    def _save_server_cache(self, cache):
+        self.db.set_config(SERVER_CACHE_KEY, json.dumps(cache))
+
+    @property
+    def ping(self):
+        return self.st.results.ping
+
+    def candidates(self, count):
+        # Nearest servers by distance, as speedtest-cli probes them
+        best = self.st.best
+        others = [server for server in self._candidates if server.get('id') != best.get('id')]
+        return [best] + others[:count - 1]
+
+    def server_urls(self, server, max_bytes):
+        base = os.path.dirname(server['url'])
+        return f"{base}/latency.txt", f"{base}/random4000x4000.jpg"
+
+    def probe_target(self, max_bytes):
+        # The cached server, without starting a speedtest.net session; its
+        # largest test image is ~30 MB and the probe stops at max_bytes
+        server = self._load_server_cache().get('server')
+        if not server:
+            return None
+        parsed = urlparse(server['url'])
+        port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        return parsed.hostname, port, f"{os.path.dirname(server['url'])}/random4000x4000.jpg"
+
+    def download(self):
+        return self.st.download() / 1_000_000  # Convert to Mbps
+
+    def upload(self):
+        return self.st.upload() / 1_000_000  # Convert to Mbps
+
+
+class HTTPBackend(SpeedTestBackend):
+    name = 'http'
+
+    def __init__(self, url, download_bytes=DEFAULT_TRANSFER_BYTES, upload_bytes=DEFAULT_TRANSFER_BYTES,
+                 streams=DEFAULT_STREAMS, timeout=10, mirrors=()):
+        """
+        Parameters:
+            url (str): Base URL of the endpoint, e.g. 'http://127.0.0.1:8080'.
+            mirrors (list): Further endpoint URLs, used as fan-out candidates.
+            download_bytes (int): Bytes to download per run, split across streams.
+            upload_bytes (int): Bytes to upload per run, split across streams.
+            streams (int): Parallel connections per direction.
+            timeout (float): Socket timeout in seconds.
+        """
+        self.url = url.rstrip('/')
+        parsed = urlparse(self.url)
+        self._connection_class = HTTPSConnection if parsed.scheme == 'https' else HTTPConnection
+        self._host = parsed.hostname
+        self._port = parsed.port
+        self._path = parsed.path
+        self.download_bytes = download_bytes
+        self.upload_bytes = upload_bytes
+        self.streams = max(1, streams)
+        self.timeout = timeout
+        self.mirrors = [mirror.rstrip('/') for mirror in mirrors]
+        self._ping = None
+        self._local = threading.local()
+
+    def _connect(self):
+        return self._connection_class(self._host, self._port, timeout=self.timeout)
+
+    def _check(self, response):
+        if response.status != 200:
+            raise IOError(f"{self.url} answered {response.status} {response.reason}")
+
+    def _server(self, url):
+        return {'sponsor': url, 'name': urlparse(url).hostname, 'country': '', 'url': url}
+
+    def select_server(self):
+        """
+        Probes /latency LATENCY_SAMPLES times on one keep-alive connection.
+        ping is the median round trip.
+        """
+        self._ping = http_latency(f'{self.url}/latency', timeout=self.timeout)
+        return dict(self._server(self.url), latency=self._ping)
+
+    def candidates(self, count):
+        return [self._server(url) for url in [self.url] + self.mirrors][:count]
+
+    def server_urls(self, server, max_bytes):
+        return f"{server['url']}/latency", f"{server['url']}/download?bytes={max_bytes}"
+
+    @property
+    def ping(self):
+        return self._ping
+
+    def _buffer(self):
+        # One reusable receive buffer per worker thread
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = self._local.buffer = memoryview(bytearray(CHUNK_SIZE))
+        return buffer
+
+    def _download_stream(self, size):
+        conn = self._connect()
+        try:
+            conn.request('GET', f'{self._path}/download?bytes={size}')
+            response = conn.getresponse()
+            self._check(response)
+            buffer = self._buffer()
+            received = 0
+            while True:
+                if self.cancelled():
+                    raise MeasurementCancelled("download cancelled")
+                count = response.readinto(buffer)
+                if not count:
+                    break
+                received += count
+            return received
+        finally:
+            conn.close()
+
+    def _upload_stream(self, size):
+        def body():
+            payload = memoryview(bytes(CHUNK_SIZE))
+            remaining = size
+            while remaining > 0:
+                if self.cancelled():
+                    raise MeasurementCancelled("upload cancelled")
+                count = min(remaining, CHUNK_SIZE)
+                yield payload[:count]
+                remaining -= count
+
+        conn = self._connect()
+        try:
+            conn.request('POST', f'{self._path}/upload', body=body(),
+                         headers={'Content-Length': str(size), 'Content-Type': 'application/octet-stream'})
+            response = conn.getresponse()
+            self._check(response)
+            response.read()
+            return size
+        finally:
+            conn.close()
+
+    def _transfer(self, stream, total):
+        sizes = [total // self.streams] * self.streams
+        sizes[0] += total - sum(sizes)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.streams) as executor:
+            moved = sum(executor.map(stream, sizes))
+        elapsed = time.perf_counter() - start
+        return moved * 8 / elapsed / 1_000_000
+
+    def probe_target(self, max_bytes):
+        port = self._port or (443 if self._connection_class is HTTPSConnection else 80)
+        return self._host, port, f'{self.url}/download?bytes={max_bytes}'
+
+    def download(self):
+        return self._transfer(self._download_stream, self.download_bytes)
+
+    def upload(self):
+        return self._transfer(self._upload_stream, self.upload_bytes)
+
+
+def create_backend(db):
+    """
+    Backend named by config: measurement_backend is 'speedtest' (default) or
+    'http', which measures against measurement_url.
+    """
+    name = db.get_config('measurement_backend', SpeedtestCliBackend.name)
+    if name == SpeedtestCliBackend.name:
+        return SpeedtestCliBackend(db)
+    if name == HTTPBackend.name:
+        urls = [url.strip() for url in db.get_config('measurement_url', '').split(',') if url.strip()]
+        if not urls:
+            raise ValueError("measurement_backend is 'http' but measurement_url is not set")
+        return HTTPBackend(urls[0], mirrors=urls[1:])
+    raise ValueError(f"Unknown measurement backend: {name}")
@@ -0,0 +1,970 @@
+#!/usr/bin/env python3
+"""
+benchmark.py - Synthetic benchmarks for the wifi storage layer.
+
+Every subcommand works on a throwaway database in a temporary directory,
+so running it never touches wifi_speed.db. Correctness checks (query
+plans, the startup version check) are pytest tests under tests/.
+"""
+import argparse
+import asyncio
+import ipaddress
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import sys
+import sqlite3
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from datetime import date, datetime, timedelta
+from io import StringIO
+from backends import HTTPBackend
+from database import WiFiSpeedDB
+from latency_sampler import LatencySampler, minute_stats
+from records import SpeedTestResult
+from scheduler import IntervalScheduler
+from sweep import DEFAULT_RATE, Sweeper
+
+
+def synthetic_rows(rows, interval_minutes=1, end=None):
+    """Yield speed_tests rows, one every interval_minutes, ending at `end`"""
+    end = end or datetime.now()
+    start = end - timedelta(minutes=interval_minutes * rows)
+    rng = random.Random(42)
+    for i in range(rows):
+        timestamp = start + timedelta(minutes=interval_minutes * i)
+        yield (timestamp, rng.uniform(200, 950), rng.uniform(20, 110), rng.uniform(5, 80),
+               "Synthetic ISP", "Localhost, US", rng.randint(3, 25))
+
+
+def populate(db_path, rows, interval_minutes=1):
+    """Create the schema and fill speed_tests with `rows` synthetic samples"""
+    db = WiFiSpeedDB(db_path)
+    db.insert_speed_tests_bulk(synthetic_rows(rows, interval_minutes), chunk_size=5000)
+    db.connection().execute('DELETE FROM summary_dirty')
+    db.close()
+
+
+def run_monitor_cycle(db):
+    """The database work one run_speed_test cycle performs after measuring"""
+    with db.transaction():
+        db.insert_speed_test(download_speed=500.0, upload_speed=50.0, ping=12.0,
+                             server_name="Synthetic ISP", server_location="Localhost, US",
+                             device_count=8)
+        db.update_today_summary()
+        db.create_placeholder_entries(days_back=3)
+    db.get_retention_policy()
+
+
+def bench_connections(args):
+    """Connection reuse over a number of simulated monitor cycles"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        print(f"🏗️  Populating {args.rows:,} rows...")
+        populate(db_path, args.rows)
+
+        db = WiFiSpeedDB(db_path)
+        db.set_plan_speed("Bench Plan", 1000, 100)
+        start = time.perf_counter()
+        for _ in range(args.cycles):
+            run_monitor_cycle(db)
+        elapsed = time.perf_counter() - start
+        stats = db.connection_stats()
+        db.close()
+
+    print(f"\n🔌 Connection usage over {args.cycles} cycles")
+    print("=" * 50)
+    print(f"Connections opened:       {stats['connections_opened']}")
+    print(f"Connect-per-call would be: {stats['checkouts']}")
+    print(f"Transactions committed:   {stats['transactions']}")
+    print(f"Connection hold time:     {stats['connection_seconds']:.3f} s")
+    print(f"Time in transactions:     {stats['transaction_seconds']:.3f} s")
+    print(f"Wall time per cycle:      {elapsed / args.cycles * 1000:.1f} ms")
+
+
+def bench_ingest(args):
+    """Row-at-a-time insert_speed_test versus insert_speed_tests_bulk"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = WiFiSpeedDB(os.path.join(tmp, "single.db"))
+        start = time.perf_counter()
+        for row in synthetic_rows(args.rows):
+            db.insert_speed_test(*row[1:])
+        single = time.perf_counter() - start
+        db.close()
+
+        db = WiFiSpeedDB(os.path.join(tmp, "bulk.db"))
+        start = time.perf_counter()
+        inserted, days = db.insert_speed_tests_bulk(synthetic_rows(args.rows), chunk_size=args.chunk_size)
+        bulk = time.perf_counter() - start
+        start = time.perf_counter()
+        refreshed = db.refresh_dirty_summaries()
+        refresh = time.perf_counter() - start
+        db.close()
+
+    print(f"\n📥 Ingesting {args.rows:,} rows")
+    print("=" * 50)
+    print(f"insert_speed_test loop:   {single:.2f} s ({args.rows / single:,.0f} rows/s)")
+    print(f"insert_speed_tests_bulk:  {bulk:.2f} s ({inserted / bulk:,.0f} rows/s)")
+    print(f"Speedup:                  {single / bulk:.1f}x")
+    print(f"Summaries refreshed:      {refreshed} of {days} days in {refresh:.2f} s")
+
+
+def bench_summaries(args):
+    """Incremental sketch summaries versus an exact recompute of the whole day"""
+    import statistics
+    from daily_rollup import DailyRollup
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        populate(db_path, args.days * 1440, interval_minutes=1)
+        db = WiFiSpeedDB(db_path)
+        db.set_plan_speed("Bench Plan", 1000, 100)
+        exact = DailyRollup.__new__(DailyRollup)
+
+        worst = {'download': 0.0, 'upload': 0.0, 'ping': 0.0}
+        cursor = db.connection().cursor()
+        cursor.execute('SELECT DISTINCT DATE(timestamp) FROM speed_tests')
+        days = [row[0] for row in cursor.fetchall()]
+        for day in days:
+            db.rebuild_daily_aggregate(day)
+            db.update_daily_summary(day)
+            rows = db.get_daily_data(day)
+            cursor.execute('SELECT median_download_mbps, median_upload_mbps, p95_ping_ms FROM daily_summary WHERE day = ?', (day,))
+            sketched = cursor.fetchone()
+            truth = (statistics.median(r[0] for r in rows), statistics.median(r[1] for r in rows),
+                     exact.calculate_percentile([r[2] for r in rows], 95))
+            for name, approx, value in zip(worst, sketched, truth):
+                worst[name] = max(worst[name], abs(approx - value) / value)
+
+        start = time.perf_counter()
+        for _ in range(args.inserts):
+            with db.transaction():
+                db.insert_speed_test(500.0, 50.0, 12.0, device_count=8)
+                db.update_today_summary()
+        incremental = (time.perf_counter() - start) / args.inserts
+
+        full_day = (date.today() - timedelta(days=1)).isoformat()
+        start = time.perf_counter()
+        for _ in range(args.inserts):
+            rows = db.get_daily_data(full_day)
+            statistics.median(r[0] for r in rows)
+            statistics.median(r[1] for r in rows)
+            exact.calculate_percentile([r[2] for r in rows], 95)
+        recompute = (time.perf_counter() - start) / args.inserts
+        full_day_samples = len(rows)
+        db.close()
+
+    print(f"\n📐 Sketch summaries over {len(days)} days of 1-minute samples")
+    print("=" * 60)
+    print(f"Max relative error, median download: {worst['download'] * 100:.2f}%")
+    print(f"Max relative error, median upload:   {worst['upload'] * 100:.2f}%")
+    print(f"Max relative error, p95 ping:        {worst['ping'] * 100:.2f}%")
+    print(f"Insert + incremental summary:        {incremental * 1000:.2f} ms")
+    print(f"Exact recompute of a {full_day_samples}-sample day: {recompute * 1000:.2f} ms")
+
+
+def bench_startup(args):
+    """Cold WiFiSpeedDB construction: versioned schema versus re-running all DDL"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        start = time.perf_counter()
+        WiFiSpeedDB(db_path).close()
+        first = time.perf_counter() - start
+
+        def construct(reset_version):
+            timings = []
+            for _ in range(args.runs):
+                if reset_version:
+                    conn = sqlite3.connect(db_path)
+                    conn.execute('PRAGMA user_version = 0')
+                    conn.close()
+                start = time.perf_counter()
+                db = WiFiSpeedDB(db_path)
+                timings.append((time.perf_counter() - start) * 1000)
+                db.close()
+            return timings
+
+        legacy = construct(reset_version=True)
+        versioned = construct(reset_version=False)
+
+    print(f"\n🚀 Cold WiFiSpeedDB() construction ({args.runs} runs)")
+    print("=" * 60)
+    print(f"New database (all migrations):  {first * 1000:.2f} ms")
+    print(f"Re-running schema every time:   p50 {percentile(legacy, 50):.2f} ms, p99 {percentile(legacy, 99):.2f} ms")
+    print(f"Version check only:             p50 {percentile(versioned, 50):.2f} ms, p99 {percentile(versioned, 99):.2f} ms")
+
+
+# What a cron tick runs before measuring: the monitor's imports plus database
+# and scanner setup (speedtest is included when it is installed)
+CRON_STARTUP = """
+import importlib.util, sys, time
+start = time.perf_counter()
+if importlib.util.find_spec('speedtest'):
+    import speedtest
+from database import WiFiSpeedDB
+from device_scanner import DeviceScanner
+WiFiSpeedDB(sys.argv[1])
+DeviceScanner()
+print(time.perf_counter() - start)
+"""
+
+
+def bench_daemon(args):
+    """Per-cycle overhead: a fresh process per cron tick versus the warm daemon"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        populate(db_path, args.rows)
+
+        cold = []
+        in_process = []
+        for _ in range(args.cycles):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, '-c', CRON_STARTUP, db_path],
+                                    capture_output=True, text=True, check=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+            cold.append((time.perf_counter() - start) * 1000)
+            in_process.append(float(output) * 1000)
+
+        db = WiFiSpeedDB(db_path)
+        scheduler = IntervalScheduler(lambda: args.interval, poll_seconds=args.interval)
+
+        def job():
+            run_monitor_cycle(db)
+            if scheduler.ticks >= args.cycles:
+                scheduler.stop()
+
+        scheduler.run(job)
+        db.close()
+
+    warm = [lateness * 1000 for lateness in scheduler.lateness]
+    print(f"\n⏰ Per-cycle overhead before measuring ({args.cycles} cycles)")
+    print("=" * 60)
+    print(f"Cron, whole process:     p50 {percentile(cold, 50):8.1f} ms, max {max(cold):8.1f} ms")
+    print(f"  imports + setup only:  p50 {percentile(in_process, 50):8.1f} ms")
+    print(f"Daemon, tick lateness:   p50 {percentile(warm, 50):8.2f} ms, max {max(warm):8.2f} ms")
+    print(f"Daemon ticks skipped:    {scheduler.skipped} (lateness does not accumulate across ticks)")
+
+
+def start_throughput_server(bandwidth_mbps=None, latency_ms=0):
+    """Runs throughput_server.py in its own process (so its CPU is not counted); returns (process, url)"""
+    command = [sys.executable, 'throughput_server.py', '--port', '0', '--latency', str(latency_ms)]
+    if bandwidth_mbps:
+        command += ['--bandwidth', str(bandwidth_mbps)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    return process, process.stdout.readline().strip()
+
+
+def bench_engines(args):
+    """HTTPBackend accuracy and client CPU against the local throughput server"""
+    print(f"\n🔌 HTTP engine against a loopback throughput server ({args.streams} streams)")
+    print("=" * 72)
+    print(f"{'Shaped to':>12} {'Download':>12} {'Upload':>12} {'Error':>8} {'Client CPU/GB':>15}")
+    for bandwidth in args.bandwidth + [None]:
+        process, url = start_throughput_server(bandwidth)
+        try:
+            # Enough bytes for ~2 s per direction at the shaped rate
+            size = int((bandwidth or 10_000) * 1_000_000 / 8 * args.seconds)
+            backend = HTTPBackend(url, size, size, streams=args.streams)
+            backend.select_server()
+            cpu = time.process_time()
+            download = backend.download()
+            upload = backend.upload()
+            cpu = time.process_time() - cpu
+        finally:
+            process.terminate()
+            process.wait()
+        cpu_per_gb = cpu / (2 * size / 1e9) * 1000
+        label = f"{bandwidth:g} Mbps" if bandwidth else "unshaped"
+        error = f"{(min(download, upload) / bandwidth - 1) * 100:+.1f}%" if bandwidth else "-"
+        print(f"{label:>12} {download:9.0f} Mbps {upload:7.0f} Mbps {error:>8} {cpu_per_gb:12.0f} ms")
+    print("Error is the slower direction versus the configured rate; CPU is this process only.")
+
+
+class SimulatedScanner:
+    """Stands in for DeviceScanner: a ping sweep that takes a fixed time"""
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def count_active_devices(self):
+        time.sleep(self.seconds)
+        return 8
+
+    def count_devices_cached(self, force=False, full=None):
+        # Always scans: the benchmark measures the scan's cost, not the cache
+        return self.count_active_devices(), 0.0
+
+
+def bench_pipeline(args):
+    """Wall clock per run_speed_test cycle: every stage in turn versus the staged pipeline"""
+    from speed_test import WiFiSpeedTester
+    process, url = start_throughput_server(args.bandwidth, args.latency)
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            # WiFiSpeedTester opens wifi_speed.db in the working directory
+            os.chdir(tmp)
+            populate("wifi_speed.db", args.rows)
+            size = int(args.bandwidth * 1_000_000 / 8 * args.seconds)
+            timings = {}
+            for sequential in (True, False):
+                tester = WiFiSpeedTester(HTTPBackend(url, size, size, streams=1), sequential=sequential)
+                tester.device_scanner = SimulatedScanner(args.scan)
+                cycles, failed = [], 0
+                with redirect_stdout(StringIO()):
+                    for _ in range(args.cycles):
+                        start = time.perf_counter()
+                        if tester.run_speed_test() is None:
+                            # Failed or timed out: no phase timings to report
+                            failed += 1
+                            continue
+                        cycles.append((time.perf_counter() - start, tester.timings))
+                    tester.close()
+                timings[sequential] = cycles, failed
+    finally:
+        os.chdir(cwd)
+        process.terminate()
+        process.wait()
+
+    print(f"\n🧵 run_speed_test wall clock ({args.cycles} cycles, {args.scan:g} s device scan, "
+          f"{args.latency:g} ms server latency, {args.bandwidth:g} Mbps for ~{args.seconds:g} s per direction)")
+    print("=" * 72)
+    for sequential, label in ((True, "Sequential"), (False, "Pipelined")):
+        cycles, failed = timings[sequential]
+        note = f"   ({failed} failed cycles left out)" if failed else ""
+        if not cycles:
+            print(f"{label:<11} every cycle failed")
+            continue
+        wall = [elapsed * 1000 for elapsed, _ in cycles]
+        discovery = [phases['discovery'] * 1000 for _, phases in cycles]
+        transfer = [phases['transfer'] * 1000 for _, phases in cycles]
+        print(f"{label:<11} cycle p50 {percentile(wall, 50):7.0f} ms   discovery p50 {percentile(discovery, 50):7.0f} ms   "
+              f"transfer p50 {percentile(transfer, 50):7.0f} ms{note}")
+    if not (timings[True][0] and timings[False][0]):
+        print("No comparison: a mode had no successful cycles (see the log above).")
+        return
+    saved = percentile([e for e, _ in timings[True][0]], 50) - percentile([e for e, _ in timings[False][0]], 50)
+    print(f"Pipelined saves {saved * 1000:.0f} ms per cycle; transfers never overlap discovery or the write.")
+
+
+def bench_fanout(args):
+    """Single-server result versus the fan-out median when the selected server is degraded"""
+    from speed_test import WiFiSpeedTester
+    # The selected server is the bad one: high latency and a slow link
+    servers = [start_throughput_server(args.bad_bandwidth, args.bad_latency)]
+    servers += [start_throughput_server(args.bandwidth, args.latency) for _ in range(args.servers - 1)]
+    urls = [url for _, url in servers]
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            backend = HTTPBackend(urls[0], streams=1, mirrors=urls[1:])
+            tester = WiFiSpeedTester(backend)
+            backend.select_server()
+            single_download, _ = backend.measure_download(backend.candidates(1)[0], args.bytes)
+            settings = {'servers': args.servers, 'budget': args.budget, 'bytes': 0}
+            walls = {}
+            for workers in (1, args.servers):
+                start = time.perf_counter()
+                tester.fan_out(dict(settings, workers=workers))
+                walls[workers] = time.perf_counter() - start
+            measurements = tester.fan_out(dict(settings, workers=args.servers, bytes=args.bytes))
+            ping, download = tester._fan_out_headline(measurements, backend.ping)
+            tester.close()
+    finally:
+        os.chdir(cwd)
+        for process, _ in servers:
+            process.terminate()
+            process.wait()
+
+    print(f"\n🛰️  Fan-out over {args.servers} loopback servers; the selected one is degraded "
+          f"({args.bad_latency:g} ms, {args.bad_bandwidth:g} Mbps vs {args.latency:g} ms, {args.bandwidth:g} Mbps)")
+    print("=" * 72)
+    for m in measurements:
+        download_text = f"{m['download_mbps']:.0f} Mbps" if m['download_mbps'] is not None else "-"
+        print(f"  {m['server_name']:<26} {m['latency_ms'] or 0:7.1f} ms {download_text:>10} "
+              f"{m['elapsed_ms']:7.0f} ms  {m['status']}")
+    print(f"Single server:   ping {backend.ping:6.1f} ms   download {single_download:6.0f} Mbps")
+    print(f"Fan-out median:  ping {ping:6.1f} ms   download {download:6.0f} Mbps")
+    print(f"Latency fan-out wall time: {walls[args.servers] * 1000:.0f} ms with {args.servers} workers "
+          f"vs {walls[1] * 1000:.0f} ms one at a time; downloads always run one at a time")
+
+
+def bench_sampler(args):
+    """Latency sampler CPU and storage versus committing every sample as a row"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = WiFiSpeedDB(os.path.join(tmp, "bench.db"))
+        sampler = LatencySampler(db, args.host, args.hz, flush_seconds=args.flush)
+        flush_cpu = []
+        flush = sampler.flush
+
+        def timed_flush():
+            start = time.thread_time()
+            written = flush()
+            flush_cpu.append(time.thread_time() - start)
+            return written
+
+        sampler.flush = timed_flush
+        transactions = db.connections.transactions
+        cpu = time.process_time()
+        sampler.start()
+        time.sleep(args.seconds)
+        sampler.stop()
+        cpu = time.process_time() - cpu
+        commits = db.connections.transactions - transactions
+        conn = db.connection()
+        stored = conn.execute('SELECT SUM(LENGTH(offsets) + LENGTH(rtts)) FROM latency_batches').fetchone()[0]
+        stats = minute_stats(db, datetime.now() - timedelta(minutes=args.seconds / 60 + 2))
+
+        # The naive layout: one indexed row and one commit per sample
+        conn.execute('CREATE TABLE latency_samples (timestamp REAL, rtt REAL)')
+        conn.execute('CREATE INDEX idx_latency_samples_timestamp ON latency_samples(timestamp)')
+        pages = conn.execute('PRAGMA page_count').fetchone()[0]
+        # Enough rows to fill pages, so the size per sample is meaningful
+        naive_samples = max(sampler.written, 5000)
+        naive = time.perf_counter()
+        for index in range(naive_samples):
+            with db.transaction():
+                conn.execute('INSERT INTO latency_samples VALUES (?, ?)', (time.time(), 1.0))
+        naive = time.perf_counter() - naive
+        db.checkpoint('TRUNCATE')
+        naive_bytes = (conn.execute('PRAGMA page_count').fetchone()[0] - pages) * \
+            conn.execute('PRAGMA page_size').fetchone()[0]
+        db.close()
+
+    samples = sampler.written
+    print(f"\n📶 Latency sampler: {samples} samples of {args.host} via {sampler.method} "
+          f"at {args.hz:g} Hz for {args.seconds:g} s")
+    print("=" * 64)
+    print(f"Sampler CPU:        {cpu / args.seconds * 100:.2f}% of one core ({cpu / samples * 1e6:.0f} µs per sample)")
+    print(f"Batched storage:    {commits} commits, {sum(flush_cpu) / samples * 1e6:.1f} µs CPU "
+          f"and {stored / samples:.1f} bytes per sample")
+    print(f"Row per sample:     1 commit, {naive / naive_samples * 1e6:.1f} µs "
+          f"and ~{naive_bytes / naive_samples:.0f} bytes per sample")
+    for row in stats:
+        print(f"  {row['minute']}: {row['samples']} samples, p50 {row['p50_ms']:.2f} ms, "
+              f"p99 {row['p99_ms']:.2f} ms, jitter {row['jitter_ms']:.2f} ms, loss {row['loss_pct']:.1f}%")
+
+
+def _responder_process(live, latency_ms, ready):
+    """Simulated LAN: answers a UDP datagram naming a live address after latency_ms, ignores the rest"""
+    class Responder(asyncio.DatagramProtocol):
+        def connection_made(self, transport):
+            self.transport = transport
+            ready.send(transport.get_extra_info('sockname')[1])
+
+        def datagram_received(self, data, addr):
+            if data.decode() in live:
+                loop.call_later(latency_ms / 1000, self.transport.sendto, data, addr)
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(loop.create_datagram_endpoint(Responder, local_addr=('127.0.0.1', 0)))
+    loop.run_forever()
+
+
+def start_responder(live, latency_ms):
+    """Runs _responder_process; returns (process, port)"""
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_responder_process, args=(set(live), latency_ms, sender), daemon=True)
+    process.start()
+    return process, receiver.recv()
+
+
+class _Answer(asyncio.DatagramProtocol):
+    def __init__(self, answered):
+        self.answered = answered
+
+    def datagram_received(self, data, addr):
+        if not self.answered.done():
+            self.answered.set_result(True)
+
+
+def bench_sweep(args):
+    """Thread pool of blocking probes (the old scan) versus the asyncio Sweeper on a simulated subnet"""
+    rng = random.Random(42)
+    network = ipaddress.ip_network(args.network)
+    hosts = [str(ip) for ip in network.hosts()]
+    live = rng.sample(hosts, min(args.live, len(hosts)))
+    process, port = start_responder(live, args.latency)
+
+    def blocking_probe(ip):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(args.timeout)
+            sock.sendto(ip.encode(), ('127.0.0.1', port))
+            try:
+                sock.recv(64)
+                return True
+            except socket.timeout:
+                return False
+
+    async def async_probe(ip, timeout):
+        loop = asyncio.get_running_loop()
+        answered = loop.create_future()
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: _Answer(answered), remote_addr=('127.0.0.1', port))
+        try:
+            transport.sendto(ip.encode())
+            return await asyncio.wait_for(answered, timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            transport.close()
+
+    try:
+        threaded, threaded_time = None, None
+        # The thread pool needs about one timeout per `workers` silent addresses
+        if len(hosts) <= 1024:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.workers) as executor:
+                threaded = [ip for ip, up in zip(hosts, executor.map(blocking_probe, hosts)) if up]
+            threaded_time = time.perf_counter() - start
+
+        sweeper = Sweeper(timeout=args.timeout, probe=async_probe, rate=args.rate or None)
+        tracemalloc.start()
+        start = time.perf_counter()
+        # Streamed from the generator, as DeviceScanner does
+        swept = sweeper.sweep(network.hosts())
+        sweep_time = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        process.terminate()
+        process.join()
+
+    rate = f"{args.rate:g}/s" if args.rate else "unlimited"
+    print(f"\n📡 Sweeping {network} ({len(hosts):,} addresses, {len(live)} up, {args.latency:g} ms), "
+          f"{args.timeout:g} s probe timeout, rate {rate}")
+    print("=" * 60)
+    if threaded is not None:
+        print(f"{f'Thread pool ({args.workers} workers):':<26} {threaded_time:6.2f} s, {len(threaded)} found")
+    else:
+        print(f"{f'Thread pool ({args.workers} workers):':<26} skipped, about "
+              f"{len(hosts) / args.workers * args.timeout:,.0f} s")
+    print(f"{'asyncio Sweeper:':<26} {sweep_time:6.2f} s, {len(swept)} found, "
+          f"peak {peak / 1e6:.1f} MB traced")
+    if threaded is not None:
+        print(f"{'Speedup:':<26} {threaded_time / sweep_time:.1f}x")
+        print(f"{'Same hosts found:':<26} {'yes' if sorted(threaded) == sorted(swept) == sorted(live) else 'NO'}")
+    else:
+        print(f"{'All live hosts found:':<26} {'yes' if sorted(swept) == sorted(live) else 'NO'}")
+    print(f"Probe method on this machine: {Sweeper().method}")
+
+
+def legacy_archive(db_path, days_to_keep):
+    """
+    The archival loop archive_old_data used to run, for comparison: one fresh
+    connection, DATE() filter and plan lookup per day without a summary.
+    """
+    import statistics
+    cutoff = (date.today() - timedelta(days=days_to_keep)).isoformat()
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT DATE(timestamp) FROM speed_tests
+        WHERE DATE(timestamp) < ? AND DATE(timestamp) NOT IN (SELECT day FROM daily_summary)
+        GROUP BY DATE(timestamp)
+    ''', (cutoff,))
+    for (day,) in cursor.fetchall():
+        day_conn = sqlite3.connect(db_path)
+        daily_data = day_conn.execute('''
+            SELECT download_speed, upload_speed, ping, device_count
+            FROM speed_tests WHERE DATE(timestamp) = ? ORDER BY timestamp
+        ''', (day,)).fetchall()
+        plan = day_conn.execute('SELECT * FROM plan_speeds WHERE is_active = 1 ORDER BY created_date DESC LIMIT 1').fetchone()
+        day_conn.close()
+        bad = sum(1 for d, u, p, _ in daily_data
+                  if plan and (d < plan[2] * 0.7 or u < plan[3] * 0.7 or p > 50))
+        pct_bad = bad / len(daily_data) * 100
+        status = 'good' if pct_bad < 10 else 'meh' if pct_bad <= 30 else 'bad'
+        pings = sorted(r[2] for r in daily_data)
+        index = 0.95 * (len(pings) - 1)
+        lower = pings[int(index)]
+        upper = pings[min(int(index) + 1, len(pings) - 1)]
+        cursor.execute('''
+            INSERT OR IGNORE INTO daily_summary
+            (day, sample_count, median_download_mbps, median_upload_mbps,
+             p95_ping_ms, pct_bad, avg_device_count, status, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, NULL, ?, ?)
+        ''', (day, len(daily_data), statistics.median(r[0] for r in daily_data),
+              statistics.median(r[1] for r in daily_data),
+              lower + (upper - lower) * (index - int(index)), pct_bad, status, datetime.now()))
+    cursor.execute('DELETE FROM speed_tests WHERE DATE(timestamp) < ?', (cutoff,))
+    conn.commit()
+    conn.close()
+
+
+def bench_archive(args):
+    """Single-pass archive_old_data versus the old per-day loop"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        print(f"🏗️  Populating {args.rows:,} rows...")
+        populate(db_path, args.rows)
+        legacy_path = os.path.join(tmp, "legacy.db")
+        shutil.copyfile(db_path, legacy_path)
+
+        results = {}
+        for name, path, archive in (
+            ('legacy', legacy_path, lambda db: legacy_archive(path, args.keep)),
+            ('single-pass', db_path, lambda db: db.archive_old_data(args.keep)),
+        ):
+            if name == 'legacy' and args.skip_legacy:
+                continue
+            db = WiFiSpeedDB(path)
+            db.set_plan_speed("Bench Plan", 1000, 100)
+            print(f"⏱️  Running {name} archival...")
+            start = time.perf_counter()
+            archive(db)
+            elapsed = time.perf_counter() - start
+            summaries = db.connection().execute('''
+                SELECT day, sample_count, median_download_mbps, median_upload_mbps, p95_ping_ms, pct_bad, status
+                FROM daily_summary ORDER BY day
+            ''').fetchall()
+            db.close()
+            results[name] = (elapsed, summaries)
+
+    new_time, new_rows = results['single-pass']
+    print(f"\n📦 Archiving everything older than {args.keep} days")
+    print("=" * 60)
+    print(f"Single pass:    {new_time:.2f} s, {len(new_rows)} daily summaries")
+    if 'legacy' in results:
+        legacy_time, legacy_rows = results['legacy']
+        print(f"Per-day loop:   {legacy_time:.2f} s")
+        print(f"Speedup:        {legacy_time / new_time:.1f}x")
+        print(f"Summaries match: {'yes' if legacy_rows == new_rows else 'NO'}")
+
+
+def bench_retention(args):
+    """cleanup_old_data on a plain table (ranged DELETE) versus monthly partitions"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        print(f"🏗️  Populating {args.rows:,} rows...")
+        populate(db_path, args.rows)
+        partitioned_path = os.path.join(tmp, "partitioned.db")
+        shutil.copyfile(db_path, partitioned_path)
+        db = WiFiSpeedDB(partitioned_path)
+        months = db.enable_partitioning()
+        db.connection().execute('VACUUM')
+        db.close()
+
+        results = {}
+        for name, path in (('plain', db_path), ('partitioned', partitioned_path)):
+            db = WiFiSpeedDB(path)
+            start = time.perf_counter()
+            deleted, _ = db.cleanup_old_data(days_to_keep=args.keep)
+            elapsed = time.perf_counter() - start
+            remaining = db.connection().execute('SELECT COUNT(*), MIN(timestamp) FROM speed_tests').fetchone()
+            db.close()
+            results[name] = (elapsed, deleted, remaining)
+
+    print(f"\n🗑️  Retention of {args.keep} days over {args.rows:,} rows ({months} months)")
+    print("=" * 60)
+    for name, (elapsed, deleted, remaining) in results.items():
+        print(f"{name:<12} {elapsed:8.2f} s   deleted {deleted:,}, kept {remaining[0]:,}")
+    print(f"Speedup:        {results['plain'][0] / results['partitioned'][0]:.1f}x")
+    print(f"Same rows kept: {'yes' if results['plain'][2] == results['partitioned'][2] else 'NO'}")
+
+
+def bench_reclaim(args):
+    """Longest write-lock hold: full VACUUM versus bounded incremental_vacuum steps"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        print(f"🏗️  Populating {args.rows:,} rows...")
+        populate(db_path, args.rows)
+        db = WiFiSpeedDB(db_path)
+        cutoff = (date.today() - timedelta(days=args.keep)).isoformat()
+        with db.transaction() as conn:
+            conn.execute('DELETE FROM speed_tests WHERE timestamp < ?', (cutoff,))
+        free_pages = db.connection().execute('PRAGMA freelist_count').fetchone()[0]
+        db.checkpoint('TRUNCATE')
+        db.close()
+        vacuum_path = os.path.join(tmp, "vacuum.db")
+        shutil.copyfile(db_path, vacuum_path)
+
+        db = WiFiSpeedDB(vacuum_path)
+        start = time.perf_counter()
+        db.vacuum()
+        vacuum_time = time.perf_counter() - start
+        db.close()
+
+        db = WiFiSpeedDB(db_path)
+        step_times = []
+        while True:
+            start = time.perf_counter()
+            freed = db.reclaim_space(pages_per_step=args.pages, max_steps=1)
+            if not freed:
+                break
+            step_times.append(time.perf_counter() - start)
+        db.close()
+
+    print(f"\n🗜️  Reclaiming {free_pages:,} free pages ({args.rows:,} rows, kept {args.keep} days)")
+    print("=" * 60)
+    print(f"Full VACUUM:        {vacuum_time * 1000:8.1f} ms in one lock")
+    print(f"Incremental steps:  {len(step_times)} x {args.pages} pages")
+    print(f"  longest step:     {max(step_times, default=0) * 1000:8.1f} ms")
+    print(f"  total:            {sum(step_times) * 1000:8.1f} ms")
+
+
+def bench_weekly(args):
+    """Grouped weekly rollup, checked week-by-week against create_weekly_summary"""
+    rng = random.Random(42)
+    today = date.today()
+    rows = []
+    for i in range(1, args.days + 1):
+        samples = rng.choice([0, 48, 144])
+        status = rng.choice(['good', 'meh', 'bad']) if samples else 'no_data'
+        rows.append(((today - timedelta(days=i)).isoformat(), samples, rng.uniform(200, 950),
+                     rng.uniform(20, 110), rng.uniform(5, 80), rng.uniform(0, 40), status, datetime.now()))
+
+    columns = ('week_start, week_end, days_with_data, total_samples, ROUND(avg_download_mbps, 6), '
+               'ROUND(avg_upload_mbps, 6), ROUND(avg_ping_ms, 6), ROUND(weekly_pct_bad, 6), '
+               'good_days, meh_days, bad_days, no_data_days, status')
+    print(f"\n📅 Weekly rollup of {args.days:,} daily summaries")
+    print("=" * 60)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        reference_path = os.path.join(tmp, "reference.db")
+        db = WiFiSpeedDB(db_path)
+        with db.transaction() as conn:
+            conn.executemany('''
+                INSERT INTO daily_summary
+                (day, sample_count, median_download_mbps, median_upload_mbps,
+                 p95_ping_ms, pct_bad, status, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+        db.checkpoint('TRUNCATE')
+        shutil.copy(db_path, reference_path)
+
+        start = time.perf_counter()
+        archived_weeks, deleted_days = db.archive_daily_to_weekly(weeks_to_keep=args.keep)
+        elapsed = time.perf_counter() - start
+        weekly = db.connection().execute(f'SELECT {columns} FROM weekly_summary ORDER BY week_start').fetchall()
+        db.close()
+
+        reference = WiFiSpeedDB(reference_path)
+        for row in weekly:
+            reference.create_weekly_summary(date.fromisoformat(row[0]))
+        expected = reference.connection().execute(
+            f'SELECT {columns} FROM weekly_summary ORDER BY week_start').fetchall()
+        reference.close()
+
+    print(f"Weeks archived:  {archived_weeks:,}")
+    print(f"Days deleted:    {deleted_days:,}")
+    print(f"Rollup time:     {elapsed * 1000:.1f} ms")
+    print(f"Matches create_weekly_summary: {'✅' if weekly == expected else '❌'}")
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _writer_process(db_path, journal_mode, stop, writes, write_errors):
+    """Cron-style writer: monitor cycles back to back until told to stop"""
+    db = WiFiSpeedDB(db_path, journal_mode=journal_mode)
+    while not stop.is_set():
+        try:
+            run_monitor_cycle(db)
+            writes.value += 1
+        except sqlite3.OperationalError:
+            write_errors.value += 1
+    db.close()
+
+
+def measure_reader_latency(db_path, journal_mode, seconds):
+    """Time viewer-style reads while a writer process commits"""
+    stop = multiprocessing.Event()
+    writes = multiprocessing.Value('i', 0)
+    write_errors = multiprocessing.Value('i', 0)
+    errors = []
+
+    reader_db = WiFiSpeedDB(db_path, journal_mode=journal_mode)
+    writer = multiprocessing.Process(target=_writer_process,
+                                     args=(db_path, journal_mode, stop, writes, write_errors))
+    writer.start()
+    latencies = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            reader_db.get_speed_test_with_plan_comparison(10)
+            reader_db.get_daily_summaries(14)
+            latencies.append((time.perf_counter() - start) * 1000)
+        except sqlite3.OperationalError as e:
+            errors.append(str(e))
+    stop.set()
+    writer.join()
+    reader_db.close()
+    return latencies, writes.value, len(errors) + write_errors.value
+
+
+def bench_concurrency(args):
+    """Reader latency under a concurrent writer, rollback journal vs WAL"""
+    print(f"\n📖 Reader latency while a writer runs ({args.seconds}s each, {args.rows:,} rows)")
+    print("=" * 78)
+    print(f"{'Journal':<10} {'Reads':<8} {'p50 (ms)':<10} {'p99 (ms)':<10} {'Max (ms)':<10} {'Writes':<8} {'Errors':<8}")
+    print("-" * 78)
+    for journal_mode in ('DELETE', 'WAL'):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "bench.db")
+            populate(db_path, args.rows)
+            latencies, writes, errors = measure_reader_latency(db_path, journal_mode, args.seconds)
+        p50 = percentile(latencies, 50) if latencies else 0
+        p99 = percentile(latencies, 99) if latencies else 0
+        worst = max(latencies) if latencies else 0
+        print(f"{journal_mode:<10} {len(latencies):<8} {p50:<10.2f} {p99:<10.2f} {worst:<10.2f} {writes:<8} {errors:<8}")
+
+
+def bench_records(args):
+    """Memory and load time of speed_tests rows as tuples, dicts, sqlite3.Row and slotted records"""
+    columns = ", ".join(SpeedTestResult.fields())
+    factories = {
+        'tuple': None,
+        'dict': lambda cursor, row: dict(zip(SpeedTestResult.fields(), row)),
+        'sqlite3.Row': sqlite3.Row,
+        'SpeedTestResult': SpeedTestResult.from_row,
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        populate(db_path, args.rows)
+        conn = sqlite3.connect(db_path)
+
+        def load(factory):
+            conn.row_factory = factory
+            return conn.execute(f'SELECT {columns} FROM speed_tests').fetchall()
+
+        print(f"\n🧱 Loading {args.rows:,} speed tests")
+        print("=" * 60)
+        print(f"{'Row type':<18} {'Bytes/row':<12} {'Peak (MB)':<12} {'Load (s)':<10}")
+        print("-" * 60)
+        for name, factory in factories.items():
+            # Timed without tracemalloc, which slows every allocation
+            start = time.perf_counter()
+            rows = load(factory)
+            elapsed = time.perf_counter() - start
+            del rows
+            tracemalloc.start()
+            rows = load(factory)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            del rows
+            print(f"{name:<18} {peak / args.rows:<12.0f} {peak / 1e6:<12.1f} {elapsed:<10.2f}")
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the wifi storage layer on synthetic data')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    connections = subparsers.add_parser('connections', help='Connection reuse per monitor cycle')
+    connections.add_argument('--rows', type=int, default=1_000_000, help='Synthetic rows (default: 1,000,000)')
+    connections.add_argument('--cycles', type=int, default=10, help='Monitor cycles to run (default: 10)')
+    connections.set_defaults(func=bench_connections)
+
+    ingest = subparsers.add_parser('ingest', help='Single-row versus bulk inserts')
+    ingest.add_argument('--rows', type=int, default=20_000, help='Rows to insert (default: 20,000)')
+    ingest.add_argument('--chunk-size', type=int, default=500, help='Bulk chunk size (default: 500)')
+    ingest.set_defaults(func=bench_ingest)
+
+    summaries = subparsers.add_parser('summaries', help='Sketch summary accuracy and per-insert cost')
+    summaries.add_argument('--days', type=int, default=7, help='Days of 1-minute samples (default: 7)')
+    summaries.add_argument('--inserts', type=int, default=200, help='Timed inserts (default: 200)')
+    summaries.set_defaults(func=bench_summaries)
+
+    startup = subparsers.add_parser('startup', help='Cold construction cost of WiFiSpeedDB')
+    startup.add_argument('--runs', type=int, default=200, help='Constructions to time (default: 200)')
+    startup.set_defaults(func=bench_startup)
+
+    daemon = subparsers.add_parser('daemon', help='Cron cold start versus warm daemon cycles')
+    daemon.add_argument('--rows', type=int, default=100_000, help='Synthetic rows (default: 100,000)')
+    daemon.add_argument('--cycles', type=int, default=20, help='Cycles to run (default: 20)')
+    daemon.add_argument('--interval', type=float, default=0.2, help='Daemon tick interval in seconds (default: 0.2)')
+    daemon.set_defaults(func=bench_daemon)
+
+    engines = subparsers.add_parser('engines', help='HTTP backend throughput and CPU cost on loopback')
+    engines.add_argument('--bandwidth', type=float, nargs='*', default=[100, 1000, 10000],
+                         help='Shaped rates to test in Mbps, plus one unshaped run (default: 100 1000 10000)')
+    engines.add_argument('--seconds', type=float, default=2, help='Approximate seconds per direction (default: 2)')
+    engines.add_argument('--streams', type=int, default=4, help='Parallel streams (default: 4)')
+    engines.set_defaults(func=bench_engines)
+
+    pipeline = subparsers.add_parser('pipeline', help='Sequential versus pipelined run_speed_test stages')
+    pipeline.add_argument('--rows', type=int, default=100_000, help='Synthetic rows (default: 100,000)')
+    pipeline.add_argument('--cycles', type=int, default=5, help='Cycles per mode (default: 5)')
+    pipeline.add_argument('--scan', type=float, default=1.0, help='Simulated device scan seconds (default: 1.0)')
+    pipeline.add_argument('--latency', type=float, default=200,
+                          help='Server latency in ms; selection makes 3 round trips (default: 200)')
+    pipeline.add_argument('--bandwidth', type=float, default=100, help='Shaped server rate in Mbps (default: 100)')
+    pipeline.add_argument('--seconds', type=float, default=0.5, help='Approximate seconds per direction (default: 0.5)')
+    pipeline.set_defaults(func=bench_pipeline)
+
+    fanout = subparsers.add_parser('fanout', help='Single-server versus median-of-servers results')
+    fanout.add_argument('--servers', type=int, default=5, help='Loopback servers (default: 5)')
+    fanout.add_argument('--latency', type=float, default=20, help='Healthy server latency in ms (default: 20)')
+    fanout.add_argument('--bandwidth', type=float, default=200, help='Healthy server rate in Mbps (default: 200)')
+    fanout.add_argument('--bad-latency', type=float, default=150, help='Degraded server latency in ms (default: 150)')
+    fanout.add_argument('--bad-bandwidth', type=float, default=20, help='Degraded server rate in Mbps (default: 20)')
+    fanout.add_argument('--bytes', type=int, default=2_000_000, help='Short download per server (default: 2,000,000)')
+    fanout.add_argument('--budget', type=float, default=5, help='Seconds allowed per server (default: 5)')
+    fanout.set_defaults(func=bench_fanout)
+
+    sweep = subparsers.add_parser('sweep', help='Thread-pool versus asyncio device sweep of a simulated subnet')
+    sweep.add_argument('--network', default='192.168.1.0/24', help='Subnet to simulate (default: 192.168.1.0/24)')
+    sweep.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                       help=f'Sweeper probes per second, 0 for no limit (default: {DEFAULT_RATE})')
+    sweep.add_argument('--live', type=int, default=20, help='Addresses that answer (default: 20)')
+    sweep.add_argument('--latency', type=float, default=5, help='Reply latency in ms (default: 5)')
+    sweep.add_argument('--timeout', type=float, default=1.0, help='Probe timeout in seconds (default: 1.0)')
+    sweep.add_argument('--workers', type=int, default=15, help='Thread pool size, as the old scan used (default: 15)')
+    sweep.set_defaults(func=bench_sweep)
+
+    sampler = subparsers.add_parser('sampler', help='Latency sampler CPU and storage cost')
+    sampler.add_argument('--host', default='127.0.0.1', help='Address to sample (default: 127.0.0.1)')
+    sampler.add_argument('--hz', type=float, default=10, help='Samples per second (default: 10)')
+    sampler.add_argument('--seconds', type=float, default=20, help='How long to sample (default: 20)')
+    sampler.add_argument('--flush', type=float, default=5, help='Flush interval in seconds (default: 5)')
+    sampler.set_defaults(func=bench_sampler)
+
+    archive = subparsers.add_parser('archive', help='Single-pass archival versus the per-day loop')
+    archive.add_argument('--rows', type=int, default=2_000_000, help='Synthetic rows (default: 2,000,000)')
+    archive.add_argument('--keep', type=int, default=30, help='Days to keep (default: 30)')
+    archive.add_argument('--skip-legacy', action='store_true', help='Only time the single-pass archival')
+    archive.set_defaults(func=bench_archive)
+
+    retention = subparsers.add_parser('retention', help='Row deletes versus dropping partitions')
+    retention.add_argument('--rows', type=int, default=1_000_000, help='Synthetic 1-minute rows (default: 1,000,000)')
+    retention.add_argument('--keep', type=int, default=600, help='Days of speed tests to keep (default: 600)')
+    retention.set_defaults(func=bench_retention)
+
+    reclaim = subparsers.add_parser('reclaim', help='Full VACUUM versus bounded incremental_vacuum steps')
+    reclaim.add_argument('--rows', type=int, default=1_000_000, help='Synthetic 1-minute rows (default: 1,000,000)')
+    reclaim.add_argument('--keep', type=int, default=365, help='Days of speed tests to keep (default: 365)')
+    reclaim.add_argument('--pages', type=int, default=256, help='Pages per step (default: 256)')
+    reclaim.set_defaults(func=bench_reclaim)
+
+    weekly = subparsers.add_parser('weekly', help='Grouped weekly rollup of daily summaries')
+    weekly.add_argument('--days', type=int, default=3650, help='Daily summaries to roll up (default: 3,650)')
+    weekly.add_argument('--keep', type=int, default=4, help='Weeks of daily summaries to keep (default: 4)')
+    weekly.set_defaults(func=bench_weekly)
+
+    concurrency = subparsers.add_parser('concurrency', help='Reader latency while a writer commits')
+    concurrency.add_argument('--rows', type=int, default=100_000, help='Synthetic rows (default: 100,000)')
+    concurrency.add_argument('--seconds', type=float, default=5, help='Duration per journal mode (default: 5)')
+    concurrency.set_defaults(func=bench_concurrency)
+
+    records = subparsers.add_parser('records', help='Memory per row: tuples, dicts, sqlite3.Row and slotted records')
+    records.add_argument('--rows', type=int, default=1_000_000, help='Synthetic rows (default: 1,000,000)')
+    records.set_defaults(func=bench_records)
+
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,16 @@
 #!/usr/bin/env python3
 import argparse
 import sys
-from database import WiFiSpeedDB
+from datetime import datetime, timedelta
+from database import WiFiSpeedDB, percentile
+
+# Display order for --phases: the run's phases, then the timed save steps
+PHASE_ORDER = ['probe', 'scan', 'select', 'fanout', 'download', 'upload', 'save', 'insert',
+               'summaries', 'placeholders', 'checkpoint', 'reclaim', 'maintenance', 'total']
 
 class DataCleanup:
-    def __init__(self):
-        self.db = WiFiSpeedDB()
+    def __init__(self, db=None):
+        self.db = db or WiFiSpeedDB()
     
     def show_storage_stats(self):
         """Display current database storage statistics"""
@@ -17,12 +22,24 @@ class DataCleanup:
         print(f"💾 Database size: {stats['db_size_kb']} KB")
         print(f"🔢 Speed tests: {stats['speed_tests_count']:,} records")
         print(f"📅 Daily summaries: {stats['daily_summaries_count']} records")
+        if stats['partitions']:
+            print(f"🗂️ Partitions: {stats['partitions']} monthly tables")
         
         if stats['date_range'][0]:
             print(f"📆 Data range: {stats['date_range'][0]} to {stats['date_range'][1]}")
         else:
             print("📆 No data found")
         
+        runs = self.db.get_monitor_run_stats(datetime.now() - timedelta(days=7))
+        if len(runs) > 1:
+            print(f"\n🏃 Monitor runs (7 days):")
+            print(f"   Completed: {runs.get('ok', 0)}, partial: {runs.get('partial', 0)}, "
+                  f"timed out: {runs.get('timeout', 0)}, failed: {runs.get('failed', 0)}")
+            print(f"   Overlapping ticks: {runs.get('overlap', 0)}, skipped ticks: {runs.get('skipped', 0)}")
+            if runs['timeouts']:
+                phases = ", ".join(f"{phase} {count}" for phase, count in sorted(runs['timeouts'].items()))
+                print(f"   Deadlines missed by phase: {phases}")
+        
         print(f"\n⚙️ Retention Policy:")
         print(f"   Speed tests: {speed_tests_days} days")
         print(f"   Daily summaries: {summaries_days} days")
@@ -30,7 +47,7 @@ class DataCleanup:
         # Estimate data growth
         if stats['speed_tests_count'] > 0:
             # Get monitoring interval
-            interval_minutes = int(self.db.get_config('monitoring_interval', '10'))
+            interval_minutes = max(self.db.get_config_number('monitoring_interval', 10, int), 1)
             tests_per_day = 1440 / interval_minutes
             estimated_growth_per_day = tests_per_day
             
@@ -55,13 +72,10 @@ class DataCleanup:
             from datetime import date, timedelta
             cutoff_date = date.today() - timedelta(days=days_to_keep)
             
-            import sqlite3
-            conn = sqlite3.connect(self.db.db_path)
-            cursor = conn.cursor()
-            cursor.execute('SELECT COUNT(*) FROM speed_tests WHERE DATE(timestamp) < ?', 
+            cursor = self.db.connection().cursor()
+            cursor.execute('SELECT COUNT(*) FROM speed_tests WHERE timestamp < ?', 
                           (cutoff_date.isoformat(),))
             would_delete = cursor.fetchone()[0]
-            conn.close()
             
             print(f"📋 Would delete: {would_delete:,} speed test records")
             return would_delete
@@ -81,23 +95,19 @@ class DataCleanup:
             from datetime import date, timedelta
             cutoff_date = date.today() - timedelta(days=days_to_keep)
             
-            import sqlite3
-            conn = sqlite3.connect(self.db.db_path)
-            cursor = conn.cursor()
+            cursor = self.db.connection().cursor()
             
             cursor.execute('''
                 SELECT COUNT(*) FROM speed_tests 
-                WHERE DATE(timestamp) < ?
+                WHERE timestamp < ?
                 AND DATE(timestamp) NOT IN (SELECT day FROM daily_summary)
             ''', (cutoff_date.isoformat(),))
             would_archive = cursor.fetchone()[0]
             
-            cursor.execute('SELECT COUNT(DISTINCT DATE(timestamp)) FROM speed_tests WHERE DATE(timestamp) < ?', 
+            cursor.execute('SELECT COUNT(DISTINCT DATE(timestamp)) FROM speed_tests WHERE timestamp < ?', 
                           (cutoff_date.isoformat(),))
             days_affected = cursor.fetchone()[0]
             
-            conn.close()
-            
             print(f"📋 Would archive: {would_archive:,} records")
             print(f"📅 Days affected: {days_affected}")
             return would_archive
@@ -107,6 +117,38 @@ class DataCleanup:
             print(f"📝 Created: {summaries_created} daily summaries")
             return deleted_count
     
+    def show_phase_stats(self, since=None, until=None):
+        """Phase duration, CPU and peak RSS percentiles for runs in [since, until)"""
+        since = since or datetime.now() - timedelta(days=7)
+        until = until or datetime.now() + timedelta(minutes=1)
+        phases = {}
+        for phase, duration_ms, cpu_ms, peak_rss_kb, status in self.db.get_run_phases(since, until):
+            phases.setdefault(phase, []).append((duration_ms, cpu_ms, peak_rss_kb, status))
+        
+        print(f"⏱️ Run phases, {since:%Y-%m-%d %H:%M} to {until:%Y-%m-%d %H:%M}")
+        if not phases:
+            print("📆 No runs recorded in this window")
+            return phases
+        print("=" * 92)
+        print(f"{'Phase':<13} {'Runs':>6} {'p50':>9} {'p90':>9} {'p99':>9} {'Max':>9} "
+              f"{'CPU p50':>9} {'Peak RSS':>10} {'Timeouts':>9}")
+        print("-" * 92)
+        # Run order first, then anything else alphabetically
+        ordered = sorted(phases, key=lambda phase: (PHASE_ORDER.index(phase) if phase in PHASE_ORDER
+                                                     else len(PHASE_ORDER), phase))
+        for phase in ordered:
+            rows = phases[phase]
+            durations = [row[0] for row in rows]
+            cpu = [row[1] for row in rows if row[1] is not None]
+            peak_rss = max((row[2] for row in rows if row[2] is not None), default=0)
+            timeouts = sum(row[3] == 'timeout' for row in rows)
+            print(f"{phase:<13} {len(rows):>6} {percentile(durations, 50):>6.0f} ms {percentile(durations, 90):>6.0f} ms "
+                  f"{percentile(durations, 99):>6.0f} ms {max(durations):>6.0f} ms "
+                  f"{percentile(cpu, 50):>6.0f} ms {peak_rss / 1024:>7.1f} MB {timeouts:>9}")
+        print("\n💡 Save steps (insert, summaries, placeholders) run inside 'save'; 'total' is the whole run")
+        print("💡 CPU is the phase's own thread; for 'total' it is the whole process")
+        return phases
+    
     def set_retention_policy(self, speed_tests_days, summaries_days, weekly_weeks=52):
         """Set data retention policies"""
         self.db.set_retention_policy(speed_tests_days, summaries_days)
@@ -116,10 +158,41 @@ class DataCleanup:
         print(f"   Daily summaries: {summaries_days} days")
         print(f"   Weekly summaries: {weekly_weeks} weeks")
     
+    def enable_partitioning(self):
+        """Convert speed_tests to monthly partitions"""
+        if self.db.is_partitioned():
+            print("🗂️ Speed tests are already partitioned by month")
+            return 0
+        print("🗂️ Moving speed tests into monthly partitions...")
+        created = self.db.enable_partitioning()
+        print(f"✅ Created {created} monthly partitions")
+        print("💡 The old table's pages are reclaimed gradually; use --vacuum to shrink the file now")
+        return created
+    
+    def reclaim_space(self):
+        """Return free pages to the filesystem in bounded steps"""
+        page_size = self.db.connection().execute('PRAGMA page_size').fetchone()[0]
+        freed = self.db.reclaim_space()
+        for step, pages in enumerate(freed, 1):
+            print(f"   Step {step}: freed {pages:,} pages ({pages * page_size // 1024:,} KB)")
+        remaining = self.db.connection().execute('PRAGMA freelist_count').fetchone()[0]
+        if remaining:
+            print(f"   {remaining:,} free pages left for the next run")
+        elif not freed:
+            print("   No free pages to reclaim")
+        return sum(freed)
+    
+    def vacuum(self):
+        """Full VACUUM (rewrites the whole database, blocking the monitor)"""
+        stats = self.db.get_database_stats()
+        print(f"🗜️ Running full VACUUM on {stats['db_size_kb']:,} KB...")
+        self.db.vacuum()
+        print(f"✅ Database size: {self.db.get_database_stats()['db_size_kb']:,} KB")
+    
     def auto_cleanup(self):
         """Perform automatic 3-tier cleanup: Speed tests -> Daily -> Weekly"""
         speed_tests_days, summaries_days = self.db.get_retention_policy()
-        weekly_weeks = int(self.db.get_config('retention_weekly_weeks', '52'))
+        weekly_weeks = self.db.get_config_number('retention_weekly_weeks', 52, int)
         
         print("🤖 3-Tier automatic cleanup starting...")
         
@@ -139,41 +212,41 @@ class DataCleanup:
             from datetime import date, timedelta
             cutoff_date = date.today() - timedelta(weeks=weekly_weeks)
             
-            import sqlite3
-            conn = sqlite3.connect(self.db.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('DELETE FROM weekly_summary WHERE week_start < ?', (cutoff_date.isoformat(),))
-            deleted_weekly = cursor.rowcount
-            
-            # Also cleanup any remaining old daily summaries beyond policy
-            if summaries_days < 9999:
-                cutoff_date = date.today() - timedelta(days=summaries_days)
-                cursor.execute('DELETE FROM daily_summary WHERE day < ?', (cutoff_date.isoformat(),))
-                deleted_daily = cursor.rowcount
-            else:
-                deleted_daily = 0
-            
-            conn.commit()
-            conn.close()
+            with self.db.transaction() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('DELETE FROM weekly_summary WHERE week_start < ?', (cutoff_date.isoformat(),))
+                deleted_weekly = cursor.rowcount
+                
+                # Also cleanup any remaining old daily summaries beyond policy
+                if summaries_days < 9999:
+                    cutoff_date = date.today() - timedelta(days=summaries_days)
+                    cursor.execute('DELETE FROM daily_summary WHERE day < ?', (cutoff_date.isoformat(),))
+                    deleted_daily = cursor.rowcount
+                else:
+                    deleted_daily = 0
             
             if deleted_weekly > 0:
                 print(f"✅ Deleted: {deleted_weekly} old weekly summaries")
             if deleted_daily > 0:
                 print(f"✅ Deleted: {deleted_daily} old daily summaries")
         
-        # Vacuum database to reclaim space
-        print("\n🗜️ Optimizing database...")
-        import sqlite3
-        conn = sqlite3.connect(self.db.db_path)
-        conn.execute('VACUUM')
-        conn.close()
+        # Reclaim free space in bounded steps (full VACUUM is --vacuum only)
+        print("\n🗜️ Reclaiming free space...")
+        self.reclaim_space()
+        self.db.checkpoint('TRUNCATE')
         
         print("✅ 3-tier automatic cleanup completed")
 
 def main():
     parser = argparse.ArgumentParser(description='Manage WiFi monitoring data cleanup')
     parser.add_argument('--stats', action='store_true', help='Show storage statistics')
+    parser.add_argument('--phases', action='store_true',
+                        help='Show run phase timing percentiles (default window: last 7 days)')
+    parser.add_argument('--since', type=datetime.fromisoformat, metavar='WHEN',
+                        help='With --phases, start of the window (e.g. 2024-05-01 or "2024-05-01 08:00")')
+    parser.add_argument('--until', type=datetime.fromisoformat, metavar='WHEN',
+                        help='With --phases, end of the window (default: now)')
     parser.add_argument('--cleanup', type=int, metavar='DAYS', 
                         help='Delete speed tests older than N days')
     parser.add_argument('--archive', type=int, metavar='DAYS',
@@ -182,6 +255,10 @@ def main():
                         help='Run automatic cleanup based on retention policy')
     parser.add_argument('--set-retention', nargs=2, type=int, metavar=('SPEED_DAYS', 'SUMMARY_DAYS'),
                         help='Set retention policy (speed_tests_days summary_days)')
+    parser.add_argument('--partition', action='store_true',
+                        help='Store speed tests in monthly partitions (retention drops whole months)')
+    parser.add_argument('--vacuum', action='store_true',
+                        help='Run a full VACUUM (rewrites the database; blocks monitoring meanwhile)')
     parser.add_argument('--dry-run', action='store_true',
                         help='Show what would be done without making changes')
     
@@ -191,6 +268,8 @@ def main():
     
     if args.stats:
         cleanup.show_storage_stats()
+    elif args.phases:
+        cleanup.show_phase_stats(args.since, args.until)
     elif args.cleanup:
         cleanup.cleanup_old_data(args.cleanup, args.dry_run)
     elif args.archive:
@@ -204,6 +283,10 @@ def main():
             cleanup.auto_cleanup()
     elif args.set_retention:
         cleanup.set_retention_policy(args.set_retention[0], args.set_retention[1])
+    elif args.partition:
+        cleanup.enable_partitioning()
+    elif args.vacuum:
+        cleanup.vacuum()
     else:
         # Default: show stats
         cleanup.show_storage_stats()
@@ -212,6 +295,9 @@ def main():
         print(f"   python3 cleanup.py --archive 90        # Archive tests > 90 days old")
         print(f"   python3 cleanup.py --auto              # Automatic cleanup")
         print(f"   python3 cleanup.py --set-retention 30 365  # Keep tests 30d, summaries 1y")
+        print(f"   python3 cleanup.py --partition         # Monthly partitions")
+        print(f"   python3 cleanup.py --vacuum            # Full VACUUM (blocks monitoring)")
+        print(f"   python3 cleanup.py --phases --since 2024-05-01  # Run phase percentiles")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
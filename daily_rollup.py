@@ -2,7 +2,7 @@
 import statistics
 import argparse
 from datetime import datetime, date, timedelta
-from database import WiFiSpeedDB
+from database import WiFiSpeedDB, bad_percentage
 import logging
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -100,13 +100,17 @@ class DailyRollup:
         p95_ping = self.calculate_percentile(pings, 95)
         avg_device_count = statistics.mean(device_counts) if device_counts else None
         
-        # Calculate percentage of "bad" samples
-        bad_samples = 0
-        for download, upload, ping, _ in daily_data:
-            if self.is_bad_sample(download, upload, ping, plan_download, plan_upload):
-                bad_samples += 1
-        
-        pct_bad = (bad_samples / sample_count) * 100
+        # Calculate percentage of "bad" samples (departure-triggered tests
+        # are left out, see bad_percentage)
+        bad_samples = departures = departures_bad = 0
+        for download, upload, ping, _, tier in daily_data:
+            bad = self.is_bad_sample(download, upload, ping, plan_download, plan_upload)
+            bad_samples += bad
+            if tier == 'departure':
+                departures += 1
+                departures_bad += bad
+        
+        pct_bad = bad_percentage(sample_count, bad_samples, departures, departures_bad)
         status = self.get_daily_status(pct_bad)
         
         # Log summary
@@ -115,7 +119,8 @@ class DailyRollup:
         logging.info(f"  Median download: {median_download:.1f} Mbps")
         logging.info(f"  Median upload: {median_upload:.1f} Mbps")
         logging.info(f"  95th percentile ping: {p95_ping:.1f} ms")
-        logging.info(f"  Bad samples: {bad_samples}/{sample_count} ({pct_bad:.1f}%)")
+        logging.info(f"  Bad samples: {bad_samples}/{sample_count}, {pct_bad:.1f}% "
+                     f"({departures} departure tests left out of the rate)")
         logging.info(f"  Status: {status}")
         logging.info(f"  Avg devices: {avg_device_count:.1f}" if avg_device_count else "  Avg devices: N/A")
         
@@ -128,7 +133,8 @@ class DailyRollup:
             p95_ping=p95_ping,
             pct_bad=pct_bad,
             avg_device_count=avg_device_count,
-            status=status
+            status=status,
+            departure_tests=departures
         )
         
         logging.info(f"Daily summary saved for {target_date}")
@@ -146,7 +152,7 @@ class DailyRollup:
         # Get existing summaries
         summaries = self.db.get_daily_summaries(days_back)
         for summary in summaries:
-            existing_summaries.add(summary[0])  # day column
+            existing_summaries.add(summary.day)
         
         # Check each day and compute if missing
         for i in range(1, days_back + 1):
@@ -1,123 +1,803 @@
 import sqlite3
-from datetime import datetime
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from itertools import groupby, islice
+from operator import itemgetter
+import partitions
+from migrations import CONNECTION_MIGRATIONS, MIGRATIONS, SCHEMA_VERSION
+from quantile_sketch import QuantileSketch
+from records import DailySummary, SpeedTestComparison, SpeedTestResult, WeeklySummary
+
+# Per-connection tuning applied by ConnectionManager. cache_size is in KiB when
+# negative (SQLite convention); mmap_size is in bytes.
+DEFAULT_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'cache_size': -8000,
+    'mmap_size': 64 * 1024 * 1024,
+}
+
+# Journal mode set when a database is first created or migrated
+DEFAULT_JOURNAL_MODE = 'WAL'
+
+# Bounded space reclamation: pages freed per incremental_vacuum step and steps
+# per reclaim_space call (1 MiB and 8 MiB with the default 4 KiB pages)
+RECLAIM_PAGES_PER_STEP = 256
+RECLAIM_MAX_STEPS = 8
+
+# Columns written by insert_speed_test and insert_speed_tests_bulk
+SPEED_TEST_COLUMNS = ('timestamp', 'download_speed', 'upload_speed', 'ping',
+                      'server_name', 'server_location', 'device_count', 'tier',
+                      'device_count_age_seconds')
+
+# Sunday that starts the week containing `day`; matches get_week_start_end
+WEEK_START_SQL = "DATE(day, '-' || STRFTIME('%w', day) || ' days')"
+
+
+def percentile(data, pct):
+    """
+    Exact percentile of a list of numbers, interpolating linearly between
+    the two nearest ranks (0.0 for no data).
+    """
+    if not data:
+        return 0.0
+    sorted_data = sorted(data)
+    index = (pct / 100.0) * (len(sorted_data) - 1)
+    lower = sorted_data[int(index)]
+    if index.is_integer():
+        return lower
+    upper = sorted_data[int(index) + 1]
+    return lower + (upper - lower) * (index - int(index))
+
+
+def bad_percentage(sample_count, bad_count, departures=0, departures_bad=0):
+    """
+    Percentage of a day's samples that were bad, leaving out the full tests a
+    probe departure triggered (tier 'departure'): they run because the link
+    already looked bad, so counting them would inflate the day's rate. A day
+    whose only tests are departure tests is rated on those.
+    """
+    scheduled = sample_count - departures
+    if scheduled > 0:
+        return (bad_count - departures_bad) / scheduled * 100
+    return bad_count / sample_count * 100 if sample_count else 0.0
+
+
+def day_bounds(day):
+    """
+    Half-open [start, end) timestamp bounds covering one calendar day.
+    Timestamps are stored as ISO text, so 'YYYY-MM-DD' compares below every
+    timestamp on that day and the range predicate can use the timestamp index.
+    """
+    if isinstance(day, str):
+        day = date.fromisoformat(day)
+    return day.isoformat(), (day + timedelta(days=1)).isoformat()
+
+
+class _Connection(sqlite3.Connection):
+    """sqlite3 connection that can hold per-connection caches"""
+    # The speed_tests layout, see partitions.is_partitioned
+    speed_tests_partitioned = None
+
+
+class ConnectionManager:
+    """
+    Keeps one SQLite connection open per thread instead of one per call.
+
+    Connections run in autocommit mode; writes go through transaction(), which
+    nests (inner levels become savepoints) so several WiFiSpeedDB calls can share
+    one connection and one commit. Prepared statements are cached per connection
+    by the sqlite3 module, sized by cached_statements. busy_timeout (ms) and
+    pragmas are applied to every connection as it is opened.
+    """
+    def __init__(self, db_path, cached_statements=256, busy_timeout=5000, pragmas=None):
+        self.db_path = db_path
+        self.cached_statements = cached_statements
+        self.busy_timeout = busy_timeout
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._open = {}  # id(conn) -> (conn, opened_at)
+        self.connections_opened = 0
+        self.checkouts = 0
+        self.transactions = 0
+        # Lifetime of connections already closed; stats() adds the open ones
+        self.closed_connection_seconds = 0.0
+        self.transaction_seconds = 0.0
+    
+    def connection(self):
+        """Return this thread's connection, opening it on first use"""
+        local = self._local
+        if getattr(local, 'generation', None) != self._generation:
+            self._open_connection()
+        if local.depth == 0:
+            with self._lock:
+                self.checkouts += 1
+        return local.conn
+    
+    def _open_connection(self):
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False,
+                               timeout=self.busy_timeout / 1000.0,
+                               cached_statements=self.cached_statements, factory=_Connection)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        with self._lock:
+            self._open[id(conn)] = (conn, time.monotonic())
+            self.connections_opened += 1
+            generation = self._generation
+        self._local.conn = conn
+        self._local.depth = 0
+        self._local.generation = generation
+        return conn
+    
+    @contextmanager
+    def transaction(self, immediate=False):
+        """
+        Run a block inside one transaction on this thread's connection.
+        The outermost level issues BEGIN/COMMIT (BEGIN IMMEDIATE when immediate
+        is set, taking the write lock up front); nested levels use savepoints.
+        Rolls back and re-raises on error.
+        """
+        conn = self.connection()
+        local = self._local
+        depth = local.depth
+        savepoint = f"sp_{depth}"
+        if depth == 0:
+            conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+            started = time.monotonic()
+        else:
+            conn.execute(f'SAVEPOINT {savepoint}')
+        local.depth = depth + 1
+        try:
+            yield conn
+        except BaseException:
+            local.depth = depth
+            if depth == 0:
+                conn.execute('ROLLBACK')
+                self._record_transaction(started)
+            else:
+                conn.execute(f'ROLLBACK TO {savepoint}')
+                conn.execute(f'RELEASE {savepoint}')
+            raise
+        local.depth = depth
+        if depth == 0:
+            conn.execute('COMMIT')
+            self._record_transaction(started)
+        else:
+            conn.execute(f'RELEASE {savepoint}')
+    
+    def _record_transaction(self, started):
+        with self._lock:
+            self.transactions += 1
+            self.transaction_seconds += time.monotonic() - started
+    
+    def release(self):
+        """Close this thread's connection, for threads that are about to end"""
+        local = self._local
+        conn = getattr(local, 'conn', None)
+        if conn is None or local.generation != self._generation:
+            return
+        with self._lock:
+            opened = self._open.pop(id(conn), None)
+            if opened:
+                self.closed_connection_seconds += time.monotonic() - opened[1]
+        conn.close()
+        local.conn = None
+        local.generation = None
+    
+    def close(self):
+        """Close every connection opened by this manager, in any thread"""
+        with self._lock:
+            now = time.monotonic()
+            for conn, opened_at in self._open.values():
+                conn.close()
+                self.closed_connection_seconds += now - opened_at
+            self._open.clear()
+            self._generation += 1
+    
+    def stats(self):
+        """
+        Connection usage counters.
+        'checkouts' is the number of top-level database calls served, i.e. the
+        number of connections the old connect-per-call code would have opened.
+        """
+        with self._lock:
+            now = time.monotonic()
+            open_seconds = sum(now - opened_at for _, opened_at in self._open.values())
+            return {
+                'connections_opened': self.connections_opened,
+                'connections_open': len(self._open),
+                'checkouts': self.checkouts,
+                'transactions': self.transactions,
+                'connection_seconds': self.closed_connection_seconds + open_seconds,
+                'transaction_seconds': self.transaction_seconds,
+            }
+
 
 class WiFiSpeedDB:
-    def __init__(self, db_path="wifi_speed.db"):
+    def __init__(self, db_path="wifi_speed.db", cached_statements=256, journal_mode=None,
+                 busy_timeout=5000, synchronous=None, cache_size=None, mmap_size=None):
+        """
+        New and migrated databases use WAL (DEFAULT_JOURNAL_MODE) so cron writers
+        and menu/viewer readers do not block each other; pass journal_mode to force
+        a mode on every construction. busy_timeout is in milliseconds; synchronous,
+        cache_size and mmap_size override DEFAULT_PRAGMAS when given.
+        """
         self.db_path = db_path
+        self.journal_mode = journal_mode
+        pragmas = dict(DEFAULT_PRAGMAS)
+        for name, value in (('synchronous', synchronous), ('cache_size', cache_size), ('mmap_size', mmap_size)):
+            if value is not None:
+                pragmas[name] = value
+        self.connections = ConnectionManager(db_path, cached_statements=cached_statements,
+                                             busy_timeout=busy_timeout, pragmas=pragmas)
         self.init_database()
     
+    def connection(self):
+        """Shared connection for the calling thread"""
+        return self.connections.connection()
+    
+    def transaction(self, immediate=False):
+        """Context manager grouping several calls into one commit"""
+        return self.connections.transaction(immediate=immediate)
+    
+    def connection_stats(self):
+        """Connection counts and hold times, see ConnectionManager.stats"""
+        return self.connections.stats()
+    
+    def close(self):
+        """Close all pooled connections"""
+        self.connections.close()
+    
+    def release_connection(self):
+        """Close the calling thread's connection (see ConnectionManager.release)"""
+        self.connections.release()
+    
+    def checkpoint(self, mode='PASSIVE'):
+        """
+        Checkpoint the WAL into the main database file.
+        PASSIVE never waits on readers or writers and is used on the write path;
+        TRUNCATE waits for them and resets the WAL file, and is used by both
+        cleanup paths (after reclaim_space) and by vacuum.
+        Returns (busy, wal_frames, checkpointed_frames).
+        """
+        return self.connection().execute(f'PRAGMA wal_checkpoint({mode})').fetchone()
+    
+    def reclaim_space(self, pages_per_step=RECLAIM_PAGES_PER_STEP, max_steps=RECLAIM_MAX_STEPS):
+        """
+        Return free pages to the filesystem with PRAGMA incremental_vacuum.
+        Each step is a short write transaction freeing at most pages_per_step
+        pages, so writers wait for one step, never for a whole VACUUM; pages
+        still free after max_steps are left for the next call.
+        Returns:
+            list: Pages freed by each step (empty if nothing was free).
+        """
+        conn = self.connection()
+        if conn.in_transaction:
+            # Each step commits itself, and would commit the caller's transaction first
+            raise sqlite3.ProgrammingError('reclaim_space cannot run inside a transaction')
+        freed = []
+        for _ in range(max_steps):
+            free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if free_pages == 0:
+                break
+            self._incremental_vacuum_step(conn, min(pages_per_step, free_pages))
+            step_freed = free_pages - conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if step_freed <= 0:
+                break
+            freed.append(step_freed)
+        if freed:
+            self.checkpoint('PASSIVE')
+        return freed
+    
+    def _incremental_vacuum_step(self, conn, pages):
+        """
+        Free up to pages pages in one short write transaction. The PRAGMA
+        frees one page each time it is stepped and returns no rows, so
+        execute() and fetchall() stop after the first page; executescript()
+        steps it to completion, freeing them all in a single call.
+        """
+        try:
+            conn.executescript(f'BEGIN IMMEDIATE; PRAGMA incremental_vacuum({int(pages)}); COMMIT;')
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+    
+    def vacuum(self):
+        """
+        Full VACUUM, then truncate the WAL it filled. Rewrites the whole file
+        and blocks writers meanwhile; only run on explicit request.
+        """
+        self.connection().execute('VACUUM')
+        self.checkpoint('TRUNCATE')
+    
     def init_database(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS speed_tests (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp DATETIME NOT NULL,
-                download_speed REAL NOT NULL,
-                upload_speed REAL NOT NULL,
-                ping REAL NOT NULL,
-                server_name TEXT,
-                server_location TEXT,
-                device_count INTEGER
-            )
-        ''')
-        
-        cursor.execute("PRAGMA table_info(speed_tests)")
-        columns = [column[1] for column in cursor.fetchall()]
-        if 'device_count' not in columns:
-            cursor.execute('ALTER TABLE speed_tests ADD COLUMN device_count INTEGER')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS plan_speeds (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                plan_name TEXT NOT NULL,
-                download_mbps REAL NOT NULL,
-                upload_mbps REAL NOT NULL,
-                created_date DATETIME NOT NULL,
-                is_active INTEGER DEFAULT 1
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS daily_summary (
-                day DATE PRIMARY KEY,
-                sample_count INTEGER NOT NULL,
-                median_download_mbps REAL NOT NULL,
-                median_upload_mbps REAL NOT NULL,
-                p95_ping_ms REAL NOT NULL,
-                pct_bad REAL NOT NULL,
-                avg_device_count REAL,
-                status TEXT CHECK(status IN ('good', 'meh', 'bad', 'no_data')),
-                created_at DATETIME NOT NULL
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS weekly_summary (
-                week_start DATE PRIMARY KEY,
-                week_end DATE NOT NULL,
-                days_with_data INTEGER NOT NULL,
-                total_samples INTEGER NOT NULL,
-                avg_download_mbps REAL NOT NULL,
-                avg_upload_mbps REAL NOT NULL,
-                avg_ping_ms REAL NOT NULL,
-                weekly_pct_bad REAL NOT NULL,
-                good_days INTEGER DEFAULT 0,
-                meh_days INTEGER DEFAULT 0,
-                bad_days INTEGER DEFAULT 0,
-                no_data_days INTEGER DEFAULT 0,
-                status TEXT CHECK(status IN ('excellent', 'good', 'poor', 'bad')),
-                created_at DATETIME NOT NULL
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        """
+        Bring the schema up to date. An up-to-date database costs a single
+        PRAGMA user_version read; pending migrations run once, in order, inside
+        one write-locked transaction, after any CONNECTION_MIGRATIONS.
+        """
+        conn = self.connection()
+        if self.journal_mode:
+            # journal_mode is persistent and cannot change inside a transaction
+            conn.execute(f'PRAGMA journal_mode = {self.journal_mode}')
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        if not self.journal_mode:
+            conn.execute(f'PRAGMA journal_mode = {DEFAULT_JOURNAL_MODE}')
+        for target, migrate in CONNECTION_MIGRATIONS:
+            if target > version:
+                migrate(conn)
+        with self.transaction(immediate=True) as conn:
+            # Another process may have migrated while we waited for the lock
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            cursor = conn.cursor()
+            for target, migrate in MIGRATIONS:
+                if target > version:
+                    migrate(cursor)
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
     
-    def insert_speed_test(self, download_speed, upload_speed, ping, server_name=None, server_location=None, device_count=None):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+    def insert_speed_test(self, download_speed, upload_speed, ping, server_name=None, server_location=None, device_count=None,
+                          timestamp=None, tier=None, device_count_age_seconds=None):
+        """
+        Insert one speed test and fold it into its day's aggregate; returns the new row id.
+        device_count_age_seconds is how old device_count was (0 for a scan made
+        by this run, more when a cached count was reused).
+        """
+        timestamp = timestamp or datetime.now()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+
+            ids = self._insert_speed_test_rows(cursor, [
+                (timestamp, download_speed, upload_speed, ping, server_name, server_location, device_count, tier,
+                 device_count_age_seconds)
+            ])
+            test_id = ids[0] if ids else cursor.execute('SELECT last_insert_rowid()').fetchone()[0]
+            
+            self._accumulate_daily(timestamp.date().isoformat(), download_speed, upload_speed, ping, device_count, tier)
+        return test_id
+    
+    def insert_speed_tests_bulk(self, results, chunk_size=500):
+        """
+        Insert many speed test results with explicit timestamps in one transaction.
+        results may be any iterable (including a generator) of SpeedTestResult
+        records, of dicts with the same keys, or of tuples in column order
+        (timestamp, download_speed, upload_speed, ping, server_name, server_location,
+        device_count, tier, device_count_age_seconds). Rows are streamed through executemany chunk_size at a time.
+        Affected days are marked in summary_dirty rather than recomputed; call
+        refresh_dirty_summaries() to rebuild them.
+        Returns:
+            tuple: (rows_inserted, days_marked)
+        """
+        rows = (self._speed_test_row(result) for result in results)
+        days = set()
+        inserted = 0
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    break
+                self._insert_speed_test_rows(cursor, chunk)
+                inserted += len(chunk)
+                days.update(str(row[0])[:10] for row in chunk)
+            self.mark_summaries_dirty(days)
+        return inserted, len(days)
+    
+    def _insert_speed_test_rows(self, cursor, rows):
+        """
+        Write SPEED_TEST_COLUMNS tuples to speed_tests or its month partitions.
+        Returns the allocated ids when partitioned, otherwise None.
+        """
+        if not partitions.is_partitioned(cursor):
+            try:
+                cursor.executemany(f'''
+                    INSERT INTO speed_tests ({', '.join(SPEED_TEST_COLUMNS)})
+                    VALUES ({', '.join('?' * len(SPEED_TEST_COLUMNS))})
+                ''', rows)
+                return None
+            except sqlite3.OperationalError:
+                # Another process may have partitioned since the layout was cached
+                if not partitions.is_partitioned(cursor, refresh=True):
+                    raise
+        return partitions.insert_rows(cursor, SPEED_TEST_COLUMNS, rows)
+    
+    def _delete_speed_tests_before(self, cursor, cutoff):
+        """
+        Delete speed tests older than cutoff; partitioned databases drop whole
+        months. Returns the number of rows removed.
+        """
+        if not partitions.is_partitioned(cursor):
+            try:
+                cursor.execute('DELETE FROM speed_tests WHERE timestamp < ?', (cutoff,))
+                return cursor.rowcount
+            except sqlite3.OperationalError:
+                if not partitions.is_partitioned(cursor, refresh=True):
+                    raise
+        return partitions.drop_before(cursor, cutoff)
+    
+    def is_partitioned(self):
+        """True when speed_tests is stored as monthly partitions"""
+        return partitions.is_partitioned(self.connection().cursor())
+    
+    def enable_partitioning(self):
+        """
+        Switch speed_tests to the monthly partition layout (see partitions).
+        Existing rows are moved in one transaction.
+        Returns:
+            int: Partitions created, or 0 if already partitioned.
+        """
+        with self.transaction(immediate=True) as conn:
+            return partitions.enable(conn.cursor())
+    
+    def _speed_test_row(self, result):
+        """Normalize one bulk-insert result to a speed_tests column tuple"""
+        if isinstance(result, SpeedTestResult):
+            return (result.timestamp, result.download_speed, result.upload_speed, result.ping,
+                    result.server_name, result.server_location, result.device_count, result.tier,
+                    result.device_count_age_seconds)
+        if isinstance(result, dict):
+            return (result['timestamp'], result['download_speed'], result['upload_speed'],
+                    result['ping'], result.get('server_name'), result.get('server_location'),
+                    result.get('device_count'), result.get('tier'), result.get('device_count_age_seconds'))
+        row = tuple(result)
+        return row + (None,) * (len(SPEED_TEST_COLUMNS) - len(row))
+    
+    def mark_summaries_dirty(self, days):
+        """Flag days whose daily summary is stale"""
+        with self.transaction() as conn:
+            conn.executemany('''
+                INSERT OR IGNORE INTO summary_dirty (day, marked_at) VALUES (?, ?)
+            ''', [(str(day), datetime.now()) for day in days])
+    
+    def refresh_dirty_summaries(self):
+        """
+        Recompute the daily summary of every day flagged in summary_dirty.
+        Returns the number of days refreshed.
+        """
+        cursor = self.connection().cursor()
+        cursor.execute('SELECT day FROM summary_dirty ORDER BY day')
+        days = [row[0] for row in cursor.fetchall()]
+        with self.transaction() as conn:
+            for day in days:
+                self.rebuild_daily_aggregate(day)
+                self.update_daily_summary(day)
+                conn.execute('DELETE FROM summary_dirty WHERE day = ?', (day,))
+        return len(days)
+    
+    def _new_aggregate(self, day):
+        return {
+            'day': day, 'sample_count': 0, 'sum_download': 0.0, 'sum_upload': 0.0,
+            'sum_ping': 0.0, 'device_sum': 0.0, 'device_samples': 0, 'bad_count': 0,
+            'departure_count': 0, 'departure_bad': 0,
+            'download_sketch': QuantileSketch(), 'upload_sketch': QuantileSketch(),
+            'ping_sketch': QuantileSketch(),
+        }
+    
+    def _add_to_aggregate(self, aggregate, plan, download, upload, ping, device_count, tier=None):
+        """Fold one sample into a running aggregate (constant work); tier counts departure tests"""
+        aggregate['sample_count'] += 1
+        aggregate['sum_download'] += download
+        aggregate['sum_upload'] += upload
+        aggregate['sum_ping'] += ping
+        if device_count is not None:
+            aggregate['device_sum'] += device_count
+            aggregate['device_samples'] += 1
+        plan_download = plan[2] if plan else None
+        plan_upload = plan[3] if plan else None
+        bad = self._is_bad_sample(download, upload, ping, plan_download, plan_upload)
+        aggregate['bad_count'] += bad
+        if tier == 'departure':
+            aggregate['departure_count'] += 1
+            aggregate['departure_bad'] += bad
+        aggregate['download_sketch'].add(download)
+        aggregate['upload_sketch'].add(upload)
+        aggregate['ping_sketch'].add(ping)
+    
+    def get_daily_aggregate(self, day):
+        """
+        Running aggregate for one day, with sketches decoded.
+        Returns:
+            dict or None: Aggregate fields, or None if the day has none yet.
+        """
+        cursor = self.connection().cursor()
         cursor.execute('''
-            INSERT INTO speed_tests (timestamp, download_speed, upload_speed, ping, server_name, server_location, device_count)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (datetime.now(), download_speed, upload_speed, ping, server_name, server_location, device_count))
-        
-        conn.commit()
-        conn.close()
+            SELECT sample_count, sum_download, sum_upload, sum_ping, device_sum,
+                   device_samples, bad_count, download_sketch, upload_sketch, ping_sketch,
+                   departure_count, departure_bad
+            FROM daily_aggregates WHERE day = ?
+        ''', (day,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return {
+            'day': day, 'sample_count': row[0], 'sum_download': row[1], 'sum_upload': row[2],
+            'sum_ping': row[3], 'device_sum': row[4], 'device_samples': row[5], 'bad_count': row[6],
+            'download_sketch': QuantileSketch.from_bytes(row[7]),
+            'upload_sketch': QuantileSketch.from_bytes(row[8]),
+            'ping_sketch': QuantileSketch.from_bytes(row[9]),
+            'departure_count': row[10], 'departure_bad': row[11],
+        }
+    
+    def _save_daily_aggregate(self, aggregate):
+        with self.transaction() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO daily_aggregates
+                (day, sample_count, sum_download, sum_upload, sum_ping, device_sum,
+                 device_samples, bad_count, download_sketch, upload_sketch, ping_sketch,
+                 departure_count, departure_bad, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (aggregate['day'], aggregate['sample_count'], aggregate['sum_download'],
+                  aggregate['sum_upload'], aggregate['sum_ping'], aggregate['device_sum'],
+                  aggregate['device_samples'], aggregate['bad_count'],
+                  aggregate['download_sketch'].to_bytes(), aggregate['upload_sketch'].to_bytes(),
+                  aggregate['ping_sketch'].to_bytes(), aggregate['departure_count'],
+                  aggregate['departure_bad'], datetime.now()))
+    
+    def _accumulate_daily(self, day, download, upload, ping, device_count, tier=None):
+        """
+        Add a just-inserted sample to its day's running aggregate.
+        A day without an aggregate yet (e.g. a database created before
+        aggregates existed) is rebuilt once from its speed tests instead.
+        """
+        aggregate = self.get_daily_aggregate(day)
+        if aggregate is None:
+            self.rebuild_daily_aggregate(day)
+            return
+        self._add_to_aggregate(aggregate, self.get_current_plan(), download, upload, ping, device_count, tier)
+        self._save_daily_aggregate(aggregate)
+    
+    def rebuild_daily_aggregate(self, day):
+        """
+        Recompute a day's running aggregate from its speed tests.
+        Returns:
+            dict or None: The new aggregate, or None if the day has no samples.
+        """
+        plan = self.get_current_plan()
+        aggregate = self._new_aggregate(day)
+        for download, upload, ping, device_count, tier in self.get_daily_data(day):
+            self._add_to_aggregate(aggregate, plan, download, upload, ping, device_count, tier)
+        if aggregate['sample_count'] == 0:
+            with self.transaction() as conn:
+                conn.execute('DELETE FROM daily_aggregates WHERE day = ?', (day,))
+            return None
+        self._save_daily_aggregate(aggregate)
+        return aggregate
     
     def get_recent_tests(self, limit=10):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Newest speed tests as SpeedTestResult records"""
+        cursor = self.connection().cursor()
+        cursor.row_factory = SpeedTestResult.from_row
         
         cursor.execute('''
-            SELECT * FROM speed_tests 
+            SELECT id, timestamp, download_speed, upload_speed, ping,
+                   server_name, server_location, device_count, COALESCE(tier, 'full'),
+                   device_count_age_seconds
+            FROM speed_tests 
             ORDER BY timestamp DESC 
             LIMIT ?
         ''', (limit,))
         
         results = cursor.fetchall()
-        conn.close()
         return results
     
-    def set_plan_speed(self, plan_name, download_mbps, upload_mbps):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('UPDATE plan_speeds SET is_active = 0')
-        
+    def insert_probe_result(self, latency_ms, download_mbps, bytes_received, server_name=None, full_test=None,
+                            timestamp=None):
+        """Record one probe; full_test is the tier of the full test it triggered, if any"""
+        with self.transaction() as conn:
+            conn.execute('''
+                INSERT INTO probe_results (timestamp, latency_ms, download_mbps, bytes, server_name, full_test)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (timestamp or datetime.now(), latency_ms, download_mbps, bytes_received, server_name, full_test))
+    
+    def get_probe_baseline(self, limit=20):
+        """(latency_ms, download_mbps) of the most recent probes"""
+        cursor = self.connection().cursor()
         cursor.execute('''
-            INSERT INTO plan_speeds (plan_name, download_mbps, upload_mbps, created_date, is_active)
-            VALUES (?, ?, ?, ?, 1)
-        ''', (plan_name, download_mbps, upload_mbps, datetime.now()))
-        
-        conn.commit()
-        conn.close()
+            SELECT latency_ms, download_mbps FROM probe_results
+            ORDER BY timestamp DESC
+            LIMIT ?
+        ''', (limit,))
+        return cursor.fetchall()
+    
+    def get_recent_probes(self, limit=10):
+        cursor = self.connection().cursor()
+        cursor.execute('''
+            SELECT timestamp, latency_ms, download_mbps, server_name, full_test FROM probe_results
+            ORDER BY timestamp DESC
+            LIMIT ?
+        ''', (limit,))
+        return cursor.fetchall()
+    
+    def get_last_full_test_time(self):
+        """Timestamp of the newest speed test as a datetime, or None"""
+        cursor = self.connection().cursor()
+        cursor.execute('SELECT timestamp FROM speed_tests ORDER BY timestamp DESC LIMIT 1')
+        row = cursor.fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+    
+    def insert_server_measurements(self, test_id, timestamp, measurements):
+        """
+        Store the per-server results of one fan-out run, linked to its speed test.
+        Parameters:
+            test_id (int): speed_tests id of the run.
+            timestamp (datetime): When the run started.
+            measurements (list): Dicts from WiFiSpeedTester.fan_out.
+        """
+        with self.transaction() as conn:
+            conn.executemany('''
+                INSERT INTO server_measurements
+                (test_id, timestamp, server_name, server_location, latency_ms, download_mbps, bytes, elapsed_ms, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(test_id, timestamp, m['server_name'], m['server_location'], m['latency_ms'],
+                   m['download_mbps'], m['bytes'], m['elapsed_ms'], m['status']) for m in measurements])
+    
+    def get_server_measurements(self, test_id):
+        cursor = self.connection().cursor()
+        cursor.execute('''
+            SELECT server_name, server_location, latency_ms, download_mbps, elapsed_ms, status
+            FROM server_measurements
+            WHERE test_id = ?
+            ORDER BY latency_ms IS NULL, latency_ms
+        ''', (test_id,))
+        return cursor.fetchall()
+    
+    def insert_latency_batches(self, rows):
+        """Write (minute, host, sample_count, offsets, rtts) latency batches in one transaction"""
+        with self.transaction() as conn:
+            conn.executemany('''
+                INSERT INTO latency_batches (minute, host, sample_count, offsets, rtts)
+                VALUES (?, ?, ?, ?, ?)
+            ''', rows)
+    
+    def get_latency_batches(self, start, end):
+        """(minute, host, offsets, rtts) of batches in [start, end), oldest first"""
+        cursor = self.connection().cursor()
+        cursor.execute('''
+            SELECT minute, host, offsets, rtts FROM latency_batches
+            WHERE minute >= ? AND minute < ?
+            ORDER BY minute
+        ''', (start.strftime('%Y-%m-%d %H:%M'), end.strftime('%Y-%m-%d %H:%M')))
+        return cursor.fetchall()
+    
+    def insert_monitor_run(self, status, mode=None, phase=None, duration_ms=None, detail=None, timestamp=None):
+        """
+        Record the outcome of one monitor tick.
+        Parameters:
+            status (str): ok, partial, timeout, failed, overlap or skipped.
+            mode (str): 'cron' or 'daemon'.
+            phase (str): Phase that timed out or failed, if any.
+        """
+        with self.transaction() as conn:
+            conn.execute('''
+                INSERT INTO monitor_runs (timestamp, mode, status, phase, duration_ms, detail)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (timestamp or datetime.now(), mode, status, phase, duration_ms, detail))
+    
+    def get_monitor_run_stats(self, since):
+        """
+        Monitor tick outcomes since a datetime.
+        Returns:
+            dict: status -> count, plus 'timeouts' mapping phase -> count.
+        """
+        cursor = self.connection().cursor()
+        cursor.execute('''
+            SELECT status, phase, COUNT(*) FROM monitor_runs
+            WHERE timestamp >= ?
+            GROUP BY status, phase
+        ''', (since,))
+        stats = {'timeouts': {}}
+        for status, phase, count in cursor.fetchall():
+            stats[status] = stats.get(status, 0) + count
+            if status in ('timeout', 'partial') and phase:
+                stats['timeouts'][phase] = stats['timeouts'].get(phase, 0) + count
+        return stats
+    
+    def insert_run_phases(self, test_id, timestamp, phases):
+        """
+        Store the phase timings of one run.
+        Parameters:
+            test_id (int | None): speed_tests id, None if the run saved no test.
+            timestamp (datetime): When the run started.
+            phases (list): PhaseDeadlines.timings entries.
+        """
+        with self.transaction() as conn:
+            conn.executemany('''
+                INSERT INTO run_phases (test_id, timestamp, phase, duration_ms, cpu_ms, peak_rss_kb, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [(test_id, timestamp, p['phase'], p['duration_ms'], p['cpu_ms'], p['peak_rss_kb'], p['status'])
+                  for p in phases])
+    
+    def get_run_phases(self, start, end):
+        """(phase, duration_ms, cpu_ms, peak_rss_kb, status) of runs started in [start, end)"""
+        cursor = self.connection().cursor()
+        cursor.execute('''
+            SELECT phase, duration_ms, cpu_ms, peak_rss_kb, status FROM run_phases
+            WHERE timestamp >= ? AND timestamp < ?
+        ''', (start, end))
+        return cursor.fetchall()
+    
+    def record_device_scan(self, timestamp, kind, network, probed, present, duration_ms=None):
+        """
+        Store one device scan and fold it into the inventory.
+        Parameters:
+            timestamp (datetime): When the scan started.
+            kind (str): 'full' (whole subnet) or 'incremental' (known hosts).
+            network (str): Subnet scanned, e.g. '192.168.0.0/22'.
+            probed (int): Addresses probed.
+            present (list): (ip, mac, interface) per device found; entries
+                without a MAC are counted but not kept in the inventory.
+        Returns:
+            int: The device_scans id.
+        """
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO device_scans (timestamp, kind, network, probed, active, duration_ms)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (timestamp, kind, network, probed, len(present), duration_ms))
+            scan_id = cursor.lastrowid
+            known = [(ip, mac, interface) for ip, mac, interface in present if mac]
+            cursor.executemany('''
+                INSERT INTO devices (mac, last_ip, interface, first_seen, last_seen, times_seen)
+                VALUES (?, ?, ?, ?, ?, 1)
+                ON CONFLICT(mac) DO UPDATE SET
+                    last_ip = excluded.last_ip,
+                    interface = COALESCE(excluded.interface, devices.interface),
+                    last_seen = excluded.last_seen,
+                    times_seen = devices.times_seen + 1
+            ''', [(mac, ip, interface, timestamp, timestamp) for ip, mac, interface in known])
+            cursor.executemany('''
+                INSERT OR IGNORE INTO device_presence (scan_id, mac, ip) VALUES (?, ?, ?)
+            ''', [(scan_id, mac, ip) for ip, mac, _ in known])
+        return scan_id
+    
+    def get_known_devices(self, since):
+        """(mac, last_ip) of inventory devices seen at or after a datetime"""
+        cursor = self.connection().cursor()
+        cursor.execute('''
+            SELECT mac, last_ip FROM devices
+            WHERE last_seen >= ?
+            ORDER BY last_seen DESC
+        ''', (since,))
+        return cursor.fetchall()
+    
+    def get_last_device_count(self):
+        """(timestamp, active) of the latest device scan, or None if there is none"""
+        cursor = self.connection().cursor()
+        cursor.execute('SELECT timestamp, active FROM device_scans ORDER BY timestamp DESC LIMIT 1')
+        return cursor.fetchone()
+    
+    def get_last_device_scan_time(self, kind=None):
+        """Timestamp (str) of the latest device scan, of one kind if given, or None"""
+        cursor = self.connection().cursor()
+        if kind:
+            cursor.execute('SELECT MAX(timestamp) FROM device_scans WHERE kind = ?', (kind,))
+        else:
+            cursor.execute('SELECT MAX(timestamp) FROM device_scans')
+        return cursor.fetchone()[0]
+    
+    def set_plan_speed(self, plan_name, download_mbps, upload_mbps):
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute('UPDATE plan_speeds SET is_active = 0')
+
+            cursor.execute('''
+                INSERT INTO plan_speeds (plan_name, download_mbps, upload_mbps, created_date, is_active)
+                VALUES (?, ?, ?, ?, 1)
+            ''', (plan_name, download_mbps, upload_mbps, datetime.now()))
+            
+            # Today's running bad-sample count was judged against the old plan
+            self.mark_summaries_dirty([date.today().isoformat()])
     
     def get_current_plan(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self.connection().cursor()
         
         cursor.execute('''
             SELECT * FROM plan_speeds 
@@ -127,88 +807,87 @@ class WiFiSpeedDB:
         ''')
         
         result = cursor.fetchone()
-        conn.close()
         return result
     
     def clear_current_plan(self):
         """Clear the current active internet plan"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('UPDATE plan_speeds SET is_active = 0')
-        
-        conn.commit()
-        conn.close()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute('UPDATE plan_speeds SET is_active = 0')
+            
+            self.mark_summaries_dirty([date.today().isoformat()])
     
     def get_speed_test_with_plan_comparison(self, limit=10):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Newest speed tests with the active plan, as SpeedTestComparison records"""
+        cursor = self.connection().cursor()
+        cursor.row_factory = SpeedTestComparison.from_row
         
         cursor.execute('''
             SELECT 
-                st.*,
+                st.id, st.timestamp, st.download_speed, st.upload_speed, st.ping,
+                st.server_name, st.server_location, st.device_count,
+                COALESCE(st.tier, 'full') as tier,
+                st.device_count_age_seconds,
                 ps.plan_name,
                 ps.download_mbps as plan_download,
                 ps.upload_mbps as plan_upload,
                 ROUND((st.download_speed / ps.download_mbps) * 100, 1) as download_percentage,
                 ROUND((st.upload_speed / ps.upload_mbps) * 100, 1) as upload_percentage
-            FROM speed_tests st
+            FROM (SELECT * FROM speed_tests ORDER BY timestamp DESC LIMIT ?) st
             LEFT JOIN plan_speeds ps ON ps.is_active = 1
             ORDER BY st.timestamp DESC
             LIMIT ?
-        ''', (limit,))
+        ''', (limit, limit))
         
         results = cursor.fetchall()
-        conn.close()
         return results
     
     def get_daily_data(self, target_date):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """(download, upload, ping, device_count, tier) for each test on one day, oldest first"""
+        cursor = self.connection().cursor()
+        bounds = day_bounds(target_date)
         
-        cursor.execute('''
+        cursor.execute(f'''
             SELECT 
                 download_speed, 
                 upload_speed, 
                 ping, 
-                device_count
-            FROM speed_tests 
-            WHERE DATE(timestamp) = ?
+                device_count,
+                COALESCE(tier, 'full')
+            FROM {partitions.source(cursor, *bounds)} 
+            WHERE timestamp >= ? AND timestamp < ?
             ORDER BY timestamp
-        ''', (target_date,))
+        ''', bounds)
         
         results = cursor.fetchall()
-        conn.close()
         return results
     
     def insert_daily_summary(self, day, sample_count, median_download, median_upload, 
-                           p95_ping, pct_bad, avg_device_count, status):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT OR REPLACE INTO daily_summary 
-            (day, sample_count, median_download_mbps, median_upload_mbps, 
-             p95_ping_ms, pct_bad, avg_device_count, status, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (day, sample_count, median_download, median_upload, p95_ping, 
-              pct_bad, avg_device_count, status, datetime.now()))
-        
-        conn.commit()
-        conn.close()
+                           p95_ping, pct_bad, avg_device_count, status, departure_tests=0):
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                INSERT OR REPLACE INTO daily_summary 
+                (day, sample_count, median_download_mbps, median_upload_mbps, 
+                 p95_ping_ms, pct_bad, avg_device_count, status, created_at, departure_tests)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (day, sample_count, median_download, median_upload, p95_ping, 
+                  pct_bad, avg_device_count, status, datetime.now(), departure_tests))
     
     def get_daily_summaries(self, limit=30):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Newest daily summaries as DailySummary records"""
+        cursor = self.connection().cursor()
+        cursor.row_factory = DailySummary.from_row
         
-        cursor.execute('''
-            SELECT * FROM daily_summary 
+        cursor.execute(f'''
+            SELECT {DailySummary.select_list()} FROM daily_summary 
             ORDER BY day DESC 
             LIMIT ?
         ''', (limit,))
         
         results = cursor.fetchall()
-        conn.close()
         return results
     
     def update_today_summary(self):
@@ -216,56 +895,38 @@ class WiFiSpeedDB:
         Update today's daily summary with current data.
         Called after each speed test to keep running summary current.
         """
-        from datetime import date
-        today = date.today().isoformat()
-        
-        # Get today's data
-        daily_data = self.get_daily_data(today)
-        if not daily_data:
-            return False
-        
-        # Get current plan
-        plan = self.get_current_plan()
-        plan_download = plan[2] if plan else None
-        plan_upload = plan[3] if plan else None
-        
-        # Calculate metrics
-        downloads = [row[0] for row in daily_data if row[0] is not None]
-        uploads = [row[1] for row in daily_data if row[1] is not None]
-        pings = [row[2] for row in daily_data if row[2] is not None]
-        device_counts = [row[3] for row in daily_data if row[3] is not None]
-        
-        if not downloads or not uploads or not pings:
+        return self.update_daily_summary(date.today().isoformat())
+    
+    def update_daily_summary(self, day):
+        """
+        Refresh the daily summary for one day (YYYY-MM-DD) from its running
+        aggregate, building the aggregate from speed tests if it is missing.
+        Medians and p95 come from quantile sketches; see quantile_sketch for
+        the error bound. pct_bad leaves out departure-triggered tests (see
+        bad_percentage), which are counted in departure_tests instead.
+        Returns False when the day has no usable data.
+        """
+        aggregate = self.get_daily_aggregate(day) or self.rebuild_daily_aggregate(day)
+        if not aggregate:
             return False
         
-        # Calculate summary metrics
-        import statistics
-        median_download = statistics.median(downloads)
-        median_upload = statistics.median(uploads)
-        p95_ping = self._calculate_percentile(pings, 95)
-        avg_device_count = statistics.mean(device_counts) if device_counts else None
-        
-        # Calculate bad samples percentage
-        bad_samples = 0
-        ping_threshold = 50  # Default threshold
-        
-        for download, upload, ping, _ in daily_data:
-            if self._is_bad_sample(download, upload, ping, plan_download, plan_upload, ping_threshold):
-                bad_samples += 1
-        
-        pct_bad = (bad_samples / len(daily_data)) * 100
-        status = self._get_daily_status(pct_bad)
+        sample_count = aggregate['sample_count']
+        pct_bad = bad_percentage(sample_count, aggregate['bad_count'],
+                                 aggregate['departure_count'], aggregate['departure_bad'])
+        avg_device_count = (aggregate['device_sum'] / aggregate['device_samples']
+                            if aggregate['device_samples'] else None)
         
         # Update summary
         self.insert_daily_summary(
-            day=today,
-            sample_count=len(daily_data),
-            median_download=median_download,
-            median_upload=median_upload,
-            p95_ping=p95_ping,
+            day=day,
+            sample_count=sample_count,
+            median_download=aggregate['download_sketch'].quantile(0.5),
+            median_upload=aggregate['upload_sketch'].quantile(0.5),
+            p95_ping=aggregate['ping_sketch'].quantile(0.95),
             pct_bad=pct_bad,
             avg_device_count=avg_device_count,
-            status=status
+            status=self._get_daily_status(pct_bad),
+            departure_tests=aggregate['departure_count']
         )
         
         return True
@@ -277,35 +938,34 @@ class WiFiSpeedDB:
         """
         from datetime import date, timedelta
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Get existing summary days
-        cursor.execute('SELECT day FROM daily_summary WHERE day >= ?', 
-                      ((date.today() - timedelta(days=days_back)).isoformat(),))
-        existing_days = set(row[0] for row in cursor.fetchall())
-        
-        # Check each day and create placeholder if missing
-        for i in range(1, days_back + 1):
-            check_date = date.today() - timedelta(days=i)
-            date_str = check_date.isoformat()
-            
-            if date_str not in existing_days:
-                # Check if there's any speed test data for this day
-                cursor.execute('SELECT COUNT(*) FROM speed_tests WHERE DATE(timestamp) = ?', (date_str,))
-                data_count = cursor.fetchone()[0]
-                
-                if data_count == 0:
-                    # No data for this day, create placeholder
-                    cursor.execute('''
-                        INSERT OR IGNORE INTO daily_summary 
-                        (day, sample_count, median_download_mbps, median_upload_mbps, 
-                         p95_ping_ms, pct_bad, avg_device_count, status, created_at)
-                        VALUES (?, 0, 0, 0, 0, 0, NULL, 'no_data', ?)
-                    ''', (date_str, datetime.now()))
-        
-        conn.commit()
-        conn.close()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+
+            # Get existing summary days
+            cursor.execute('SELECT day FROM daily_summary WHERE day >= ?', 
+                          ((date.today() - timedelta(days=days_back)).isoformat(),))
+            existing_days = set(row[0] for row in cursor.fetchall())
+
+            # Check each day and create placeholder if missing
+            for i in range(1, days_back + 1):
+                check_date = date.today() - timedelta(days=i)
+                date_str = check_date.isoformat()
+
+                if date_str not in existing_days:
+                    # Check if there's any speed test data for this day
+                    bounds = day_bounds(check_date)
+                    cursor.execute(f'SELECT COUNT(*) FROM {partitions.source(cursor, *bounds)} '
+                                   'WHERE timestamp >= ? AND timestamp < ?', bounds)
+                    data_count = cursor.fetchone()[0]
+
+                    if data_count == 0:
+                        # No data for this day, create placeholder
+                        cursor.execute('''
+                            INSERT OR IGNORE INTO daily_summary 
+                            (day, sample_count, median_download_mbps, median_upload_mbps, 
+                             p95_ping_ms, pct_bad, avg_device_count, status, created_at)
+                            VALUES (?, 0, 0, 0, 0, 0, NULL, 'no_data', ?)
+                        ''', (date_str, datetime.now()))
     
     def _is_bad_sample(self, download, upload, ping, plan_download, plan_upload, ping_threshold=50):
         """Helper method for bad sample detection"""
@@ -326,48 +986,23 @@ class WiFiSpeedDB:
         else:
             return 'bad'
     
-    def _calculate_percentile(self, data, percentile):
-        """Helper method for percentile calculation"""
-        if not data:
-            return 0.0
-        
-        sorted_data = sorted(data)
-        n = len(sorted_data)
-        index = (percentile / 100.0) * (n - 1)
-        
-        if index.is_integer():
-            return sorted_data[int(index)]
-        else:
-            lower = sorted_data[int(index)]
-            upper = sorted_data[int(index) + 1]
-            return lower + (upper - lower) * (index - int(index))
+    def _calculate_percentile(self, data, pct):
+        """Helper method for percentile calculation (see the module's percentile)"""
+        return percentile(data, pct)
     
     def set_config(self, key, value):
         """Store configuration value"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Create config table if it doesn't exist
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS config (
-                key TEXT PRIMARY KEY,
-                value TEXT NOT NULL,
-                updated_at DATETIME NOT NULL
-            )
-        ''')
-        
-        cursor.execute('''
-            INSERT OR REPLACE INTO config (key, value, updated_at)
-            VALUES (?, ?, ?)
-        ''', (key, value, datetime.now()))
-        
-        conn.commit()
-        conn.close()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                INSERT OR REPLACE INTO config (key, value, updated_at)
+                VALUES (?, ?, ?)
+            ''', (key, value, datetime.now()))
     
     def get_config(self, key, default=None):
         """Retrieve configuration value"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self.connection().cursor()
         
         try:
             cursor.execute('SELECT value FROM config WHERE key = ?', (key,))
@@ -375,8 +1010,19 @@ class WiFiSpeedDB:
             return result[0] if result else default
         except:
             return default
-        finally:
-            conn.close()
+    
+    def get_config_number(self, key, default, kind=float):
+        """
+        Numeric configuration value.
+        Parameters:
+            key (str): Config key.
+            default: Returned when the key is unset or its value is not a number.
+            kind (type): int or float.
+        """
+        try:
+            return kind(self.get_config(key, str(default)))
+        except (TypeError, ValueError):
+            return default
     
     def cleanup_old_data(self, days_to_keep=30):
         """
@@ -387,38 +1033,37 @@ class WiFiSpeedDB:
         
         cutoff_date = date.today() - timedelta(days=days_to_keep)
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Count records before cleanup
-        cursor.execute('SELECT COUNT(*) FROM speed_tests WHERE DATE(timestamp) < ?', (cutoff_date.isoformat(),))
-        old_count = cursor.fetchone()[0]
-        
-        if old_count == 0:
-            conn.close()
-            return 0, 0
-        
-        # Delete old speed test records (keep daily summaries)
-        cursor.execute('DELETE FROM speed_tests WHERE DATE(timestamp) < ?', (cutoff_date.isoformat(),))
-        
-        # Get database size before and after
-        cursor.execute('PRAGMA page_count')
-        page_count = cursor.fetchone()[0]
-        cursor.execute('PRAGMA page_size') 
-        page_size = cursor.fetchone()[0]
-        
-        # Vacuum to reclaim space
-        cursor.execute('VACUUM')
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            
+            # Delete old speed test records (keep daily summaries)
+            old_count = self._delete_speed_tests_before(cursor, cutoff_date.isoformat())
+            cursor.execute('DELETE FROM probe_results WHERE timestamp < ?', (cutoff_date.isoformat(),))
+            cursor.execute('DELETE FROM server_measurements WHERE timestamp < ?', (cutoff_date.isoformat(),))
+            cursor.execute('DELETE FROM latency_batches WHERE minute < ?', (cutoff_date.isoformat(),))
+            cursor.execute('DELETE FROM monitor_runs WHERE timestamp < ?', (cutoff_date.isoformat(),))
+            cursor.execute('DELETE FROM run_phases WHERE timestamp < ?', (cutoff_date.isoformat(),))
+            cursor.execute('DELETE FROM device_presence WHERE scan_id IN (SELECT id FROM device_scans WHERE timestamp < ?)', (cutoff_date.isoformat(),))
+            cursor.execute('DELETE FROM device_scans WHERE timestamp < ?', (cutoff_date.isoformat(),))
+            
+            if old_count == 0:
+                return 0, 0
+            
+            cursor.execute('DELETE FROM daily_aggregates WHERE day < ?', (cutoff_date.isoformat(),))
+            
+            cursor.execute('PRAGMA page_size') 
+            page_size = cursor.fetchone()[0]
         
-        conn.commit()
-        conn.close()
+        # Hand back a bounded number of the freed pages; later runs get the rest
+        pages_freed = sum(self.reclaim_space())
+        # The deletes and vacuum steps went through the WAL; reset it to empty
+        self.checkpoint('TRUNCATE')
         
-        return old_count, (page_count * page_size) // 1024  # KB
+        return old_count, (pages_freed * page_size) // 1024  # KB
     
     def get_database_stats(self):
         """Get database storage statistics"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self.connection().cursor()
         
         stats = {}
         
@@ -431,10 +1076,18 @@ class WiFiSpeedDB:
         stats['daily_summaries_count'] = cursor.fetchone()[0]
         
         # Date range
-        cursor.execute('SELECT MIN(DATE(timestamp)), MAX(DATE(timestamp)) FROM speed_tests')
+        # ORDER BY ... LIMIT 1 lets the partition view merge index order
+        # instead of scanning every month
+        cursor.execute('''
+            SELECT DATE((SELECT timestamp FROM speed_tests ORDER BY timestamp LIMIT 1)),
+                   DATE((SELECT timestamp FROM speed_tests ORDER BY timestamp DESC LIMIT 1))
+        ''')
         result = cursor.fetchone()
         stats['date_range'] = result if result[0] else (None, None)
         
+        # Monthly partitions (0 when speed_tests is a plain table)
+        stats['partitions'] = len(partitions.partitions(cursor)) if partitions.is_partitioned(cursor) else 0
+        
         # Database size
         cursor.execute('PRAGMA page_count')
         page_count = cursor.fetchone()[0]
@@ -442,78 +1095,84 @@ class WiFiSpeedDB:
         page_size = cursor.fetchone()[0]
         stats['db_size_kb'] = (page_count * page_size) // 1024
         
-        conn.close()
         return stats
     
     def archive_old_data(self, days_to_keep=90, archive_to_summaries=True):
         """
         Archive old data by converting detailed records to aggregated summaries.
         More sophisticated than simple deletion.
+        Streams the old rows of days without a summary in one ordered pass and
+        summarizes each day as its group ends; the summary inserts and the
+        delete share one transaction.
         """
-        from datetime import date, timedelta
-        
-        archive_cutoff = date.today() - timedelta(days=days_to_keep)
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Find days with speed tests but no daily summary
-        cursor.execute('''
-            SELECT DATE(timestamp) as test_date
-            FROM speed_tests 
-            WHERE DATE(timestamp) < ?
-            AND DATE(timestamp) NOT IN (SELECT day FROM daily_summary)
-            GROUP BY DATE(timestamp)
-        ''', (archive_cutoff.isoformat(),))
-        
-        missing_summary_dates = [row[0] for row in cursor.fetchall()]
-        
-        # Create summaries for missing dates before archiving
-        archived_count = 0
-        for date_str in missing_summary_dates:
-            daily_data = self.get_daily_data(date_str)
-            if daily_data:
-                # Calculate summary metrics quickly
-                downloads = [row[0] for row in daily_data if row[0]]
-                uploads = [row[1] for row in daily_data if row[1]]
-                pings = [row[2] for row in daily_data if row[2]]
-                
-                if downloads and uploads and pings:
-                    import statistics
-                    median_download = statistics.median(downloads)
-                    median_upload = statistics.median(uploads)
-                    p95_ping = self._calculate_percentile(pings, 95)
-                    
-                    # Simple bad percentage calculation
-                    plan = self.get_current_plan()
-                    bad_count = 0
-                    if plan:
-                        for d, u, p, _ in daily_data:
-                            if (d < plan[2] * 0.7) or (u < plan[3] * 0.7) or (p > 50):
-                                bad_count += 1
-                    
-                    pct_bad = (bad_count / len(daily_data)) * 100
-                    status = 'good' if pct_bad < 10 else 'meh' if pct_bad <= 30 else 'bad'
-                    
-                    # Insert summary
-                    cursor.execute('''
-                        INSERT OR IGNORE INTO daily_summary 
-                        (day, sample_count, median_download_mbps, median_upload_mbps, 
-                         p95_ping_ms, pct_bad, avg_device_count, status, created_at)
-                        VALUES (?, ?, ?, ?, ?, ?, NULL, ?, ?)
-                    ''', (date_str, len(daily_data), median_download, median_upload, 
-                          p95_ping, pct_bad, status, datetime.now()))
-                    
-                    archived_count += len(daily_data)
-        
-        # Now delete the archived speed test records
-        cursor.execute('DELETE FROM speed_tests WHERE DATE(timestamp) < ?', (archive_cutoff.isoformat(),))
-        deleted_count = cursor.rowcount
-        
-        conn.commit()
-        conn.close()
+        archive_cutoff = (date.today() - timedelta(days=days_to_keep)).isoformat()
+        plan = self.get_current_plan()
         
-        return deleted_count, len(missing_summary_dates)
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            
+            # Rows of days with speed tests but no daily summary
+            rows = conn.execute(f'''
+                SELECT SUBSTR(timestamp, 1, 10), download_speed, upload_speed, ping, COALESCE(tier, 'full')
+                FROM {partitions.source(cursor, end=archive_cutoff)}
+                WHERE timestamp < ?
+                AND SUBSTR(timestamp, 1, 10) NOT IN (SELECT day FROM daily_summary)
+                ORDER BY timestamp
+            ''', (archive_cutoff,))
+            
+            missing_days = []
+            
+            def pending_summaries():
+                for day, samples in groupby(rows, key=itemgetter(0)):
+                    missing_days.append(day)
+                    summary = self._archive_summary(day, list(samples), plan)
+                    if summary:
+                        yield summary
+            
+            cursor.executemany('''
+                INSERT OR IGNORE INTO daily_summary 
+                (day, sample_count, median_download_mbps, median_upload_mbps, 
+                 p95_ping_ms, pct_bad, avg_device_count, status, created_at, departure_tests)
+                VALUES (?, ?, ?, ?, ?, ?, NULL, ?, ?, ?)
+            ''', pending_summaries())
+            
+            # Now delete the archived speed test records
+            deleted_count = self._delete_speed_tests_before(cursor, archive_cutoff)
+            cursor.execute('DELETE FROM daily_aggregates WHERE day < ?', (archive_cutoff,))
+            cursor.execute('DELETE FROM probe_results WHERE timestamp < ?', (archive_cutoff,))
+            cursor.execute('DELETE FROM server_measurements WHERE timestamp < ?', (archive_cutoff,))
+            cursor.execute('DELETE FROM latency_batches WHERE minute < ?', (archive_cutoff,))
+            cursor.execute('DELETE FROM monitor_runs WHERE timestamp < ?', (archive_cutoff,))
+            cursor.execute('DELETE FROM run_phases WHERE timestamp < ?', (archive_cutoff,))
+            cursor.execute('DELETE FROM device_presence WHERE scan_id IN (SELECT id FROM device_scans WHERE timestamp < ?)', (archive_cutoff,))
+            cursor.execute('DELETE FROM device_scans WHERE timestamp < ?', (archive_cutoff,))
+        
+        return deleted_count, len(missing_days)
+    
+    def _archive_summary(self, day, samples, plan):
+        """
+        Summary row for one archived day from its (day, download, upload, ping,
+        tier) samples, or None if the day lacks usable data.
+        """
+        downloads = [row[1] for row in samples if row[1]]
+        uploads = [row[2] for row in samples if row[2]]
+        pings = [row[3] for row in samples if row[3]]
+        if not downloads or not uploads or not pings:
+            return None
+        
+        # Simple bad percentage calculation
+        bad_count = departures = departures_bad = 0
+        for _, d, u, p, tier in samples:
+            bad = bool(plan) and ((d < plan[2] * 0.7) or (u < plan[3] * 0.7) or (p > 50))
+            bad_count += bad
+            if tier == 'departure':
+                departures += 1
+                departures_bad += bad
+        pct_bad = bad_percentage(len(samples), bad_count, departures, departures_bad)
+        
+        return (day, len(samples), statistics.median(downloads), statistics.median(uploads),
+                self._calculate_percentile(pings, 95), pct_bad, self._get_daily_status(pct_bad),
+                datetime.now(), departures)
     
     def set_retention_policy(self, speed_tests_days=30, summaries_days=365):
         """Set data retention policies"""
@@ -522,8 +1181,8 @@ class WiFiSpeedDB:
     
     def get_retention_policy(self):
         """Get current retention policies"""
-        speed_tests_days = int(self.get_config('retention_speed_tests_days', '30'))
-        summaries_days = int(self.get_config('retention_summaries_days', '365'))
+        speed_tests_days = self.get_config_number('retention_speed_tests_days', 30, int)
+        summaries_days = self.get_config_number('retention_summaries_days', 365, int)
         return speed_tests_days, summaries_days
     
     def get_week_start_end(self, date_obj):
@@ -537,19 +1196,31 @@ class WiFiSpeedDB:
         
         return week_start, week_end
     
+    def _get_weekly_status(self, days_with_data, good_days, meh_days):
+        """Helper method for weekly status calculation"""
+        if days_with_data == 0:
+            return 'bad'
+        elif good_days >= 5:  # 5+ good days
+            return 'excellent'
+        elif good_days + meh_days >= 5:  # 5+ okay days
+            return 'good'
+        elif good_days + meh_days >= 3:  # 3+ okay days
+            return 'poor'
+        else:
+            return 'bad'
+    
     def create_weekly_summary(self, week_start_date):
         """Create weekly summary from daily summaries for a given week"""
         from datetime import timedelta
         
         week_start, week_end = self.get_week_start_end(week_start_date)
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self.connection().cursor()
+        cursor.row_factory = DailySummary.from_row
         
         # Get all daily summaries for this week
-        cursor.execute('''
-            SELECT day, sample_count, median_download_mbps, median_upload_mbps, 
-                   p95_ping_ms, pct_bad, status
+        cursor.execute(f'''
+            SELECT {DailySummary.select_list()}
             FROM daily_summary 
             WHERE day >= ? AND day <= ?
             ORDER BY day
@@ -558,134 +1229,127 @@ class WiFiSpeedDB:
         daily_data = cursor.fetchall()
         
         if not daily_data:
-            conn.close()
             return False
         
         # Calculate weekly aggregates
-        total_samples = sum(row[1] for row in daily_data)
-        days_with_data = len([row for row in daily_data if row[1] > 0])
+        total_samples = sum(day.sample_count for day in daily_data)
+        days_with_data = len([day for day in daily_data if day.sample_count > 0])
         
         # Weighted averages (by sample count)
         if total_samples > 0:
-            weighted_download = sum(row[2] * row[1] for row in daily_data if row[1] > 0) / total_samples
-            weighted_upload = sum(row[3] * row[1] for row in daily_data if row[1] > 0) / total_samples
-            weighted_ping = sum(row[4] * row[1] for row in daily_data if row[1] > 0) / total_samples
-            weighted_pct_bad = sum(row[5] * row[1] for row in daily_data if row[1] > 0) / total_samples
+            counted = [day for day in daily_data if day.sample_count > 0]
+            weighted_download = sum(day.median_download_mbps * day.sample_count for day in counted) / total_samples
+            weighted_upload = sum(day.median_upload_mbps * day.sample_count for day in counted) / total_samples
+            weighted_ping = sum(day.p95_ping_ms * day.sample_count for day in counted) / total_samples
+            weighted_pct_bad = sum(day.pct_bad * day.sample_count for day in counted) / total_samples
         else:
             weighted_download = weighted_upload = weighted_ping = weighted_pct_bad = 0
         
         # Count days by status
         status_counts = {'good': 0, 'meh': 0, 'bad': 0, 'no_data': 0}
-        for row in daily_data:
-            status = row[6] if row[6] in status_counts else 'no_data'
+        for day in daily_data:
+            status = day.status if day.status in status_counts else 'no_data'
             status_counts[status] += 1
         
-        # Determine weekly status
-        if days_with_data == 0:
-            weekly_status = 'bad'
-        elif status_counts['good'] >= 5:  # 5+ good days
-            weekly_status = 'excellent'
-        elif status_counts['good'] + status_counts['meh'] >= 5:  # 5+ okay days
-            weekly_status = 'good'
-        elif status_counts['good'] + status_counts['meh'] >= 3:  # 3+ okay days
-            weekly_status = 'poor'
-        else:
-            weekly_status = 'bad'
+        weekly_status = self._get_weekly_status(days_with_data, status_counts['good'], status_counts['meh'])
         
         # Insert or replace weekly summary
-        cursor.execute('''
-            INSERT OR REPLACE INTO weekly_summary 
-            (week_start, week_end, days_with_data, total_samples, 
-             avg_download_mbps, avg_upload_mbps, avg_ping_ms, weekly_pct_bad,
-             good_days, meh_days, bad_days, no_data_days, status, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (week_start.isoformat(), week_end.isoformat(), days_with_data, total_samples,
-              weighted_download, weighted_upload, weighted_ping, weighted_pct_bad,
-              status_counts['good'], status_counts['meh'], 
-              status_counts['bad'], status_counts['no_data'],
-              weekly_status, datetime.now()))
-        
-        conn.commit()
-        conn.close()
+        with self.transaction() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO weekly_summary 
+                (week_start, week_end, days_with_data, total_samples, 
+                 avg_download_mbps, avg_upload_mbps, avg_ping_ms, weekly_pct_bad,
+                 good_days, meh_days, bad_days, no_data_days, status, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (week_start.isoformat(), week_end.isoformat(), days_with_data, total_samples,
+                  weighted_download, weighted_upload, weighted_ping, weighted_pct_bad,
+                  status_counts['good'], status_counts['meh'], 
+                  status_counts['bad'], status_counts['no_data'],
+                  weekly_status, datetime.now()))
         
         return True
     
     def archive_daily_to_weekly(self, weeks_to_keep=4):
-        """Archive old daily summaries to weekly summaries"""
-        from datetime import date, timedelta
-        
-        # Find completed weeks (Sunday to Sunday) older than weeks_to_keep
-        today = date.today()
-        cutoff_date = today - timedelta(weeks=weeks_to_keep)
-        
-        # Find the Sunday before cutoff_date
-        cutoff_week_start, _ = self.get_week_start_end(cutoff_date)
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Get all daily summaries older than cutoff that aren't archived to weekly yet
-        cursor.execute('''
-            SELECT DISTINCT DATE(day, 'weekday 0', '-6 days') as week_start
-            FROM daily_summary 
-            WHERE day <= ? 
-            AND DATE(day, 'weekday 0', '-6 days') NOT IN (SELECT week_start FROM weekly_summary)
-            ORDER BY week_start
-        ''', (cutoff_week_start.isoformat(),))
-        
-        weeks_to_archive = [row[0] for row in cursor.fetchall()]
-        conn.close()
-        
-        archived_weeks = 0
-        archived_days = 0
-        
-        # Create weekly summaries for each week
-        for week_start_str in weeks_to_archive:
-            from datetime import datetime as dt
-            week_start = dt.fromisoformat(week_start_str).date()
-            
-            if self.create_weekly_summary(week_start):
-                archived_weeks += 1
-                
-                # Count how many daily records would be archived
-                week_end = week_start + timedelta(days=6)
-                conn = sqlite3.connect(self.db_path)
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT COUNT(*) FROM daily_summary 
-                    WHERE day >= ? AND day <= ?
-                ''', (week_start.isoformat(), week_end.isoformat()))
-                archived_days += cursor.fetchone()[0]
-                conn.close()
+        """
+        Archive old daily summaries to weekly summaries.
+        One grouped query builds every pending Sunday-to-Saturday week older
+        than weeks_to_keep; the weekly inserts and the daily deletes share one
+        transaction.
+        """
+        # Only complete weeks that start before the cutoff week are archived
+        cutoff_week_start, _ = self.get_week_start_end(date.today() - timedelta(weeks=weeks_to_keep))
+        cutoff = cutoff_week_start.isoformat()
         
-        # Now delete the daily summaries that have been archived
-        if archived_weeks > 0:
-            conn = sqlite3.connect(self.db_path)
+        with self.transaction() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                DELETE FROM daily_summary 
-                WHERE day <= ?
-                AND DATE(day, 'weekday 0', '-6 days') IN (SELECT week_start FROM weekly_summary)
-            ''', (cutoff_week_start.isoformat(),))
-            deleted_days = cursor.rowcount
-            conn.commit()
-            conn.close()
-        else:
-            deleted_days = 0
-        
-        return archived_weeks, deleted_days
+            
+            cursor.execute(f'''
+                SELECT {WEEK_START_SQL} AS week_start,
+                       SUM(sample_count > 0),
+                       SUM(sample_count),
+                       SUM(CASE WHEN sample_count > 0 THEN median_download_mbps * sample_count ELSE 0 END),
+                       SUM(CASE WHEN sample_count > 0 THEN median_upload_mbps * sample_count ELSE 0 END),
+                       SUM(CASE WHEN sample_count > 0 THEN p95_ping_ms * sample_count ELSE 0 END),
+                       SUM(CASE WHEN sample_count > 0 THEN pct_bad * sample_count ELSE 0 END),
+                       SUM(status = 'good'),
+                       SUM(status = 'meh'),
+                       SUM(status = 'bad'),
+                       SUM(status IS NULL OR status NOT IN ('good', 'meh', 'bad'))
+                FROM daily_summary
+                WHERE day < ?
+                AND week_start NOT IN (SELECT week_start FROM weekly_summary)
+                GROUP BY week_start
+                ORDER BY week_start
+            ''', (cutoff,))
+            
+            weekly_rows = []
+            for (week_start, days_with_data, total_samples, download_total, upload_total,
+                 ping_total, pct_bad_total, good_days, meh_days, bad_days, no_data_days) in cursor.fetchall():
+                # Weighted averages (by sample count)
+                weight = total_samples if total_samples > 0 else None
+                week_end = (date.fromisoformat(week_start) + timedelta(days=6)).isoformat()
+                weekly_rows.append((
+                    week_start, week_end, days_with_data, total_samples,
+                    download_total / weight if weight else 0,
+                    upload_total / weight if weight else 0,
+                    ping_total / weight if weight else 0,
+                    pct_bad_total / weight if weight else 0,
+                    good_days, meh_days, bad_days, no_data_days,
+                    self._get_weekly_status(days_with_data, good_days, meh_days),
+                    datetime.now()
+                ))
+            
+            cursor.executemany('''
+                INSERT OR REPLACE INTO weekly_summary 
+                (week_start, week_end, days_with_data, total_samples, 
+                 avg_download_mbps, avg_upload_mbps, avg_ping_ms, weekly_pct_bad,
+                 good_days, meh_days, bad_days, no_data_days, status, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', weekly_rows)
+            
+            # Now delete the daily summaries that have been archived
+            if weekly_rows:
+                cursor.execute(f'''
+                    DELETE FROM daily_summary 
+                    WHERE day < ?
+                    AND {WEEK_START_SQL} IN (SELECT week_start FROM weekly_summary)
+                ''', (cutoff,))
+                deleted_days = cursor.rowcount
+            else:
+                deleted_days = 0
+        
+        return len(weekly_rows), deleted_days
     
     def get_weekly_summaries(self, limit=12):
-        """Get recent weekly summaries"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Newest weekly summaries as WeeklySummary records"""
+        cursor = self.connection().cursor()
+        cursor.row_factory = WeeklySummary.from_row
         
-        cursor.execute('''
-            SELECT * FROM weekly_summary 
+        cursor.execute(f'''
+            SELECT {WeeklySummary.select_list()} FROM weekly_summary 
             ORDER BY week_start DESC 
             LIMIT ?
         ''', (limit,))
         
         results = cursor.fetchall()
-        conn.close()
         return results
\ No newline at end of file
@@ -4,48 +4,228 @@ DeviceScanner
 
 Purpose:
 --------
-This module provides the DeviceScanner class for discovering and counting active devices on a local network. It uses ARP table inspection, ICMP ping sweeps, and nmap to estimate device counts, and is designed for use in WiFi monitoring and automation scripts.
+This module provides the DeviceScanner class for discovering and counting active devices on a local network. It uses ARP table inspection, ping sweeps (see sweep.py), and nmap to estimate device counts, and is designed for use in WiFi monitoring and automation scripts.
 
 Class:
 ------
 DeviceScanner
     Methods:
     ---------
-    __init__(self)
-        Initializes the scanner, sets gateway IP and network prefix.
+    __init__(self, timeout=PROBE_TIMEOUT, rate=DEFAULT_RATE)
+        Initializes the scanner, sets gateway IP, network and the sweeper (timeout is per probe, rate in probes a second).
 
     get_default_gateway(self) -> str
-        Returns the default gateway IP address as a string.
+        Returns the default gateway IP address as a string (from /proc/net/route on Linux).
 
-    get_network_prefix(self) -> str
-        Returns the network prefix (e.g. '192.168.1') as a string.
+    get_network(self) -> ipaddress.IPv4Network
+        Returns the gateway's subnet, from the interface netmask (e.g. 192.168.0.0/22).
 
     ping_host(self, ip: str) -> bool
-        Pings a given IP address. Returns True if host is reachable, False otherwise.
+        Probes a given IP address. Returns True if host is reachable, False otherwise.
 
     scan_arp_table(self) -> list[str]
-        Scans the ARP table for active devices in the local network prefix. Returns a list of IP addresses.
+        Scans the ARP table (/proc/net/arp on Linux) for active devices in the local network. Returns a list of IP addresses.
 
-    scan_network_range(self, max_workers: int = 20) -> list[str]
-        Pings all IPs in the subnet using threads. Returns a list of reachable IP addresses.
+    scan_network_range(self, concurrency: int = None) -> list[str]
+        Probes all IPs in the subnet on an asyncio loop, rate limited, logging progress on large subnets. Returns a list of reachable IP addresses.
 
     get_router_device_count(self) -> int | None
         Uses nmap to scan the subnet and count devices. Returns the count or None if scan fails.
 
-    count_active_devices(self) -> int
+    count_active_devices(self, full=None) -> int
         Combines ARP and ping scans to estimate the number of active devices. Returns at least 1.
+        With a database it is inventory_scan(full).
+
+    count_devices_cached(self, force=False, full=None) -> tuple
+        (count, age_seconds): the last scan's count while it is younger than device_count_ttl_seconds
+        (config), otherwise a new count_active_devices(). force skips the cache.
+
+    inventory_scan(self, full=None) -> int
+        Updates the devices inventory (keyed by MAC, see migrations.py) from one scan: routine
+        scans re-probe only known devices and ARP entries. ARP first: while the ARP table
+        has ARP_MIN_DEVICES entries no full sweep is made unless forced; otherwise one runs
+        every device_full_sweep_minutes (config). Returns the devices present, at least 1.
+
+parse_proc_route(text) -> str | None
+parse_proc_networks(text) -> list[tuple]
+parse_proc_arp(text) -> list[tuple]
+parse_arp_output(text) -> list[tuple]
+parse_ifconfig(text) -> list[ipaddress.IPv4Interface]
+    Pure parsers for /proc/net/route, /proc/net/arp, BSD `arp -a` and
+    `ifconfig` output (MACs normalized by normalize_mac). On Linux the proc
+    files are read directly, so discovery forks no subprocesses; `route`,
+    `arp` and `ifconfig` remain the path on other platforms.
 
 Usage:
 ------
-scanner = DeviceScanner()
+scanner = DeviceScanner(db=WiFiSpeedDB())
 count = scanner.count_active_devices()
 print(f"Active devices on network: {count}")
 """
+import ipaddress
 import subprocess
 import re
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import socket
+import struct
 import time
+from datetime import datetime, timedelta
+from sweep import DEFAULT_RATE, PROBE_TIMEOUT, Sweeper
+
+
+PROC_NET_ROUTE = '/proc/net/route'
+PROC_NET_ARP = '/proc/net/arp'
+DEFAULT_GATEWAY = "192.168.1.1"
+# Assumed when the netmask cannot be read
+DEFAULT_PREFIXLEN = 24
+# Larger subnets (a 10.0.0.0/8 corporate range) are swept as the /16 around the gateway
+MIN_SWEEP_PREFIXLEN = 16
+# ARP first: an ARP table with this many entries in the subnet is trusted
+# instead of sweeping it
+ARP_MIN_DEVICES = 3
+# Subnets with more addresses than this log sweep progress
+PROGRESS_MIN_ADDRESSES = 4096
+# Inventory: how often the whole subnet is swept for new devices (config
+# device_full_sweep_minutes), and how long a device stays on the list of
+# known hosts that incremental scans re-probe
+DEFAULT_FULL_SWEEP_MINUTES = 60
+DEVICE_KNOWN_DAYS = 7
+# Device counts change slowly: monitor runs reuse the last scan's count while
+# it is younger than this (config device_count_ttl_seconds)
+DEFAULT_DEVICE_COUNT_TTL_SECONDS = 600
+_RTF_UP = 0x1
+_RTF_GATEWAY = 0x2
+_ATF_COM = 0x2  # neighbour entry complete
+
+
+def _read_proc(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def parse_proc_route(text):
+    """
+    Default gateway from the contents of /proc/net/route.
+    Parameters:
+        text (str): The file's contents (a header line, then one route per line).
+    Returns:
+        str | None: The gateway of the lowest-metric default route, or None.
+    """
+    best = None
+    for line in text.splitlines()[1:]:
+        fields = line.split()
+        if len(fields) < 7:
+            continue
+        try:
+            destination, gateway, flags, metric = (int(fields[1], 16), int(fields[2], 16),
+                                                   int(fields[3], 16), int(fields[6]))
+        except ValueError:
+            continue
+        if destination == 0 and flags & _RTF_UP and flags & _RTF_GATEWAY:
+            if best is None or metric < best[0]:
+                # The kernel prints addresses as host-byte-order integers
+                best = (metric, socket.inet_ntoa(struct.pack('=L', gateway)))
+    return best[1] if best else None
+
+
+def parse_proc_networks(text):
+    """
+    Directly connected subnets from the contents of /proc/net/route.
+    Parameters:
+        text (str): The file's contents.
+    Returns:
+        list[tuple]: (interface, ipaddress.IPv4Network) per on-link route.
+    """
+    networks = []
+    for line in text.splitlines()[1:]:
+        fields = line.split()
+        if len(fields) < 8:
+            continue
+        try:
+            destination, flags, mask = int(fields[1], 16), int(fields[3], 16), int(fields[7], 16)
+        except ValueError:
+            continue
+        if destination and flags & _RTF_UP and not flags & _RTF_GATEWAY:
+            address = socket.inet_ntoa(struct.pack('=L', destination))
+            netmask = socket.inet_ntoa(struct.pack('=L', mask))
+            try:
+                networks.append((fields[0], ipaddress.IPv4Network(f"{address}/{netmask}", strict=False)))
+            except ValueError:
+                continue
+    return networks
+
+
+def parse_ifconfig(text):
+    """
+    IPv4 addresses with their netmasks from `ifconfig` output, e.g.
+    "inet 192.168.1.23 netmask 0xffffff00 broadcast 192.168.1.255" (macOS)
+    or "inet 10.0.0.5  netmask 255.255.0.0" (net-tools on Linux).
+    Parameters:
+        text (str): The command's output.
+    Returns:
+        list[ipaddress.IPv4Interface]: One per inet line.
+    """
+    interfaces = []
+    for address, netmask in re.findall(r'inet (?:addr:)?([\d.]+)[^\n]*?(?:netmask |Mask:)(0x[0-9a-fA-F]{8}|[\d.]+)', text):
+        if netmask.startswith('0x'):
+            netmask = socket.inet_ntoa(int(netmask, 16).to_bytes(4, 'big'))
+        try:
+            interfaces.append(ipaddress.IPv4Interface(f"{address}/{netmask}"))
+        except ValueError:
+            continue
+    return interfaces
+
+
+def parse_proc_arp(text):
+    """
+    Complete neighbour entries from the contents of /proc/net/arp.
+    Parameters:
+        text (str): The file's contents.
+    Returns:
+        list[tuple]: (ip, mac, interface) per complete entry.
+    """
+    entries = []
+    for line in text.splitlines()[1:]:
+        fields = line.split()
+        if len(fields) < 6:
+            continue
+        try:
+            flags = int(fields[2], 16)
+        except ValueError:
+            continue
+        if flags & _ATF_COM and fields[3] != '00:00:00:00:00:00':
+            entries.append((fields[0], normalize_mac(fields[3]), fields[5]))
+    return entries
+
+
+def normalize_mac(mac):
+    """Lower-case, zero-padded MAC ('0:11:a:..' as macOS prints it becomes '00:11:0a:..')"""
+    return ':'.join(octet.zfill(2) for octet in mac.lower().split(':'))
+
+
+def parse_arp_output(text):
+    """
+    Complete entries from BSD/macOS `arp -a` output, e.g.
+    "router (192.168.1.1) at 0:11:22:33:44:55 on en0 ifscope [ethernet]".
+    Parameters:
+        text (str): The command's output.
+    Returns:
+        list[tuple]: (ip, mac, interface) per complete entry; mac and
+            interface are None where the line lacks them.
+    """
+    entries = []
+    for line in text.split('\n'):
+        ip_match = re.search(r'\(([\d.]+)\)', line)
+        if ip_match and 'incomplete' not in line.lower():
+            mac_match = re.search(r' at ([0-9a-fA-F:]+)', line)
+            interface_match = re.search(r' on (\S+)', line)
+            entries.append((ip_match.group(1),
+                            normalize_mac(mac_match.group(1)) if mac_match else None,
+                            interface_match.group(1) if interface_match else None))
+    return entries
 
 
 def print_device_scanner_table(scanner):
@@ -60,13 +240,13 @@ def print_device_scanner_table(scanner):
     start_time = time.time()
     arp_devices = scanner.scan_arp_table()
     arp_count = len(arp_devices)
-    ping_devices = scanner.scan_network_range(max_workers=15)
+    ping_devices = scanner.scan_network_range()
     ping_count = len(ping_devices)
     nmap_count = scanner.get_router_device_count()
     scan_time = time.time() - start_time
     summary_rows = [
         ["Gateway IP", scanner.gateway_ip],
-        ["Network Prefix", scanner.network_prefix],
+        ["Network", str(scanner.network)],
         ["ARP Table Devices", str(arp_count)],
         ["Ping Scan Devices", str(ping_count)],
         ["Nmap Devices", str(nmap_count) if nmap_count is not None else "N/A"],
@@ -76,21 +256,37 @@ def print_device_scanner_table(scanner):
     
 
 class DeviceScanner:
-    def __init__(self):
+    def __init__(self, timeout=PROBE_TIMEOUT, rate=DEFAULT_RATE, db=None):
         """
         Initializes the DeviceScanner instance.
-        Sets gateway_ip and network_prefix for the local network.
+        Sets gateway_ip and network for the local network.
+        Parameters:
+            timeout (float): Seconds each probe waits for an answer.
+            rate (float): Probes started per second during a sweep.
+            db (WiFiSpeedDB): Keeps the device inventory; without it every
+                count starts from nothing (see count_active_devices).
         """
+        self.db = db
         self.gateway_ip = self.get_default_gateway()
-        self.network_prefix = self.get_network_prefix()
+        self.network = self.get_network()
+        self.sweeper = Sweeper(timeout=timeout, rate=rate)
+        # threading.Event that ends a scan early (see run_control); probes
+        # not yet answered when it is set count as unreachable
+        self.cancel = None
 
     def get_default_gateway(self):
         """
-        Returns the default gateway IP address as a string.
+        Returns the default gateway IP address as a string. On Linux it is
+        read from /proc/net/route; elsewhere `route -n get default` is run.
         No parameters.
         Returns:
             str: Gateway IP address (e.g. '192.168.1.1')
         """
+        routes = _read_proc(PROC_NET_ROUTE)
+        if routes is not None:
+            gateway = parse_proc_route(routes)
+            if gateway:
+                return gateway
         try:
             result = subprocess.run(['route', '-n', 'get', 'default'], 
                                   capture_output=True, text=True)
@@ -99,32 +295,47 @@ class DeviceScanner:
                     return line.split(':')[1].strip()
         except:
             pass
-        return "192.168.1.1"
+        return DEFAULT_GATEWAY
 
-    def get_network_prefix(self):
+    def get_network(self):
         """
-        Returns the network prefix for the local subnet.
+        Returns the local subnet: the on-link network containing the gateway,
+        with the interface's real netmask (/proc/net/route on Linux,
+        `ifconfig` elsewhere). Falls back to the /DEFAULT_PREFIXLEN around
+        the gateway, and narrows anything larger than /MIN_SWEEP_PREFIXLEN.
         No parameters.
         Returns:
-            str: Network prefix (e.g. '192.168.1')
+            ipaddress.IPv4Network: e.g. 192.168.0.0/22
         """
-        gateway_parts = self.gateway_ip.split('.')
-        return f"{gateway_parts[0]}.{gateway_parts[1]}.{gateway_parts[2]}"
+        gateway = ipaddress.IPv4Address(self.gateway_ip)
+        routes = _read_proc(PROC_NET_ROUTE)
+        if routes is not None:
+            candidates = [network for _, network in parse_proc_networks(routes)]
+        else:
+            try:
+                result = subprocess.run(['ifconfig'], capture_output=True, text=True, timeout=5)
+                candidates = [interface.network for interface in parse_ifconfig(result.stdout)]
+            except:
+                candidates = []
+        candidates = [network for network in candidates if gateway in network and network.prefixlen < 32]
+        if candidates:
+            network = max(candidates, key=lambda network: network.prefixlen)
+        else:
+            network = ipaddress.IPv4Network(f"{gateway}/{DEFAULT_PREFIXLEN}", strict=False)
+        if network.prefixlen < MIN_SWEEP_PREFIXLEN:
+            logging.warning(f"{network} is too large to sweep; using the /{MIN_SWEEP_PREFIXLEN} around the gateway")
+            network = ipaddress.IPv4Network(f"{gateway}/{MIN_SWEEP_PREFIXLEN}", strict=False)
+        return network
 
     def ping_host(self, ip):
         """
-        Pings a given IP address to check if it is reachable.
+        Probes a given IP address to check if it is reachable.
         Parameters:
-            ip (str): IP address to ping.
+            ip (str): IP address to probe.
         Returns:
             bool: True if host responds, False otherwise.
         """
-        try:
-            result = subprocess.run(['ping', '-c', '1', '-W', '1000', ip], 
-                                  capture_output=True, timeout=2)
-            return result.returncode == 0
-        except:
-            return False
+        return bool(self.sweeper.sweep([ip], self.cancel))
 
     def scan_arp_table(self):
         """
@@ -133,38 +344,47 @@ class DeviceScanner:
         Returns:
             list[str]: List of IP addresses found in ARP table.
         """
+        return list({ip for ip, _, _ in self.arp_entries() if ipaddress.IPv4Address(ip) in self.network})
+
+    def arp_entries(self):
+        """
+        Complete ARP (neighbour) entries: /proc/net/arp on Linux, `arp -a` elsewhere.
+        No parameters.
+        Returns:
+            list[tuple]: (ip, mac, interface) per entry; [] if neither is available.
+        """
+        neighbours = _read_proc(PROC_NET_ARP)
+        if neighbours is not None:
+            return parse_proc_arp(neighbours)
         try:
             result = subprocess.run(['arp', '-a'], capture_output=True, text=True)
-            active_devices = []
-            for line in result.stdout.split('\n'):
-                ip_match = re.search(r'\(([\d.]+)\)', line)
-                if ip_match and 'incomplete' not in line.lower():
-                    ip = ip_match.group(1)
-                    if ip.startswith(self.network_prefix):
-                        active_devices.append(ip)
-            return list(set(active_devices))
+            return parse_arp_output(result.stdout)
         except:
             return []
 
-    def scan_network_range(self, max_workers=20):
+    def scan_network_range(self, concurrency=None):
         """
-        Pings all IPs in the subnet using threads to find active devices.
+        Probes all IPs in the subnet to find active devices. Addresses are
+        probed concurrently on one event loop, so a /24 takes about one probe
+        timeout however few hosts answer; larger subnets are streamed at the
+        sweeper's rate, with progress logged.
         Parameters:
-            max_workers (int): Number of threads to use (default 20).
+            concurrency (int): Sockets open at once (default: see sweep.py).
         Returns:
             list[str]: List of reachable IP addresses.
         """
-        active_devices = []
-        ip_range = [f"{self.network_prefix}.{i}" for i in range(1, 255)]
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_ip = {executor.submit(self.ping_host, ip): ip for ip in ip_range}
-            for future in as_completed(future_to_ip):
-                ip = future_to_ip[future]
-                try:
-                    if future.result():
-                        active_devices.append(ip)
-                except:
-                    pass
+        return self._sweep(self.network.hosts(), max(self.network.num_addresses - 2, 1), concurrency)
+
+    def _sweep(self, hosts, total, concurrency=None):
+        sweeper = self.sweeper
+        if concurrency:
+            sweeper = Sweeper(self.sweeper.timeout, concurrency, rate=self.sweeper.rate)
+        progress = None
+        if total > PROGRESS_MIN_ADDRESSES:
+            def progress(probed, found):
+                logging.info(f"Swept {probed:,}/{total:,} addresses in {self.network}, {found} up")
+        active_devices = sweeper.sweep(hosts, self.cancel, progress)
+        logging.debug(f"Swept {total:,} addresses in {self.network} by {sweeper.method}")
         return active_devices
 
     def get_router_device_count(self):
@@ -175,29 +395,133 @@ class DeviceScanner:
             int or None: Number of devices found, or None if scan fails.
         """
         try:
-            result = subprocess.run(['nmap', '-sn', f"{self.network_prefix}.0/24"], 
+            result = subprocess.run(['nmap', '-sn', str(self.network)], 
                                   capture_output=True, text=True, timeout=30)
             host_count = len(re.findall(r'Nmap scan report for', result.stdout))
             return host_count if host_count > 0 else None
         except:
             return None
 
-    def count_active_devices(self):
+    def count_devices_cached(self, force=False, full=None):
+        """
+        The device count monitor runs use. The last scan is stored in
+        device_scans, so its count is shared by every run (cron runs are
+        separate processes) and reused while it is younger than the
+        device_count_ttl_seconds config (default DEFAULT_DEVICE_COUNT_TTL_SECONDS).
+        Without a database every call scans.
+        Parameters:
+            force (bool): Scan now whatever the age of the last count.
+            full (bool): Passed to count_active_devices when a scan is made.
+        Returns:
+            tuple: (count, age_seconds); age is 0 for a count scanned by this call.
+        """
+        if self.db is not None and not force:
+            last = self.db.get_last_device_count()
+            ttl = self.db.get_config_number('device_count_ttl_seconds', DEFAULT_DEVICE_COUNT_TTL_SECONDS)
+            if last is not None:
+                timestamp, active = last
+                age = (datetime.now() - datetime.fromisoformat(str(timestamp))).total_seconds()
+                if 0 <= age < ttl:
+                    logging.info(f"Reusing device count {active} from {age:.0f} s ago (TTL {ttl:g} s)")
+                    return max(active, 1), age
+        return self.count_active_devices(full), 0.0
+
+    def full_sweep_due(self, now=None):
+        """
+        True when the inventory needs a full sweep: it has never had one, or
+        the last is older than the device_full_sweep_minutes config
+        (default DEFAULT_FULL_SWEEP_MINUTES).
+        """
+        last = self.db.get_last_device_scan_time('full')
+        if last is None:
+            return True
+        minutes = self.db.get_config_number('device_full_sweep_minutes', DEFAULT_FULL_SWEEP_MINUTES)
+        return (now or datetime.now()) - datetime.fromisoformat(str(last)) >= timedelta(minutes=minutes)
+
+    def inventory_scan(self, full=None):
+        """
+        One scan against the device inventory. An incremental scan probes
+        only the inventory's recently seen devices (DEVICE_KNOWN_DAYS), the
+        current ARP entries, the gateway and this host, so it costs O(known devices);
+        a full scan sweeps the whole subnet, to find new devices. The ARP
+        table is read again afterwards: probing refreshes the entries of
+        devices that are there and drops those that have left, and it gives
+        the MACs of the hosts that answered. Devices present are those that
+        answered or have a complete ARP entry, as the ARP-only count was.
+        ARP first, as without a database: while the ARP table has at least
+        ARP_MIN_DEVICES entries in the subnet the scan stays incremental, so
+        a full sweep only runs when forced or when the ARP table is sparse.
+        Parameters:
+            full (bool): Force a full (True) or incremental (False) scan;
+                by default full when the ARP table is sparse and
+                full_sweep_due().
+        Returns:
+            int: Devices present (minimum 1).
+        """
+        timestamp = datetime.now()
+        before = self._arp_in_network()
+        if full is None:
+            full = len(before) < ARP_MIN_DEVICES and self.full_sweep_due(timestamp)
+        if full:
+            targets, probed = self.network.hosts(), max(self.network.num_addresses - 2, 1)
+        else:
+            known = self.db.get_known_devices(timestamp - timedelta(days=DEVICE_KNOWN_DAYS))
+            # This host answers a full sweep but has no ARP entry, so it is
+            # probed explicitly to keep the two kinds of count comparable
+            addresses = {ip for _, ip in known if ip} | set(before) | {self.gateway_ip, self._local_address()}
+            targets = sorted((ip for ip in addresses if ipaddress.IPv4Address(ip) in self.network),
+                             key=ipaddress.IPv4Address)
+            probed = len(targets)
+        responders = self._sweep(targets, probed)
+        after = self._arp_in_network()
+        present = {ip: after.get(ip, (None, None)) for ip in responders}
+        for ip, (mac, interface) in after.items():
+            present.setdefault(ip, (mac, interface))
+        kind = 'full' if full else 'incremental'
+        duration_ms = (datetime.now() - timestamp).total_seconds() * 1000
+        self.db.record_device_scan(timestamp, kind, str(self.network), probed,
+                                   [(ip, mac, interface) for ip, (mac, interface) in present.items()],
+                                   duration_ms)
+        logging.info(f"{kind.capitalize()} device scan: probed {probed:,} addresses, "
+                     f"{len(present)} devices present ({duration_ms / 1000:.1f} s)")
+        return max(len(present), 1)
+
+    def _local_address(self):
+        """This host's address on the gateway's subnet (connecting a UDP socket sends nothing)"""
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                sock.connect((self.gateway_ip, 9))
+                return sock.getsockname()[0]
+        except OSError:
+            return self.gateway_ip
+
+    def _arp_in_network(self):
+        """ip -> (mac, interface) of the complete ARP entries in the subnet"""
+        return {ip: (mac, interface) for ip, mac, interface in self.arp_entries()
+                if ipaddress.IPv4Address(ip) in self.network}
+
+    def count_active_devices(self, full=None):
         """
         Combines ARP and ping scans to estimate the number of active devices on the network.
-        No parameters.
+        With a database this is inventory_scan(full); otherwise the ARP table is
+        used when it has at least ARP_MIN_DEVICES entries, and a sweep of the subnet when not.
+        Parameters:
+            full (bool): With a database, force a full (True) or incremental
+                (False) scan; None lets inventory_scan decide.
         Returns:
             int: Estimated number of active devices (minimum 1).
         """
+        if self.db is not None:
+            return self.inventory_scan(full)
         logging.info("Scanning for active devices on network...")
         start_time = time.time()
         arp_devices = self.scan_arp_table()
         logging.info(f"Found {len(arp_devices)} devices in ARP table")
-        if len(arp_devices) >= 3:
+        if len(arp_devices) >= ARP_MIN_DEVICES:
             device_count = len(arp_devices)
         else:
             logging.info("ARP table has few entries, performing network scan...")
-            ping_devices = self.scan_network_range(max_workers=15)
+            ping_devices = self.scan_network_range()
             device_count = len(ping_devices)
             logging.info(f"Found {device_count} devices via ping scan")
         scan_time = time.time() - start_time
@@ -205,5 +529,20 @@ class DeviceScanner:
         return max(device_count, 1)
 
 if __name__ == "__main__":
-    scanner = DeviceScanner()
-    print_device_scanner_table(scanner)
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description='Count devices on the local network')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Scan now and store the count, replacing the one monitor runs reuse')
+    parser.add_argument('--full', action='store_true',
+                        help='With --refresh, sweep the whole subnet even if the ARP table is populated')
+    args = parser.parse_args()
+    if args.refresh:
+        from database import WiFiSpeedDB
+        db = WiFiSpeedDB()
+        scanner = DeviceScanner(db=db)
+        count, _ = scanner.count_devices_cached(force=True, full=args.full or None)
+        print(f"🔍 {count} active devices on {scanner.network} (gateway {scanner.gateway_ip})")
+        db.close()
+    else:
+        scanner = DeviceScanner()
+        print_device_scanner_table(scanner)
\ No newline at end of file
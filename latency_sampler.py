@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+LatencySampler
+==============
+
+Purpose:
+--------
+This module provides the LatencySampler class, which measures the round trip
+to the default gateway several times a second between speed tests, so
+latency spikes that a once-per-test ping misses are recorded. Samples go into
+a fixed-size ring buffer (two preallocated arrays, no per-sample objects) and
+are written to latency_batches once per flush interval: one row per minute
+holding the samples as packed arrays, all rows of a flush in one commit.
+
+Each sample is an ICMP echo over an unprivileged datagram socket (macOS, and
+Linux when net.ipv4.ping_group_range allows it), or a TCP connect to
+TCP_PORT where ICMP is not permitted; a refused connection still measures
+one round trip. A reply that does not arrive within the sample interval
+counts as lost, as does a socket error (the link dropping raises ENETUNREACH
+and the like), so an outage is recorded rather than ending the sampler. Samples taken during a speed test show latency under load.
+
+Storage:
+--------
+latency_batches.offsets holds uint16 milliseconds from the start of the minute
+and latency_batches.rtts float32 round trips in ms (NaN for a lost sample),
+both little-endian: 6 bytes per sample, ~3.5 KB per minute at 10 Hz.
+
+Class:
+------
+LatencySampler
+    Methods:
+    ---------
+    __init__(self, db, host, hz=DEFAULT_HZ, flush_seconds=60)
+        Samples host hz times a second.
+
+    start(self) / stop(self)
+        Runs in a daemon thread; stop() flushes what is buffered.
+
+    sample(self) -> float | None
+        One round trip in ms, or None if lost.
+
+minute_stats(db, start, end=None) -> list[dict]
+    Per-minute sample count, p50, p99, jitter (mean change between
+    consecutive round trips) and loss percentage.
+
+Usage:
+------
+sampler = LatencySampler(db, DeviceScanner().gateway_ip, hz=5).start()
+...
+sampler.stop()
+for minute in minute_stats(db, datetime.now() - timedelta(hours=1)):
+    print(minute)
+
+python3 latency_sampler.py --hz 10           # sample until Ctrl-C
+python3 latency_sampler.py --report 60       # last 60 minutes
+"""
+import argparse
+import errno
+import itertools
+import logging
+import math
+import signal
+import socket
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta
+from database import percentile
+from sweep import echo_reply_sequence, echo_request
+
+DEFAULT_HZ = 5
+MAX_HZ = 10
+TCP_PORT = 53
+
+
+def _little_endian(values):
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def encode_batch(offsets, rtts):
+    """Packs one minute of samples for latency_batches"""
+    return _little_endian(offsets), _little_endian(rtts)
+
+
+def decode_batch(offsets_blob, rtts_blob):
+    """Inverse of encode_batch: (offsets array('H'), rtts array('f'))"""
+    offsets, rtts = array('H'), array('f')
+    offsets.frombytes(offsets_blob)
+    rtts.frombytes(rtts_blob)
+    if sys.byteorder == 'big':
+        offsets.byteswap()
+        rtts.byteswap()
+    return offsets, rtts
+
+
+class LatencySampler:
+    def __init__(self, db, host, hz=DEFAULT_HZ, flush_seconds=60):
+        """
+        Creates (but does not start) a sampler.
+        Parameters:
+            db (WiFiSpeedDB): Database to flush batches into.
+            host (str): Address to measure, normally the default gateway.
+            hz (float): Samples per second, 1 to MAX_HZ.
+            flush_seconds (float): How often buffered samples are written.
+        """
+        self.db = db
+        self.host = host
+        self.interval = 1.0 / min(max(hz, 1), MAX_HZ)
+        self.flush_seconds = flush_seconds
+        # Room for two flush intervals, so a slow commit never overwrites
+        # samples that have not been written yet
+        capacity = int(2 * flush_seconds / self.interval) + 1
+        self.times = array('d', bytes(8 * capacity))
+        self.rtts = array('f', bytes(4 * capacity))
+        self.capacity = capacity
+        self.written = 0  # samples ever recorded
+        self.flushed = 0  # samples ever written to the database
+        self.dropped = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+        self._sequence = itertools.count()
+        self._socket = None
+        self.method = None
+
+    def _open_socket(self):
+        try:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+            self.method = 'icmp'
+        except OSError:
+            self._socket = None
+            self.method = 'tcp'
+
+    def sample(self):
+        """
+        Measures one round trip to host.
+        Returns:
+            float | None: Round trip in ms, or None if no reply within the interval.
+        """
+        if self.method is None:
+            self._open_socket()
+        if self.method == 'icmp':
+            return self._sample_icmp()
+        return self._sample_tcp()
+
+    def _sample_icmp(self):
+        sequence = next(self._sequence) & 0xffff
+        sock = self._socket
+        start = time.perf_counter()
+        deadline = start + self.interval
+        try:
+            sock.sendto(echo_request(sequence), (self.host, 0))
+            while True:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return None
+                sock.settimeout(remaining)
+                reply = sock.recv(1024)
+                if echo_reply_sequence(reply) == sequence:
+                    return (time.perf_counter() - start) * 1000
+        except OSError:
+            # Timed out, or the link is down (ENETUNREACH, EHOSTUNREACH, ...):
+            # either way the sample is lost, which is what a drop should record
+            return None
+
+    def _sample_tcp(self):
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        except OSError:
+            return None
+        sock.settimeout(self.interval)
+        start = time.perf_counter()
+        try:
+            result = sock.connect_ex((self.host, TCP_PORT))
+        except OSError:
+            return None
+        finally:
+            sock.close()
+        if result in (0, errno.ECONNREFUSED):
+            return (time.perf_counter() - start) * 1000
+        return None
+
+    def record(self, timestamp, rtt):
+        """Stores one sample (None for lost) in the ring buffer"""
+        if self.written - self.flushed == self.capacity:
+            # Buffer full: the database has been unavailable for a while
+            self.flushed += 1
+            self.dropped += 1
+        slot = self.written % self.capacity
+        self.times[slot] = timestamp
+        self.rtts[slot] = math.nan if rtt is None else rtt
+        self.written += 1
+
+    def flush(self):
+        """
+        Writes buffered samples to latency_batches, one row per minute, in a
+        single transaction.
+        Returns:
+            int: Samples written.
+        """
+        count = self.written - self.flushed
+        if not count:
+            return 0
+        batches = []
+        minute = None
+        for index in range(self.flushed, self.written):
+            slot = index % self.capacity
+            timestamp = self.times[slot]
+            start = timestamp - timestamp % 60
+            if start != minute:
+                minute = start
+                offsets, rtts = array('H'), array('f')
+                batches.append((minute, offsets, rtts))
+            offsets.append(int((timestamp - minute) * 1000))
+            rtts.append(self.rtts[slot])
+        rows = [(datetime.fromtimestamp(minute).isoformat(sep=' ', timespec='minutes'), self.host,
+                 len(offsets), *encode_batch(offsets, rtts))
+                for minute, offsets, rtts in batches]
+        self.db.insert_latency_batches(rows)
+        self.flushed = self.written
+        return count
+
+    def run(self):
+        """Samples on a drift-corrected schedule until stop(), flushing periodically"""
+        tick = time.monotonic()
+        next_flush = tick + self.flush_seconds
+        try:
+            while not self.stop_event.is_set():
+                timestamp = time.time()
+                self.record(timestamp, self.sample())
+                now = time.monotonic()
+                if now >= next_flush:
+                    try:
+                        self.flush()
+                    except Exception as e:
+                        logging.warning(f"Latency flush failed, keeping samples buffered: {e}")
+                    next_flush = now + self.flush_seconds
+                tick += self.interval
+                if tick < now:
+                    # Overran (slow flush): resume on the grid instead of bursting
+                    tick += (now - tick) // self.interval * self.interval + self.interval
+                self.stop_event.wait(tick - time.monotonic())
+        finally:
+            # Also when sampling fails unexpectedly: what is buffered is kept
+            try:
+                self.flush()
+            finally:
+                if self._socket:
+                    self._socket.close()
+
+    def start(self):
+        """Samples from a background thread"""
+        self.thread = threading.Thread(target=self.run, name='latency-sampler', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stops sampling and waits for the final flush"""
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+
+
+def minute_stats(db, start, end=None):
+    """
+    Per-minute latency statistics from latency_batches.
+    Parameters:
+        db (WiFiSpeedDB): Database to read.
+        start (datetime): First minute to include.
+        end (datetime): End of the range (exclusive), default after the current minute.
+    Returns:
+        list: Dicts with minute, host, samples, p50_ms, p99_ms, jitter_ms
+            and loss_pct (latencies are None when every sample was lost).
+    """
+    minutes = {}
+    end = end or datetime.now() + timedelta(minutes=1)
+    for minute, host, offsets_blob, rtts_blob in db.get_latency_batches(start, end):
+        offsets, rtts = decode_batch(offsets_blob, rtts_blob)
+        minutes.setdefault((minute, host), []).extend(zip(offsets, rtts))
+
+    stats = []
+    for (minute, host), samples in minutes.items():
+        samples.sort()
+        received = [rtt for _, rtt in samples if not math.isnan(rtt)]
+        changes = [abs(b - a) for a, b in zip(received, received[1:])]
+        stats.append({
+            'minute': minute,
+            'host': host,
+            'samples': len(samples),
+            'p50_ms': percentile(received, 50) if received else None,
+            'p99_ms': percentile(received, 99) if received else None,
+            'jitter_ms': sum(changes) / len(changes) if changes else 0.0,
+            'loss_pct': (len(samples) - len(received)) / len(samples) * 100,
+        })
+    return stats
+
+
+def print_report(db, minutes):
+    stats = minute_stats(db, datetime.now() - timedelta(minutes=minutes))
+    if not stats:
+        print("No latency samples found. Start one with: python3 latency_sampler.py")
+        return
+    print(f"\n📶 Gateway latency, last {minutes} minutes")
+    print("=" * 88)
+    print(f"{'Minute':<18} {'Host':<16} {'Samples':>8} {'p50':>10} {'p99':>10} {'Jitter':>10} {'Loss':>8}")
+    print("-" * 88)
+    for row in stats:
+        p50 = f"{row['p50_ms']:.1f} ms" if row['p50_ms'] is not None else "-"
+        p99 = f"{row['p99_ms']:.1f} ms" if row['p99_ms'] is not None else "-"
+        print(f"{row['minute']:<18} {row['host']:<16} {row['samples']:>8} {p50:>10} {p99:>10} "
+              f"{row['jitter_ms']:>7.1f} ms {row['loss_pct']:>7.1f}%")
+
+
+def main():
+    from database import WiFiSpeedDB
+    from device_scanner import DeviceScanner
+    parser = argparse.ArgumentParser(description='Sample gateway latency or report per-minute statistics')
+    parser.add_argument('--hz', type=float, default=DEFAULT_HZ, help=f'Samples per second, up to {MAX_HZ} (default: {DEFAULT_HZ})')
+    parser.add_argument('--host', help='Address to sample (default: the default gateway)')
+    parser.add_argument('--report', type=int, metavar='MINUTES', help='Print per-minute statistics and exit')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    db = WiFiSpeedDB()
+    if args.report:
+        print_report(db, args.report)
+        return
+    sampler = LatencySampler(db, args.host or DeviceScanner().gateway_ip, args.hz)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sampler.stop_event.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: sampler.stop_event.set())
+    sampler.start()
+    logging.info(f"Sampling {sampler.host} at {1 / sampler.interval:g} Hz; Ctrl-C to stop")
+    while sampler.thread.is_alive():
+        sampler.thread.join(1)
+    logging.info(f"Stopped after {sampler.written} samples via {sampler.method}")
+
+if __name__ == "__main__":
+    main()
@@ -164,7 +164,7 @@ class WiFiMonitorMenu:
         self.run_command("python3 wifi_monitor.py", "Running speed test")
     
     def count_devices(self):
-        self.run_command("python3 device_scanner.py", "Scanning network devices")
+        self.run_command("python3 device_scanner.py --refresh", "Scanning network devices")
     
     def view_recent_tests(self):
         print("\n📊 Recent Speed Tests")
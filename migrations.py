@@ -0,0 +1,329 @@
+"""
+Schema migrations for wifi_speed.db.
+
+Each migration is a function taking a cursor, registered in MIGRATIONS under
+the PRAGMA user_version it brings the database to. WiFiSpeedDB.init_database
+runs every migration newer than the stored version inside one transaction and
+then records SCHEMA_VERSION, so an up-to-date database only pays for a single
+version read. Steps that SQLite refuses inside a transaction (VACUUM,
+file-level pragmas) go in CONNECTION_MIGRATIONS instead; they take the
+connection and run first, in autocommit. Migrations must stay idempotent: databases created before
+versioning existed start at version 0 with some tables already present.
+To change the schema, append a new migration; never edit a released one.
+Column changes to speed_tests must go through partitions.physical_tables, since
+a partitioned database stores it as one table per month behind a view.
+"""
+import partitions
+
+
+def add_column(cursor, table, column, definition):
+    """Add a column unless it already exists (ALTER TABLE has no IF NOT EXISTS)"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    columns = [row[1] for row in cursor.fetchall()]
+    if column not in columns:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+def create_base_schema(cursor):
+    """Original tables: speed tests, plans, summaries and config"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS speed_tests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME NOT NULL,
+            download_speed REAL NOT NULL,
+            upload_speed REAL NOT NULL,
+            ping REAL NOT NULL,
+            server_name TEXT,
+            server_location TEXT,
+            device_count INTEGER
+        )
+    ''')
+    add_column(cursor, 'speed_tests', 'device_count', 'INTEGER')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS plan_speeds (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            plan_name TEXT NOT NULL,
+            download_mbps REAL NOT NULL,
+            upload_mbps REAL NOT NULL,
+            created_date DATETIME NOT NULL,
+            is_active INTEGER DEFAULT 1
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_summary (
+            day DATE PRIMARY KEY,
+            sample_count INTEGER NOT NULL,
+            median_download_mbps REAL NOT NULL,
+            median_upload_mbps REAL NOT NULL,
+            p95_ping_ms REAL NOT NULL,
+            pct_bad REAL NOT NULL,
+            avg_device_count REAL,
+            status TEXT CHECK(status IN ('good', 'meh', 'bad', 'no_data')),
+            created_at DATETIME NOT NULL
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS weekly_summary (
+            week_start DATE PRIMARY KEY,
+            week_end DATE NOT NULL,
+            days_with_data INTEGER NOT NULL,
+            total_samples INTEGER NOT NULL,
+            avg_download_mbps REAL NOT NULL,
+            avg_upload_mbps REAL NOT NULL,
+            avg_ping_ms REAL NOT NULL,
+            weekly_pct_bad REAL NOT NULL,
+            good_days INTEGER DEFAULT 0,
+            meh_days INTEGER DEFAULT 0,
+            bad_days INTEGER DEFAULT 0,
+            no_data_days INTEGER DEFAULT 0,
+            status TEXT CHECK(status IN ('excellent', 'good', 'poor', 'bad')),
+            created_at DATETIME NOT NULL
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS config (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated_at DATETIME NOT NULL
+        )
+    ''')
+
+
+def add_timestamp_index(cursor):
+    """Index for half-open timestamp range queries"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_speed_tests_timestamp ON speed_tests(timestamp)')
+
+
+def add_incremental_summaries(cursor):
+    """Running per-day aggregates and the dirty-day queue for bulk inserts"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_aggregates (
+            day DATE PRIMARY KEY,
+            sample_count INTEGER NOT NULL,
+            sum_download REAL NOT NULL,
+            sum_upload REAL NOT NULL,
+            sum_ping REAL NOT NULL,
+            device_sum REAL NOT NULL,
+            device_samples INTEGER NOT NULL,
+            bad_count INTEGER NOT NULL,
+            download_sketch BLOB NOT NULL,
+            upload_sketch BLOB NOT NULL,
+            ping_sketch BLOB NOT NULL,
+            updated_at DATETIME NOT NULL
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS summary_dirty (
+            day DATE PRIMARY KEY,
+            marked_at DATETIME NOT NULL
+        )
+    ''')
+
+
+def add_partition_catalog(cursor):
+    """Catalog and id sequence for the optional monthly layout (see partitions)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS speed_test_partitions (
+            month TEXT PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            start_ts TEXT NOT NULL,
+            end_ts TEXT NOT NULL,
+            created_at DATETIME NOT NULL
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS speed_test_sequence (
+            next_id INTEGER NOT NULL
+        )
+    ''')
+
+
+def enable_incremental_vacuum(conn):
+    """
+    auto_vacuum=INCREMENTAL, so cleanup can return free pages in bounded steps
+    instead of a full VACUUM. The setting only takes effect through a VACUUM
+    once the file has a header (even an empty WAL database has one), so this
+    rewrites the database once; that is near-instant for a new file.
+    """
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        return
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+
+
+def add_probe_tier(cursor):
+    """Probe results table and the tier that produced each full test (see probing)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS probe_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME NOT NULL,
+            latency_ms REAL NOT NULL,
+            download_mbps REAL,
+            bytes INTEGER,
+            server_name TEXT,
+            full_test TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_probe_results_timestamp ON probe_results(timestamp)')
+
+    for table in partitions.physical_tables(cursor):
+        add_column(cursor, table, 'tier', 'TEXT')
+
+
+def add_latency_batches(cursor):
+    """Packed per-minute gateway latency samples (see latency_sampler)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS latency_batches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            minute TEXT NOT NULL,
+            host TEXT NOT NULL,
+            sample_count INTEGER NOT NULL,
+            offsets BLOB NOT NULL,
+            rtts BLOB NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_latency_batches_minute ON latency_batches(minute)')
+
+
+def add_server_measurements(cursor):
+    """Per-server results of fan-out runs, linked to their speed test"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS server_measurements (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            test_id INTEGER NOT NULL,
+            timestamp DATETIME NOT NULL,
+            server_name TEXT,
+            server_location TEXT,
+            latency_ms REAL,
+            download_mbps REAL,
+            bytes INTEGER,
+            elapsed_ms REAL,
+            status TEXT CHECK(status IN ('ok', 'timeout', 'error'))
+        )
+    ''')
+    # test_id is not a foreign key: partitioned speed_tests is a view
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_server_measurements_test ON server_measurements(test_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_server_measurements_timestamp ON server_measurements(timestamp)')
+
+
+def add_monitor_runs(cursor):
+    """Outcome of every monitor tick, including the ones that did not test"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS monitor_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME NOT NULL,
+            mode TEXT,
+            status TEXT NOT NULL CHECK(status IN ('ok', 'partial', 'timeout', 'failed', 'overlap', 'skipped')),
+            phase TEXT,
+            duration_ms REAL,
+            detail TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_monitor_runs_timestamp ON monitor_runs(timestamp)')
+
+
+def add_run_phases(cursor):
+    """Per-phase wall clock, CPU and peak RSS of every run"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS run_phases (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            test_id INTEGER,
+            timestamp DATETIME NOT NULL,
+            phase TEXT NOT NULL,
+            duration_ms REAL,
+            cpu_ms REAL,
+            peak_rss_kb INTEGER,
+            status TEXT CHECK(status IN ('ok', 'timeout', 'error'))
+        )
+    ''')
+    # test_id is NULL for runs that saved no speed test (probe only, timed
+    # out); like server_measurements it is not a foreign key
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_run_phases_test ON run_phases(test_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_run_phases_timestamp ON run_phases(timestamp)')
+
+
+def add_device_inventory(cursor):
+    """Devices seen on the network, keyed by MAC, and which were present in each scan"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS devices (
+            mac TEXT PRIMARY KEY,
+            last_ip TEXT,
+            interface TEXT,
+            first_seen DATETIME NOT NULL,
+            last_seen DATETIME NOT NULL,
+            times_seen INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_devices_last_seen ON devices(last_seen)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS device_scans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME NOT NULL,
+            kind TEXT NOT NULL CHECK(kind IN ('full', 'incremental')),
+            network TEXT,
+            probed INTEGER,
+            active INTEGER,
+            duration_ms REAL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_device_scans_timestamp ON device_scans(timestamp)')
+    # Presence history: one row per device per scan it was seen in
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS device_presence (
+            scan_id INTEGER NOT NULL,
+            mac TEXT NOT NULL,
+            ip TEXT,
+            PRIMARY KEY (scan_id, mac)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_device_presence_mac ON device_presence(mac, scan_id)')
+
+
+def add_device_count_age(cursor):
+    """How old the device count stored with each test was (counts are cached between runs)"""
+    for table in partitions.physical_tables(cursor):
+        add_column(cursor, table, 'device_count_age_seconds', 'REAL')
+
+
+def add_departure_counts(cursor):
+    """
+    Per-day counts of full tests a probe departure triggered, which pct_bad
+    leaves out (they run because the link already looked bad). Days that
+    have such tests are queued for a summary rebuild.
+    """
+    add_column(cursor, 'daily_aggregates', 'departure_count', 'INTEGER NOT NULL DEFAULT 0')
+    add_column(cursor, 'daily_aggregates', 'departure_bad', 'INTEGER NOT NULL DEFAULT 0')
+    add_column(cursor, 'daily_summary', 'departure_tests', 'INTEGER NOT NULL DEFAULT 0')
+    cursor.execute('''
+        INSERT OR IGNORE INTO summary_dirty (day, marked_at)
+        SELECT DISTINCT SUBSTR(timestamp, 1, 10), CURRENT_TIMESTAMP
+        FROM speed_tests WHERE tier = 'departure'
+    ''')
+
+
+MIGRATIONS = [
+    (1, create_base_schema),
+    (2, add_timestamp_index),
+    (3, add_incremental_summaries),
+    (4, add_partition_catalog),
+    (6, add_probe_tier),
+    (7, add_latency_batches),
+    (8, add_server_measurements),
+    (9, add_monitor_runs),
+    (10, add_run_phases),
+    (11, add_device_inventory),
+    (12, add_device_count_age),
+    (13, add_departure_counts),
+]
+
+CONNECTION_MIGRATIONS = [
+    (5, enable_incremental_vacuum),
+]
+
+SCHEMA_VERSION = max(MIGRATIONS[-1][0], CONNECTION_MIGRATIONS[-1][0])
@@ -0,0 +1,241 @@
+"""
+Monthly partitions for speed_tests.
+
+An optional storage layout, switched on once with enable(). Rows then live in
+one table per calendar month (speed_tests_YYYY_MM, each with its own timestamp
+index) listed in speed_test_partitions, and speed_tests becomes a UNION ALL
+view over them so existing readers keep working. Range queries can name only
+the months they overlap through source(), writes are routed with
+insert_rows(), and retention drops whole months with drop_before() instead of
+deleting rows and vacuuming. Ids stay unique across months through
+speed_test_sequence.
+
+Partitions are tables in the main database file rather than ATTACHed files:
+SQLite attaches at most 10 databases by default, and a commit spanning
+several WAL-mode files is not atomic.
+"""
+from datetime import datetime
+
+# Empty table every partition is cloned from; it keeps the column layout (and
+# receives column migrations) even when no month partition exists
+TEMPLATE = 'speed_tests_template'
+# Connection attribute holding the cached is_partitioned() answer
+CACHE_ATTRIBUTE = 'speed_tests_partitioned'
+
+
+def is_partitioned(cursor, refresh=False):
+    """
+    True when speed_tests is the partition view rather than a table.
+    The answer is cached on connections that allow it (WiFiSpeedDB's do), so
+    the insert and read paths do not look in sqlite_master every time;
+    enable() and drop_before() reset it, and refresh re-reads it after
+    another process may have changed the layout.
+    """
+    conn = cursor.connection
+    cached = getattr(conn, CACHE_ATTRIBUTE, None)
+    if cached is not None and not refresh:
+        return cached
+    cursor.execute("SELECT type FROM sqlite_master WHERE name = 'speed_tests'")
+    row = cursor.fetchone()
+    partitioned = row is not None and row[0] == 'view'
+    try:
+        setattr(conn, CACHE_ATTRIBUTE, partitioned)
+    except AttributeError:
+        # A plain sqlite3.Connection takes no attributes; it is not cached
+        pass
+    return partitioned
+
+
+def forget_layout(cursor):
+    """Drop the connection's cached is_partitioned answer"""
+    try:
+        setattr(cursor.connection, CACHE_ATTRIBUTE, None)
+    except AttributeError:
+        pass
+
+
+def month_of(timestamp):
+    """'YYYY-MM' partition key of a datetime or ISO timestamp"""
+    return str(timestamp)[:7]
+
+
+def partition_name(month):
+    return f"speed_tests_{month.replace('-', '_')}"
+
+
+def partition_bounds(month):
+    """Half-open ['YYYY-MM-01', first day of next month) bounds of a partition"""
+    year, mon = int(month[:4]), int(month[5:7])
+    if mon == 12:
+        year, mon = year + 1, 0
+    return f'{month}-01', f'{year:04d}-{mon + 1:02d}-01'
+
+
+def partitions(cursor, start=None, end=None):
+    """
+    Partitions overlapping [start, end), oldest first.
+    Either bound may be None for an open range.
+    Returns:
+        list: (month, table_name) tuples.
+    """
+    sql = 'SELECT month, table_name FROM speed_test_partitions WHERE 1'
+    params = []
+    if start is not None:
+        sql += ' AND end_ts > ?'
+        params.append(str(start))
+    if end is not None:
+        sql += ' AND start_ts < ?'
+        params.append(str(end))
+    cursor.execute(sql + ' ORDER BY month', params)
+    return cursor.fetchall()
+
+
+def source(cursor, start=None, end=None):
+    """
+    FROM-clause text covering speed_tests rows in [start, end).
+    Plain speed_tests when unpartitioned; otherwise only the overlapping
+    partitions, aliased as speed_tests.
+    """
+    if not is_partitioned(cursor):
+        return 'speed_tests'
+    tables = [table for _, table in partitions(cursor, start, end)] or [TEMPLATE]
+    if len(tables) == 1:
+        return f'{tables[0]} AS speed_tests'
+    return '(' + ' UNION ALL '.join(f'SELECT * FROM {table}' for table in tables) + ') AS speed_tests'
+
+
+def physical_tables(cursor):
+    """Tables that carry the speed_tests columns, for column migrations"""
+    if not is_partitioned(cursor):
+        return ['speed_tests']
+    return [TEMPLATE] + [table for _, table in partitions(cursor)]
+
+
+def rebuild_view(cursor):
+    """Point the speed_tests view at the current set of partitions"""
+    tables = [TEMPLATE] + [table for _, table in partitions(cursor)]
+    cursor.execute('DROP VIEW IF EXISTS speed_tests')
+    cursor.execute('CREATE VIEW speed_tests AS ' +
+                   ' UNION ALL '.join(f'SELECT * FROM {table}' for table in tables))
+
+
+def _clone_template(cursor, table):
+    cursor.execute('SELECT sql FROM sqlite_master WHERE name = ?', (TEMPLATE,))
+    cursor.execute(cursor.fetchone()[0].replace(TEMPLATE, table, 1))
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_timestamp ON {table}(timestamp)')
+
+
+def _create_partition(cursor, month):
+    table = partition_name(month)
+    _clone_template(cursor, table)
+    start, end = partition_bounds(month)
+    cursor.execute('''
+        INSERT INTO speed_test_partitions (month, table_name, start_ts, end_ts, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (month, table, start, end, datetime.now()))
+    return table
+
+
+def ensure_partition(cursor, month):
+    """Return the table for month ('YYYY-MM'), creating it on first use"""
+    cursor.execute('SELECT table_name FROM speed_test_partitions WHERE month = ?', (month,))
+    row = cursor.fetchone()
+    if row:
+        return row[0]
+    table = _create_partition(cursor, month)
+    rebuild_view(cursor)
+    return table
+
+
+def allocate_ids(cursor, count):
+    """Reserve count consecutive speed test ids"""
+    cursor.execute('SELECT next_id FROM speed_test_sequence')
+    first = cursor.fetchone()[0]
+    cursor.execute('UPDATE speed_test_sequence SET next_id = ?', (first + count,))
+    return range(first, first + count)
+
+
+def insert_rows(cursor, columns, rows):
+    """
+    Insert rows into their month partitions.
+    Parameters:
+        columns (tuple): Column names, starting with 'timestamp'.
+        rows (list): Tuples in column order.
+    Returns:
+        list: The ids given to the rows, in input order.
+    """
+    by_month = {}
+    for position, row in enumerate(rows):
+        by_month.setdefault(month_of(row[0]), []).append((position, row))
+    placeholders = ', '.join('?' * (len(columns) + 1))
+    assigned = [None] * len(rows)
+    for month, month_rows in by_month.items():
+        table = ensure_partition(cursor, month)
+        ids = allocate_ids(cursor, len(month_rows))
+        cursor.executemany(
+            f"INSERT INTO {table} (id, {', '.join(columns)}) VALUES ({placeholders})",
+            [(row_id,) + row for row_id, (_, row) in zip(ids, month_rows)])
+        for row_id, (position, _) in zip(ids, month_rows):
+            assigned[position] = row_id
+    return assigned
+
+
+def drop_before(cursor, cutoff):
+    """
+    Remove rows older than cutoff. Months that end by the cutoff are dropped
+    whole; the month containing it is trimmed with a ranged DELETE.
+    Returns:
+        int: Rows removed.
+    """
+    forget_layout(cursor)
+    removed = 0
+    dropped = []
+    for month, table in partitions(cursor, end=cutoff):
+        if partition_bounds(month)[1] <= str(cutoff):
+            cursor.execute(f'SELECT COUNT(*) FROM {table}')
+            removed += cursor.fetchone()[0]
+            cursor.execute('DELETE FROM speed_test_partitions WHERE month = ?', (month,))
+            dropped.append(table)
+        else:
+            cursor.execute(f'DELETE FROM {table} WHERE timestamp < ?', (str(cutoff),))
+            removed += cursor.rowcount
+    if dropped:
+        rebuild_view(cursor)
+        for table in dropped:
+            cursor.execute(f'DROP TABLE {table}')
+    return removed
+
+
+def enable(cursor):
+    """
+    Move an existing speed_tests table into monthly partitions and replace it
+    with the view. Run inside a write transaction.
+    Returns:
+        int: Partitions created, or 0 if already partitioned.
+    """
+    if is_partitioned(cursor, refresh=True):
+        return 0
+    forget_layout(cursor)
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'speed_tests'")
+    cursor.execute(cursor.fetchone()[0].replace('speed_tests', TEMPLATE, 1))
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{TEMPLATE}_timestamp ON {TEMPLATE}(timestamp)')
+
+    # Continue after the highest id ever handed out, as AUTOINCREMENT would
+    cursor.execute('SELECT MAX(id) FROM speed_tests')
+    max_id = cursor.fetchone()[0] or 0
+    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'speed_tests'")
+    row = cursor.fetchone()
+    next_id = max(max_id, row[0] if row else 0) + 1
+    cursor.execute('DELETE FROM speed_test_sequence')
+    cursor.execute('INSERT INTO speed_test_sequence (next_id) VALUES (?)', (next_id,))
+
+    cursor.execute('SELECT DISTINCT SUBSTR(timestamp, 1, 7) FROM speed_tests ORDER BY 1')
+    months = [row[0] for row in cursor.fetchall()]
+    for month in months:
+        table = _create_partition(cursor, month)
+        cursor.execute(f'INSERT INTO {table} SELECT * FROM speed_tests WHERE timestamp >= ? AND timestamp < ?',
+                       partition_bounds(month))
+
+    cursor.execute('DROP TABLE speed_tests')
+    rebuild_view(cursor)
+    return len(months)
@@ -0,0 +1,115 @@
+"""
+Two-tier probing
+================
+
+Purpose:
+--------
+This module decides when a full speed test is worth its data. In probe mode
+every interval runs a cheap probe instead (a TCP connect to the test server
+plus a small fixed-size download, see SpeedTestBackend.probe), and a full
+test runs only when:
+
+- the probe departs from the baseline of recent probes: latency above
+  LATENCY_DEPARTURE times the baseline median (and at least
+  LATENCY_DEPARTURE_MIN_MS above it), or download below DOWNLOAD_DEPARTURE
+  times the median. At most one departure test runs per
+  DEPARTURE_COOLDOWN_MINUTES, so a lasting change does not trigger a full
+  test on every probe while the baseline catches up;
+- or the last full test is older than full_test_hours (the minimum cadence).
+
+Full tests record why they ran in speed_tests.tier ('full' outside probe
+mode, otherwise 'cadence' or 'departure'); probes go to probe_results.
+Departure tests run because the link already looked bad, so the daily
+pct_bad leaves them out and daily_summary.departure_tests counts them.
+
+Configuration (config table):
+-----------------------------
+probe_mode        'on' to enable (default off: a full test every interval)
+full_test_hours   minimum full-test cadence (default DEFAULT_FULL_TEST_HOURS)
+probe_bytes       probe download size (default DEFAULT_PROBE_BYTES)
+
+Usage:
+------
+settings = probe_settings(db)
+reason = full_test_reason(probe, db.get_probe_baseline(), db.get_last_full_test_time(), settings)
+"""
+from datetime import datetime, timedelta
+from statistics import median
+
+DEFAULT_PROBE_BYTES = 250_000
+DEFAULT_FULL_TEST_HOURS = 6
+FULL_TEST_MB = 50  # rough data used by one full speed test
+
+BASELINE_SAMPLES = 20
+MIN_BASELINE_SAMPLES = 5
+LATENCY_DEPARTURE = 2.0
+LATENCY_DEPARTURE_MIN_MS = 10
+DOWNLOAD_DEPARTURE = 0.5
+DEPARTURE_COOLDOWN_MINUTES = 30
+
+
+def probe_settings(db):
+    """
+    Probe configuration with defaults applied.
+    Returns:
+        dict: enabled (bool), full_test_hours (float), probe_bytes (int).
+    """
+    return {
+        'enabled': db.get_config('probe_mode', 'off') == 'on',
+        'full_test_hours': db.get_config_number('full_test_hours', DEFAULT_FULL_TEST_HOURS, float),
+        'probe_bytes': db.get_config_number('probe_bytes', DEFAULT_PROBE_BYTES, int),
+    }
+
+
+def departure(probe, baseline):
+    """
+    Why a probe departs from the baseline, or None if it does not.
+    Parameters:
+        probe (dict): latency_ms and download_mbps of the new probe.
+        baseline (list): (latency_ms, download_mbps) of recent probes.
+    Returns:
+        str | None: Description of the departure.
+    """
+    if len(baseline) < MIN_BASELINE_SAMPLES:
+        return None
+    latency = median(row[0] for row in baseline)
+    if (probe['latency_ms'] > latency * LATENCY_DEPARTURE
+            and probe['latency_ms'] - latency >= LATENCY_DEPARTURE_MIN_MS):
+        return f"latency {probe['latency_ms']:.1f} ms vs baseline {latency:.1f} ms"
+    downloads = [row[1] for row in baseline if row[1] is not None]
+    if downloads and probe['download_mbps'] is not None:
+        download = median(downloads)
+        if probe['download_mbps'] < download * DOWNLOAD_DEPARTURE:
+            return f"download {probe['download_mbps']:.1f} Mbps vs baseline {download:.1f} Mbps"
+    return None
+
+
+def full_test_reason(probe, baseline, last_full, settings, now=None):
+    """
+    Whether a probe should be followed by a full test.
+    Parameters:
+        probe (dict | None): The probe, or None if the backend could not probe.
+        baseline (list): (latency_ms, download_mbps) of recent probes.
+        last_full (datetime | None): Time of the latest full test.
+        settings (dict): From probe_settings.
+    Returns:
+        tuple: (tier, detail) with tier 'cadence' or 'departure', or (None, None).
+    """
+    now = now or datetime.now()
+    if probe is None:
+        return 'cadence', "no server to probe yet"
+    if last_full is None or now - last_full >= timedelta(hours=settings['full_test_hours']):
+        return 'cadence', f"no full test in {settings['full_test_hours']:g} hours"
+    detail = departure(probe, baseline)
+    if detail and now - last_full >= timedelta(minutes=DEPARTURE_COOLDOWN_MINUTES):
+        return 'departure', detail
+    return None, None
+
+
+def estimate_daily_mb(interval_minutes, settings):
+    """Approximate data used per day at this interval"""
+    runs = 1440 / interval_minutes
+    if not settings['enabled']:
+        return runs * FULL_TEST_MB
+    full_tests = min(runs, 24 / settings['full_test_hours'])
+    return runs * settings['probe_bytes'] / 1_000_000 + full_tests * FULL_TEST_MB
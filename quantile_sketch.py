@@ -0,0 +1,140 @@
+"""
+QuantileSketch
+==============
+
+Purpose:
+--------
+This module provides a small, mergeable quantile sketch used to keep running
+daily medians and percentiles without re-reading every sample. Values are
+counted in logarithmically sized buckets (the DDSketch scheme), so adding a
+sample is constant work and two sketches merge by adding bucket counts.
+
+Error bound:
+------------
+For a quantile q over n samples, let x_lo and x_hi be the order statistics of
+rank floor(q * (n - 1)) and ceil(q * (n - 1)); the exact interpolated quantile
+used by WiFiSpeedDB lies between them. quantile(q) returns a value within
+relative_accuracy of x_lo, so it always lies in
+[x_lo * (1 - relative_accuracy), x_hi * (1 + relative_accuracy)].
+Values at or below ZERO_THRESHOLD are counted exactly as zero.
+
+Class:
+------
+QuantileSketch
+    Methods:
+    ---------
+    add(self, value)
+        Counts one sample.
+
+    merge(self, other)
+        Adds another sketch's counts into this one.
+
+    quantile(self, q) -> float
+        Returns the estimated q-quantile (0 <= q <= 1), or 0.0 when empty.
+
+    to_bytes(self) -> bytes / QuantileSketch.from_bytes(blob)
+        Compact binary form stored in daily_aggregates.
+
+Usage:
+------
+sketch = QuantileSketch()
+for ping in pings:
+    sketch.add(ping)
+p95 = sketch.quantile(0.95)
+"""
+import math
+import struct
+
+ZERO_THRESHOLD = 1e-9
+
+_HEADER = struct.Struct('<dII')
+_BIN = struct.Struct('<iI')
+
+
+class QuantileSketch:
+    def __init__(self, relative_accuracy=0.01):
+        """
+        Creates an empty sketch.
+        Parameters:
+            relative_accuracy (float): Relative error bound, e.g. 0.01 for 1%.
+        """
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value):
+        """
+        Counts one sample.
+        Parameters:
+            value (float): Non-negative sample value.
+        """
+        if value <= ZERO_THRESHOLD:
+            self.zero_count += 1
+        else:
+            key = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[key] = self.bins.get(key, 0) + 1
+        self.count += 1
+
+    def merge(self, other):
+        """
+        Adds another sketch's counts into this one.
+        Parameters:
+            other (QuantileSketch): Sketch built with the same relative_accuracy.
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def quantile(self, q):
+        """
+        Returns the estimated q-quantile.
+        Parameters:
+            q (float): Quantile between 0 and 1.
+        Returns:
+            float: Estimated value, or 0.0 if the sketch is empty.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = math.floor(q * (self.count - 1))
+        if rank < self.zero_count:
+            return 0.0
+        cumulative = self.zero_count
+        for key in sorted(self.bins):
+            cumulative += self.bins[key]
+            if cumulative > rank:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def to_bytes(self):
+        """
+        Serializes the sketch.
+        Returns:
+            bytes: Header followed by one (key, count) pair per non-empty bucket.
+        """
+        parts = [_HEADER.pack(self.relative_accuracy, self.zero_count, len(self.bins))]
+        parts.extend(_BIN.pack(key, count) for key, count in self.bins.items())
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, blob):
+        """
+        Rebuilds a sketch from to_bytes() output.
+        Parameters:
+            blob (bytes): Serialized sketch.
+        Returns:
+            QuantileSketch: The decoded sketch.
+        """
+        relative_accuracy, zero_count, bin_count = _HEADER.unpack_from(blob)
+        sketch = cls(relative_accuracy)
+        sketch.zero_count = zero_count
+        sketch.count = zero_count
+        for key, count in _BIN.iter_unpack(blob[_HEADER.size:_HEADER.size + bin_count * _BIN.size]):
+            sketch.bins[key] = count
+            sketch.count += count
+        return sketch
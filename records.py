@@ -0,0 +1,144 @@
+"""
+Records
+=======
+
+Purpose:
+--------
+This module provides the record types that speed tests and summaries are
+passed around as, instead of dicts and positional tuples. Fields are read by
+name (result.download_speed, summary.status) rather than by position, and
+each class declares __slots__, so a record has no per-instance __dict__ and
+costs about as much memory as the tuple it replaces.
+
+Records are built straight from cursor rows: set cursor.row_factory to
+Class.from_row and select the columns in FIELDS order (select_list() gives
+the column list). from_row maps by position, so it costs one constructor
+call per row and nothing per column name.
+
+Classes:
+--------
+SpeedTestResult
+    One speed test (a speed_tests row, or the result of run_speed_test).
+
+SpeedTestComparison(SpeedTestResult)
+    A speed test with the active plan and the percentage of it reached.
+
+DailySummary / WeeklySummary
+    daily_summary and weekly_summary rows.
+
+Usage:
+------
+cursor.row_factory = DailySummary.from_row
+cursor.execute(f'SELECT {DailySummary.select_list()} FROM daily_summary')
+for summary in cursor:
+    print(summary.day, summary.status)
+"""
+
+
+class Record:
+    """Base for slotted records; subclasses set __slots__ to their fields, in column order"""
+    __slots__ = ()
+
+    @classmethod
+    def fields(cls):
+        """All field names in column order, including those of base classes"""
+        names = []
+        for klass in reversed(cls.__mro__):
+            names.extend(klass.__dict__.get('__slots__', ()))
+        return tuple(names)
+
+    @classmethod
+    def select_list(cls, alias=None):
+        """Comma-separated column list in field order, optionally qualified"""
+        prefix = f"{alias}." if alias else ""
+        return ", ".join(prefix + name for name in cls.fields())
+
+    @classmethod
+    def from_row(cls, cursor, row):
+        """sqlite3 row factory: columns must be selected in field order"""
+        return cls(*row)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.fields()}
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.as_dict() == other.as_dict()
+
+    def __repr__(self):
+        values = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.fields())
+        return f"{type(self).__name__}({values})"
+
+
+class SpeedTestResult(Record):
+    __slots__ = ('id', 'timestamp', 'download_speed', 'upload_speed', 'ping',
+                 'server_name', 'server_location', 'device_count', 'tier', 'device_count_age_seconds')
+
+    def __init__(self, id, timestamp, download_speed, upload_speed, ping, server_name=None,
+                 server_location=None, device_count=None, tier=None, device_count_age_seconds=None):
+        self.id = id
+        self.timestamp = timestamp
+        self.download_speed = download_speed
+        self.upload_speed = upload_speed
+        self.ping = ping
+        self.server_name = server_name
+        self.server_location = server_location
+        self.device_count = device_count
+        self.tier = tier
+        self.device_count_age_seconds = device_count_age_seconds
+
+
+class SpeedTestComparison(SpeedTestResult):
+    __slots__ = ('plan_name', 'plan_download', 'plan_upload', 'download_percentage', 'upload_percentage')
+
+    def __init__(self, id, timestamp, download_speed, upload_speed, ping, server_name, server_location,
+                 device_count, tier, device_count_age_seconds, plan_name=None, plan_download=None,
+                 plan_upload=None, download_percentage=None, upload_percentage=None):
+        super().__init__(id, timestamp, download_speed, upload_speed, ping, server_name,
+                         server_location, device_count, tier, device_count_age_seconds)
+        self.plan_name = plan_name
+        self.plan_download = plan_download
+        self.plan_upload = plan_upload
+        self.download_percentage = download_percentage
+        self.upload_percentage = upload_percentage
+
+
+class DailySummary(Record):
+    __slots__ = ('day', 'sample_count', 'median_download_mbps', 'median_upload_mbps', 'p95_ping_ms',
+                 'pct_bad', 'avg_device_count', 'status', 'created_at', 'departure_tests')
+
+    def __init__(self, day, sample_count, median_download_mbps, median_upload_mbps, p95_ping_ms,
+                 pct_bad, avg_device_count, status, created_at=None, departure_tests=0):
+        self.day = day
+        self.sample_count = sample_count
+        self.median_download_mbps = median_download_mbps
+        self.median_upload_mbps = median_upload_mbps
+        self.p95_ping_ms = p95_ping_ms
+        self.pct_bad = pct_bad
+        self.avg_device_count = avg_device_count
+        self.status = status
+        self.created_at = created_at
+        self.departure_tests = departure_tests
+
+
+class WeeklySummary(Record):
+    __slots__ = ('week_start', 'week_end', 'days_with_data', 'total_samples', 'avg_download_mbps',
+                 'avg_upload_mbps', 'avg_ping_ms', 'weekly_pct_bad', 'good_days', 'meh_days',
+                 'bad_days', 'no_data_days', 'status', 'created_at')
+
+    def __init__(self, week_start, week_end, days_with_data, total_samples, avg_download_mbps,
+                 avg_upload_mbps, avg_ping_ms, weekly_pct_bad, good_days=0, meh_days=0,
+                 bad_days=0, no_data_days=0, status=None, created_at=None):
+        self.week_start = week_start
+        self.week_end = week_end
+        self.days_with_data = days_with_data
+        self.total_samples = total_samples
+        self.avg_download_mbps = avg_download_mbps
+        self.avg_upload_mbps = avg_upload_mbps
+        self.avg_ping_ms = avg_ping_ms
+        self.weekly_pct_bad = weekly_pct_bad
+        self.good_days = good_days
+        self.meh_days = meh_days
+        self.bad_days = bad_days
+        self.no_data_days = no_data_days
+        self.status = status
+        self.created_at = created_at
@@ -0,0 +1,279 @@
+"""
+Run control
+===========
+
+Purpose:
+--------
+This module keeps monitor runs from piling up when one outlasts its interval
+(a slow ping sweep plus a full test at a 1-2 minute cron interval):
+
+- RunLock is an exclusive flock on a lock file. A cron tick that finds it
+  held records an 'overlap' run and exits instead of competing with the run
+  in progress for bandwidth and the database lock. The kernel drops the lock
+  when the process exits, however it exits, so a crash never leaves it stale.
+- PhaseDeadlines gives each phase of a run (probe, scan, select, fanout,
+  download, upload, persist) its own deadline, and the run as a whole a total budget.
+  A phase that misses its deadline is cancelled: its cancel event is set,
+  which the backends and the device scanner check between chunks and pings,
+  and PhaseTimeout is raised so the run is recorded as timed out (or
+  partial, when only optional work such as the device scan was lost).
+  Every phase is timed on the monotonic clock, with the CPU time of the
+  thread that ran it and the peak RSS when it ended (PhaseDeadlines.timings,
+  stored in run_phases). Phases overlap with other threads (the scan, the
+  result writer, the latency sampler), so per-phase CPU is thread CPU;
+  only the 'total' entry is process CPU.
+
+Outcomes go to the monitor_runs table with status ok, partial, timeout,
+failed, overlap (the lock was held) or skipped (a daemon tick was missed).
+
+Configuration (config table):
+-----------------------------
+phase_seconds_<phase>   per-phase deadline (defaults in DEFAULT_PHASE_SECONDS)
+run_budget_seconds      total budget (default DEFAULT_RUN_BUDGET_SECONDS),
+                        never more than RUN_BUDGET_FRACTION of the interval
+
+Usage:
+------
+lock = RunLock(LOCK_PATH)
+if not lock.acquire():
+    ...  # another run is in progress
+deadlines = PhaseDeadlines.from_config(db, interval_seconds)
+server = deadlines.run('select', backend.select_server)
+"""
+import fcntl
+import os
+from contextlib import contextmanager
+import resource
+import sys
+import threading
+import time
+
+LOCK_PATH = 'wifi_monitor.lock'
+
+DEFAULT_PHASE_SECONDS = {
+    'probe': 30,
+    'scan': 60,
+    'select': 30,
+    'fanout': 30,
+    'download': 60,
+    'upload': 60,
+    'persist': 30,
+}
+DEFAULT_RUN_BUDGET_SECONDS = 240
+# Leave part of the interval free, so the next tick starts on an idle link
+RUN_BUDGET_FRACTION = 0.9
+# How long a cancelled phase gets to notice the cancel event before its
+# thread is abandoned
+CANCEL_GRACE_SECONDS = 2
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process so far, in KB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB on Linux
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+@contextmanager
+def timed(timings, phase):
+    """Appends a PhaseDeadlines.timings entry for the block; for inline steps such as the save"""
+    started, cpu_started = time.monotonic(), time.thread_time()
+    status = 'error'
+    try:
+        yield
+        status = 'ok'
+    finally:
+        timings.append({
+            'phase': phase,
+            'duration_ms': (time.monotonic() - started) * 1000,
+            'cpu_ms': (time.thread_time() - cpu_started) * 1000,
+            'peak_rss_kb': peak_rss_kb(),
+            'status': status,
+        })
+
+
+class PhaseTimeout(Exception):
+    """A phase missed its deadline or the run ran out of budget"""
+    def __init__(self, phase, seconds):
+        super().__init__(f"{phase} did not finish within {seconds:.1f} s")
+        self.phase = phase
+        self.seconds = seconds
+
+
+class RunLock:
+    def __init__(self, path=LOCK_PATH):
+        """
+        Parameters:
+            path (str): Lock file; created if missing and never deleted.
+        """
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        """
+        Takes the lock without waiting.
+        Returns:
+            bool: False if another process holds it.
+        """
+        lock_file = open(self.path, 'a+')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        # The holder's pid, for anyone inspecting a stuck lock
+        lock_file.truncate(0)
+        lock_file.write(f"{os.getpid()}\n")
+        lock_file.flush()
+        self._file = lock_file
+        return True
+
+    def release(self):
+        if self._file:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class _Phase:
+    def __init__(self, name, fn, args, limit, cancel, on_exit):
+        self.name = name
+        self.cancel = cancel
+        self.result = None
+        self.error = None
+        self.started = time.monotonic()
+        self.deadline = None if limit is None else self.started + limit
+        self.finished = None
+        self.cpu = None
+        self.peak_rss_kb = None
+        # A daemon thread, so a phase stuck past its grace period cannot
+        # keep the process alive
+        self.thread = threading.Thread(target=self._run, args=(fn, args, on_exit),
+                                       name=f'phase-{name}', daemon=True)
+        self.thread.start()
+
+    def _run(self, fn, args, on_exit):
+        # CPU of this thread only: other phases and threads run meanwhile
+        cpu_started = time.thread_time()
+        try:
+            self.result = fn(*args)
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.finished = time.monotonic()
+            self.cpu = time.thread_time() - cpu_started
+            self.peak_rss_kb = peak_rss_kb()
+            if on_exit:
+                on_exit()
+
+
+class PhaseDeadlines:
+    def __init__(self, phase_seconds=None, budget_seconds=None, on_thread_exit=None):
+        """
+        Parameters:
+            phase_seconds (dict): Deadline per phase name; phases not listed
+                are bounded by the budget only.
+            budget_seconds (float): Total for the run, None for no total.
+            on_thread_exit (callable): Called on each phase thread as it ends,
+                e.g. WiFiSpeedDB.release_connection.
+        """
+        self.phase_seconds = dict(DEFAULT_PHASE_SECONDS, **(phase_seconds or {}))
+        self.budget_seconds = budget_seconds
+        self.started = time.monotonic()
+        self.cpu_started = time.process_time()
+        self.cancel = threading.Event()
+        self.on_thread_exit = on_thread_exit
+        self.phase = None  # latest phase started
+        self.timings = []  # one dict per finished or timed-out phase, see wait()
+
+    @classmethod
+    def from_config(cls, db, interval_seconds=None):
+        """
+        Deadlines from config. With interval_seconds, the budget is capped at
+        RUN_BUDGET_FRACTION of the interval. Phase threads release their
+        database connection as they end.
+        """
+        phase_seconds = {phase: db.get_config_number(f'phase_seconds_{phase}', default)
+                         for phase, default in DEFAULT_PHASE_SECONDS.items()}
+        budget = db.get_config_number('run_budget_seconds', DEFAULT_RUN_BUDGET_SECONDS)
+        if interval_seconds:
+            budget = min(budget, interval_seconds * RUN_BUDGET_FRACTION)
+        return cls(phase_seconds, budget, db.release_connection)
+
+    def remaining(self):
+        """Seconds left in the run budget, or None without one"""
+        if self.budget_seconds is None:
+            return None
+        return self.budget_seconds - (time.monotonic() - self.started)
+
+    def _limit(self, phase, budget):
+        limits = [self.phase_seconds.get(phase), self.remaining() if budget else None]
+        limits = [limit for limit in limits if limit is not None]
+        return min(limits) if limits else None
+
+    def start(self, phase, fn, *args, cancel=None, budget=True):
+        """
+        Starts fn(*args) as phase on its own thread; pass the handle to wait().
+        cancel is the event set if the phase times out, by default the run's
+        own; give optional phases their own so losing one does not cancel the
+        rest. With budget False only the phase's own deadline applies (for
+        bookkeeping such as persist, which must run even after a timeout).
+        """
+        limit = self._limit(phase, budget)
+        if limit is not None and limit <= 0:
+            raise PhaseTimeout(phase, 0)
+        self.phase = phase
+        return _Phase(phase, fn, args, limit, cancel or self.cancel, self.on_thread_exit)
+
+    def wait(self, handle):
+        """
+        Waits for a started phase within its deadline.
+        Returns:
+            The phase's return value; its exception is re-raised.
+        Raises:
+            PhaseTimeout: The deadline passed. The phase's cancel event is set
+                and it gets CANCEL_GRACE_SECONDS to stop before it is abandoned.
+        """
+        deadline = handle.deadline
+        handle.thread.join(None if deadline is None else max(deadline - time.monotonic(), 0))
+        if handle.thread.is_alive():
+            handle.cancel.set()
+            handle.thread.join(CANCEL_GRACE_SECONDS)
+            self._record(handle, 'timeout')
+            raise PhaseTimeout(handle.name, time.monotonic() - handle.started)
+        self._record(handle, 'error' if handle.error else 'ok')
+        if handle.error:
+            raise handle.error
+        return handle.result
+
+    def _record(self, handle, status):
+        # A phase abandoned after its grace period has no end figures yet;
+        # another thread's CPU time cannot be read, so its CPU is left out
+        finished = handle.finished or time.monotonic()
+        self.timings.append({
+            'phase': handle.name,
+            'duration_ms': (finished - handle.started) * 1000,
+            'cpu_ms': handle.cpu * 1000 if handle.cpu is not None else None,
+            'peak_rss_kb': handle.peak_rss_kb or peak_rss_kb(),
+            'status': status,
+        })
+
+    def total(self, status='ok'):
+        """Timing entry for the whole run so far: wall clock, process CPU and peak RSS"""
+        return {
+            'phase': 'total',
+            'duration_ms': (time.monotonic() - self.started) * 1000,
+            'cpu_ms': (time.process_time() - self.cpu_started) * 1000,
+            'peak_rss_kb': peak_rss_kb(),
+            'status': status,
+        }
+
+    def run(self, phase, fn, *args, cancel=None, budget=True):
+        """start() and wait() in one"""
+        return self.wait(self.start(phase, fn, *args, cancel=cancel, budget=budget))
@@ -0,0 +1,110 @@
+"""
+IntervalScheduler
+=================
+
+Purpose:
+--------
+This module provides the IntervalScheduler class, which runs a job at a fixed
+interval inside one long-lived process (wifi_monitor.py --daemon). Ticks are
+anchored to a monotonic clock: the next tick is the previous tick plus the
+interval, not "now" plus the interval, so the time a job takes never pushes
+later ticks back. A tick that is missed entirely (the job outlasted a whole
+interval) is skipped and counted rather than run late. The interval is
+re-read while waiting, so a change made with set_interval.py applies without
+a restart.
+
+Class:
+------
+IntervalScheduler
+    Methods:
+    ---------
+    __init__(self, get_interval, poll_seconds=15)
+        get_interval() returns the current interval in seconds.
+
+    run(self, job)
+        Calls job() on every tick until stop() is called.
+
+    stop(self)
+        Wakes the scheduler and makes run() return after the current job.
+
+    stats(self) -> dict
+        Ticks run, ticks skipped and tick lateness figures.
+
+Usage:
+------
+scheduler = IntervalScheduler(lambda: 600)
+signal.signal(signal.SIGTERM, lambda *_: scheduler.stop())
+scheduler.run(tester.run_speed_test)
+"""
+import logging
+import threading
+import time
+
+
+class IntervalScheduler:
+    def __init__(self, get_interval, poll_seconds=15):
+        """
+        Creates a scheduler.
+        Parameters:
+            get_interval (callable): Returns the interval in seconds; called
+                once per tick and every poll_seconds while waiting.
+            poll_seconds (float): How often to re-check the interval while idle.
+        """
+        self.get_interval = get_interval
+        self.poll_seconds = poll_seconds
+        self.stop_event = threading.Event()
+        self.ticks = 0
+        self.skipped = 0
+        self.lateness = []  # seconds between each tick and its job starting
+
+    def stop(self):
+        """Stop after the current job; safe to call from a signal handler"""
+        self.stop_event.set()
+
+    def run(self, job):
+        """
+        Runs job() on every tick until stop() is called. The first tick is
+        immediate. Exceptions from job are logged and do not stop the loop.
+        """
+        interval = self.get_interval()
+        tick = time.monotonic()
+        while not self.stop_event.is_set():
+            remaining = tick - time.monotonic()
+            if remaining > 0:
+                if self.stop_event.wait(min(remaining, self.poll_seconds)):
+                    break
+                new_interval = self.get_interval()
+                if new_interval != interval:
+                    logging.info(f"Interval changed from {interval / 60:g} to {new_interval / 60:g} minutes")
+                    tick += new_interval - interval
+                    interval = new_interval
+                continue
+
+            self.lateness.append(time.monotonic() - tick)
+            self.ticks += 1
+            try:
+                job()
+            except Exception as e:
+                logging.error(f"Scheduled job failed: {e}")
+
+            interval = self.get_interval()
+            tick += interval
+            now = time.monotonic()
+            if tick <= now:
+                missed = int((now - tick) // interval) + 1
+                self.skipped += missed
+                tick += missed * interval
+                logging.warning(f"Job overran its interval; skipped {missed} tick(s)")
+
+    def stats(self):
+        """
+        Scheduler counters.
+        Returns:
+            dict: ticks, skipped, and mean/max lateness in seconds.
+        """
+        return {
+            'ticks': self.ticks,
+            'skipped': self.skipped,
+            'mean_lateness': sum(self.lateness) / len(self.lateness) if self.lateness else 0.0,
+            'max_lateness': max(self.lateness, default=0.0),
+        }
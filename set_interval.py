@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 import argparse
 import sys
+import probing
 from database import WiFiSpeedDB
+from device_scanner import DEFAULT_DEVICE_COUNT_TTL_SECONDS, DEFAULT_FULL_SWEEP_MINUTES
 
 class IntervalManager:
     def __init__(self):
@@ -18,7 +20,8 @@ class IntervalManager:
             "60": {"minutes": 60, "description": "Every hour", "warning": "Infrequent - fewer data points"}
         }
     
-    def minutes_to_cron(self, minutes):
+    @staticmethod
+    def minutes_to_cron(minutes):
         """Convert minutes to appropriate cron expression"""
         if minutes < 60:  # Less than 1 hour
             if 60 % minutes == 0:  # Evenly divides into hour
@@ -90,15 +93,56 @@ class IntervalManager:
         elif minutes > 60:
             warnings.append("ℹ️ Infrequent testing provides fewer data points")
         
-        # Data usage estimation
-        tests_per_day = 1440 / minutes  # 1440 minutes in a day
-        estimated_mb = tests_per_day * 50  # ~50MB per speed test
+        # Data usage estimation (~50MB per full speed test; far less in probe mode)
+        settings = probing.probe_settings(self.db)
+        estimated_mb = probing.estimate_daily_mb(minutes, settings)
         
         if estimated_mb > 1000:  # > 1GB per day
-            warnings.append(f"📊 High data usage: ~{estimated_mb:.0f}MB/day")
+            hint = "" if settings['enabled'] else " (probe mode cuts this: --probe on)"
+            warnings.append(f"📊 High data usage: ~{estimated_mb:.0f}MB/day{hint}")
         
         return warnings
     
+    def set_probe_mode(self, enabled, full_test_hours=None):
+        """Turn probe mode on or off and optionally set the full-test cadence"""
+        self.db.set_config('probe_mode', 'on' if enabled else 'off')
+        if full_test_hours is not None:
+            self.db.set_config('full_test_hours', str(full_test_hours))
+        settings = probing.probe_settings(self.db)
+        minutes = self.db.get_config_number('monitoring_interval', 10, int)
+        
+        if enabled:
+            print(f"✅ Probe mode on: a {settings['probe_bytes'] / 1_000_000:g}MB probe every interval, "
+                  f"full tests at least every {settings['full_test_hours']:g} hours or when a probe looks off")
+        else:
+            print("✅ Probe mode off: a full speed test every interval")
+        print(f"📊 Estimated data usage at {minutes} minutes: ~{probing.estimate_daily_mb(minutes, settings):.0f}MB/day")
+    
+    def set_full_sweep(self, minutes):
+        """How often the device scan sweeps the whole subnet instead of only known devices"""
+        self.db.set_config('device_full_sweep_minutes', str(minutes))
+        print(f"✅ Device scans: known devices every interval, the whole subnet every {minutes:g} minutes")
+    
+    def set_device_ttl(self, seconds):
+        """How long monitor runs reuse the last device count before scanning again"""
+        self.db.set_config('device_count_ttl_seconds', str(seconds))
+        if seconds > 0:
+            print(f"✅ Device counts reused for {seconds:g} seconds between scans")
+        else:
+            print("✅ Device counts: every run scans")
+    
+    def set_fanout(self, servers, download_bytes=None):
+        """Measure the top N servers each full test (0 turns fan-out off)"""
+        self.db.set_config('fanout_servers', str(servers))
+        if download_bytes is not None:
+            self.db.set_config('fanout_bytes', str(download_bytes))
+        if servers > 1:
+            download_bytes = self.db.get_config_number('fanout_bytes', 0, int)
+            transfers = f" plus a {download_bytes / 1_000_000:g}MB download from each" if download_bytes else ""
+            print(f"✅ Fan-out on: latency to {servers} servers{transfers}, headline is the median")
+        else:
+            print("✅ Fan-out off: one server per test")
+    
     def set_interval(self, interval_str):
         """Set new monitoring interval"""
         minutes = self.parse_interval(interval_str)
@@ -135,6 +179,7 @@ class IntervalManager:
         print(f"🔧 Scheduler: {scheduler}")
         
         print(f"\n💡 Run 'python3 setup_cron.py' to update your cron job")
+        print(f"   (a running 'wifi_monitor.py --daemon' picks up the change by itself)")
         
         return True
 
@@ -143,18 +188,48 @@ def main():
     parser.add_argument('interval', nargs='?', help='Interval in minutes (e.g., 5, 10, 15)')
     parser.add_argument('--show', action='store_true', help='Show current interval')
     parser.add_argument('--list', action='store_true', help='List preset intervals')
+    # Options that change a setting; each one given is applied in turn, and
+    # none at all (with no interval, --show or --list) means interactive mode
+    settings = parser.add_argument_group('monitoring settings')
+    setting_options = [
+        settings.add_argument('--probe', choices=['on', 'off'],
+                              help='Probe mode: cheap probes every interval, full tests only when needed'),
+        settings.add_argument('--full-every', type=float, metavar='HOURS',
+                              help=f'Minimum full-test cadence in probe mode (default: {probing.DEFAULT_FULL_TEST_HOURS})'),
+        settings.add_argument('--fanout', type=int, metavar='N',
+                              help='Measure latency to the top N servers each full test (0 for off)'),
+        settings.add_argument('--fanout-bytes', type=int, metavar='BYTES',
+                              help='Also download this much from each fan-out server (0 for latency only)'),
+        settings.add_argument('--full-sweep', type=float, metavar='MINUTES',
+                              help=f'Sweep the whole subnet for new devices this often while the ARP table is sparse '
+                                   f'(default: {DEFAULT_FULL_SWEEP_MINUTES})'),
+        settings.add_argument('--device-ttl', type=float, metavar='SECONDS',
+                              help=f'Reuse the last device count this long, 0 to scan every run '
+                                   f'(default: {DEFAULT_DEVICE_COUNT_TTL_SECONDS})'),
+    ]
     
     args = parser.parse_args()
+    settings_given = any(getattr(args, option.dest) is not None for option in setting_options)
     
     manager = IntervalManager()
     
+    if args.probe or args.full_every is not None:
+        enabled = args.probe == 'on' if args.probe else probing.probe_settings(manager.db)['enabled']
+        manager.set_probe_mode(enabled, args.full_every)
+    if args.fanout is not None or args.fanout_bytes is not None:
+        servers = args.fanout if args.fanout is not None else manager.db.get_config_number('fanout_servers', 0, int)
+        manager.set_fanout(servers, args.fanout_bytes)
+    if args.full_sweep is not None:
+        manager.set_full_sweep(args.full_sweep)
+    if args.device_ttl is not None:
+        manager.set_device_ttl(args.device_ttl)
     if args.show:
         manager.show_current_interval()
     elif args.list:
         manager.list_presets()
     elif args.interval:
         manager.set_interval(args.interval)
-    else:
+    elif not settings_given:
         # Interactive mode
         manager.show_current_interval()
         manager.list_presets()
@@ -35,8 +35,19 @@ setup(
     url="https://github.com/username/wifi",
     packages=find_packages(),
     py_modules=[
+        "backends",
         "database",
+        "latency_sampler",
+        "migrations",
+        "partitions",
+        "probing",
+        "quantile_sketch",
+        "records",
+        "run_control",
+        "scheduler",
+        "sweep",
         "speed_test", 
+        "throughput_server",
         "device_scanner",
         "daily_rollup",
         "set_interval",
@@ -3,6 +3,9 @@ import os
 import sys
 import subprocess
 from pathlib import Path
+from database import WiFiSpeedDB
+from set_interval import IntervalManager
+from wifi_monitor import get_interval_seconds
 
 def setup_cron_job():
     script_dir = Path(__file__).parent.absolute()
@@ -10,7 +13,13 @@ def setup_cron_job():
     script_path = script_dir / "wifi_monitor.py"
     log_path = script_dir / "wifi_monitor.log"
     
-    cron_command = f"*/10 * * * * cd {script_dir} && {python_path} {script_path} >> {log_path} 2>&1"
+    # Schedule from the interval set with set_interval.py (the monitor runs
+    # from script_dir, so that is where its database lives)
+    db = WiFiSpeedDB(str(script_dir / "wifi_speed.db"))
+    minutes = get_interval_seconds(db) // 60
+    cron_expr, _ = IntervalManager.minutes_to_cron(minutes)
+    
+    cron_command = f"{cron_expr} cd {script_dir} && {python_path} {script_path} >> {log_path} 2>&1"
     
     print("Setting up cron job for wifi monitoring...")
     print(f"Script location: {script_path}")
@@ -22,18 +31,23 @@ def setup_cron_job():
         result = subprocess.run(['crontab', '-l'], capture_output=True, text=True)
         existing_crontab = result.stdout if result.returncode == 0 else ""
         
-        if "wifi_monitor.py" in existing_crontab:
+        lines = existing_crontab.splitlines()
+        if cron_command in lines:
             print("WiFi monitor cron job already exists!")
             return
         
-        new_crontab = existing_crontab + cron_command + "\n"
+        # Replace a job left over from a previous interval
+        new_lines = [line for line in lines if "wifi_monitor.py" not in line]
+        if len(new_lines) != len(lines):
+            print("Updating existing WiFi monitor cron job...")
+        new_crontab = "\n".join(new_lines + [cron_command]) + "\n"
         
         process = subprocess.Popen(['crontab', '-'], stdin=subprocess.PIPE, text=True)
         process.communicate(input=new_crontab)
         
         if process.returncode == 0:
             print("✅ Cron job successfully added!")
-            print("WiFi speed will be monitored every 10 minutes")
+            print(f"WiFi speed will be monitored every {minutes} minutes")
             print(f"Check logs at: {log_path}")
         else:
             print("❌ Failed to add cron job")
@@ -11,74 +11,351 @@ Class:
 WiFiSpeedTester
     Methods:
     ---------
-    __init__(self)
-        Initializes the tester, sets up database and device scanner.
+    __init__(self, backend=None, sequential=False)
+        Initializes the tester, sets up database, device scanner, measurement backend (see backends.py) and background writer.
 
-    run_speed_test(self) -> dict | None
-        Runs a speed test, saves results to the database, and returns a dictionary of results. Returns None on failure.
+    run_cycle(self, deadlines=None) -> SpeedTestResult | None
+        One monitoring interval: a full test, or in probe mode a cheap probe that escalates to a full test when needed (see probing.py).
 
-    print_speed_test_table(self, results: dict)
-        Outputs the speed test results in a pretty table format. Accepts a results dictionary.
+    run_speed_test(self, tier='full', deadlines=None) -> SpeedTestResult | None
+        Runs a speed test, queues the database write, and returns the result (see records.py). Returns None on failure.
+        Each phase runs under its deadline (see run_control.py); self.outcome says whether the run was ok, partial, timed out or failed.
+        Device discovery overlaps server selection; download and upload run alone.
+        With fanout_servers set (config), ping (and with fanout_bytes, download) is the median over several servers.
+
+    fan_out(self, settings) -> list
+        Measures latency to the top N servers in parallel, then optional short downloads one server at a time.
+
+    save_results(self, results, timestamp, measurements=(), deadlines=None)
+        Saves one result on the writer; the run's phase timings, the timed save steps and a total go to run_phases.
+
+    wait_for_writes(self) -> bool / close(self) -> bool
+        Waits for queued saves (close also shuts the writer and database down). False if a save failed.
+
+    print_speed_test_table(self, results: SpeedTestResult)
+        Outputs the speed test results in a pretty table format.
 
 Usage:
 ------
 tester = WiFiSpeedTester()
 results = tester.run_speed_test()
+tester.close()
 if results:
     tester.print_speed_test_table(results)
 """
-import speedtest
 import logging
+import socket
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import probing
+from backends import create_backend
 from database import WiFiSpeedDB
+from records import SpeedTestResult
 from device_scanner import DeviceScanner
+from run_control import PhaseDeadlines, PhaseTimeout, timed
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Fan-out defaults; fanout_servers (config) turns it on, see fan_out
+DEFAULT_FANOUT_WORKERS = 4
+DEFAULT_FANOUT_BUDGET_SECONDS = 5
+
 class WiFiSpeedTester:
-    def __init__(self):
+    def __init__(self, backend=None, sequential=False):
         """
         Initializes the WiFiSpeedTester instance.
-        Sets up database and device scanner.
+        Sets up database, device scanner, measurement backend and the
+        background writer that saves results.
+        Parameters:
+            backend (SpeedTestBackend): Engine to measure with; defaults to
+                the one named by the measurement_backend config key.
+            sequential (bool): Run every stage in turn on the calling thread
+                (the pre-pipeline behaviour, kept for timing comparisons).
         """
         self.db = WiFiSpeedDB()
-        self.device_scanner = DeviceScanner()
+        self.device_scanner = DeviceScanner(db=self.db)
+        self.backend = backend or create_backend(self.db)
+        self.sequential = sequential
+        # One worker, so saves are applied in the order the tests ran; it
+        # gets its own connection from the database's per-thread pool
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self.pending_writes = []
+        self.timings = {}
+        self.outcome = {'status': 'ok', 'phase': None, 'detail': None}
     
-    def run_speed_test(self):
+    def run_cycle(self, deadlines=None):
         """
-        Runs a speed test, saves results to the database, and returns a dictionary of results.
+        One monitoring interval. Outside probe mode this is run_speed_test().
+        In probe mode it runs a probe and follows it with a full test only
+        when probing.full_test_reason asks for one (baseline departure or
+        minimum cadence); a failed probe is treated as a departure.
+        Parameters:
+            deadlines (PhaseDeadlines): Per-phase deadlines and total budget
+                for the run; defaults to the configured ones.
+        Returns:
+            SpeedTestResult: The full test results, or the probe (tier
+                'probe', latency as ping, no upload) when no full test was needed
+            None: If the test fails or times out (see self.outcome)
+        """
+        self.timings = {}
+        deadlines = deadlines or PhaseDeadlines.from_config(self.db)
+        self.outcome = {'status': 'ok', 'phase': None, 'detail': None}
+        settings = probing.probe_settings(self.db)
+        if not settings['enabled']:
+            return self.run_speed_test(deadlines=deadlines)
+        timestamp = datetime.now()
+        self.backend.cancel = deadlines.cancel
+        try:
+            probe = deadlines.run('probe', self.backend.probe, settings['probe_bytes'])
+        except PhaseTimeout as e:
+            self._record_outcome('timeout', e.phase, str(e))
+            self._queue_write(self.save_phases, None, timestamp, deadlines, 'timeout')
+            return None
+        except Exception as e:
+            logging.warning(f"Probe failed: {e}")
+            return self.run_speed_test(tier='departure', deadlines=deadlines)
+        tier, detail = probing.full_test_reason(probe, self.db.get_probe_baseline(probing.BASELINE_SAMPLES),
+                                                self.db.get_last_full_test_time(), settings, timestamp)
+        if probe:
+            download = f"{probe['download_mbps']:.1f} Mbps" if probe['download_mbps'] else "no data"
+            logging.info(f"Probe: {probe['latency_ms']:.1f} ms connect, {download} over {probe['bytes']} bytes")
+            self._queue_write(self.db.insert_probe_result, probe['latency_ms'], probe['download_mbps'],
+                              probe['bytes'], probe['server'], tier, timestamp)
+        if tier is None:
+            self._queue_write(self.save_phases, None, timestamp, deadlines)
+            return SpeedTestResult(None, timestamp, probe['download_mbps'], None, probe['latency_ms'],
+                                   probe['server'], tier='probe')
+        logging.info(f"Running full test ({tier}: {detail})")
+        return self.run_speed_test(tier=tier, deadlines=deadlines)
+
+    def run_speed_test(self, tier='full', deadlines=None):
+        """
+        Runs a speed test and returns its SpeedTestResult.
+        Device discovery runs alongside server selection (the last count is
+        reused while fresh, see DeviceScanner.count_devices_cached); download and upload
+        start only once both are done, so nothing else uses the network while
+        throughput is measured. The database write is queued on the background
+        writer and may still be running when this returns; call
+        wait_for_writes() before exiting.
+        Every phase runs under deadlines. A device scan or fan-out that misses
+        its deadline is dropped and the run is recorded as partial; any other
+        phase that does cancels the run, which is recorded as timed out and
+        saves nothing. self.outcome holds the status, phase and detail.
+        Parameters:
+            tier (str): Why the test ran, stored in speed_tests.tier ('full',
+                or 'cadence'/'departure' in probe mode).
+            deadlines (PhaseDeadlines): Per-phase deadlines and total budget;
+                defaults to the configured ones.
         Returns:
-            dict: Speed test results (download, upload, ping, server, location, devices)
-            None: If the test fails
+            SpeedTestResult: Download, upload, ping, server, location, devices
+                and tier; id is filled in once the queued write has saved it
+            None: If the test fails or times out
         """
+        deadlines = deadlines or PhaseDeadlines.from_config(self.db)
+        self.outcome = {'status': 'ok', 'phase': None, 'detail': None}
+        self.backend.cancel = deadlines.cancel
+        scan_cancel = self.device_scanner.cancel = threading.Event()
+        timestamp = datetime.now()
         try:
             logging.info("Starting speed test...")
-            device_count = self.device_scanner.count_active_devices()
+            self.timings = {}
+            start = time.perf_counter()
+            if self.sequential:
+                devices = self._wait_optional(deadlines, deadlines.start(
+                    'scan', self.device_scanner.count_devices_cached, cancel=scan_cancel))
+                server_info = deadlines.run('select', self.backend.select_server)
+            else:
+                scan = deadlines.start('scan', self.device_scanner.count_devices_cached, cancel=scan_cancel)
+                server_info = deadlines.run('select', self.backend.select_server)
+                devices = self._wait_optional(deadlines, scan)
+            device_count, device_count_age = devices or (None, None)
             logging.info(f"Found {device_count} active devices on network")
-            st = speedtest.Speedtest()
-            st.get_best_server()
-            logging.info("Testing download speed...")
-            download_speed = st.download() / 1_000_000  # Convert to Mbps
+            discovered = time.perf_counter()
+            ping = self.backend.ping
+            download_speed = None
+            measurements = []
+            fanout = self.fanout_settings()
+            if fanout['servers'] > 1:
+                fanout_cancel = threading.Event()
+                measurements = self._wait_optional(deadlines, deadlines.start(
+                    'fanout', self.fan_out, fanout, fanout_cancel, cancel=fanout_cancel)) or []
+                ping, download_speed = self._fan_out_headline(measurements, ping)
+            fanned_out = time.perf_counter()
+            if download_speed is None:
+                logging.info(f"Testing download speed ({self.backend.name})...")
+                download_speed = deadlines.run('download', self.backend.download)
             logging.info("Testing upload speed...")
-            upload_speed = st.upload() / 1_000_000  # Convert to Mbps
-            ping = st.results.ping
-            server_info = st.get_best_server()
-            server_name = server_info.get('sponsor', 'Unknown')
-            server_location = f"{server_info.get('name', '')}, {server_info.get('country', '')}"
-            # Save to DB
-            self.db.insert_speed_test(
-                download_speed=download_speed,
-                upload_speed=upload_speed,
-                ping=ping,
-                server_name=server_name,
-                server_location=server_location,
-                device_count=device_count
-            )
-            if self.db.update_today_summary():
-                logging.info("Daily summary updated")
-            self.db.create_placeholder_entries(days_back=3)
-            import random
-            if random.randint(1, 100) == 1:
-                try:
+            upload_speed = deadlines.run('upload', self.backend.upload)
+            measured = time.perf_counter()
+            results = SpeedTestResult(
+                None, timestamp, download_speed, upload_speed, ping,
+                server_info.get('sponsor', 'Unknown'),
+                f"{server_info.get('name', '')}, {server_info.get('country', '')}",
+                device_count, tier, device_count_age)
+            self._queue_write(self.save_results, results, timestamp, measurements, deadlines)
+            self.timings = {
+                'discovery': discovered - start,
+                'fanout': fanned_out - discovered,
+                'transfer': measured - fanned_out,
+                'total': time.perf_counter() - start,
+            }
+            return results
+        except PhaseTimeout as e:
+            logging.error(f"Speed test cancelled: {e}")
+            self._record_outcome('timeout', e.phase, str(e))
+            self._queue_write(self.save_phases, None, timestamp, deadlines, 'timeout')
+            return None
+        except Exception as e:
+            logging.error(f"Speed test failed: {e}")
+            self._record_outcome('failed', deadlines.phase, str(e))
+            self._queue_write(self.save_phases, None, timestamp, deadlines, 'error')
+            return None
+        finally:
+            # Stops a scan still running after select failed or timed out
+            scan_cancel.set()
+
+    def _record_outcome(self, status, phase, detail):
+        self.outcome = {'status': status, 'phase': phase, 'detail': detail}
+
+    def _wait_optional(self, deadlines, handle):
+        """Result of an optional phase, or None (and a partial run) if it timed out"""
+        try:
+            return deadlines.wait(handle)
+        except PhaseTimeout as e:
+            logging.warning(f"Continuing without {e.phase}: {e}")
+            self._record_outcome('partial', e.phase, str(e))
+            return None
+
+    def fanout_settings(self):
+        """
+        Fan-out configuration from config, with defaults applied.
+        Returns:
+            dict: servers (N, 0 or 1 = off), workers, budget (seconds per
+                server) and bytes (short download size, 0 = latency only).
+        """
+        number = self.db.get_config_number
+        return {
+            'servers': number('fanout_servers', 0, int),
+            'workers': max(1, number('fanout_workers', DEFAULT_FANOUT_WORKERS, int)),
+            'budget': number('fanout_budget_seconds', DEFAULT_FANOUT_BUDGET_SECONDS, float),
+            'bytes': number('fanout_bytes', 0, int),
+        }
+
+    def fan_out(self, settings, cancel=None):
+        """
+        Measures the backend's top settings['servers'] candidates. Latency is
+        measured in parallel on settings['workers'] threads. Short downloads,
+        when configured, then run one server at a time, so each rate has the
+        link to itself. Each server gets settings['budget'] seconds per phase.
+        Setting cancel (threading.Event) skips the downloads not yet started.
+        Returns:
+            list: One dict per server with server_name, server_location,
+                latency_ms, download_mbps, bytes, elapsed_ms and status.
+        """
+        servers = self.backend.candidates(settings['servers'])
+        budget = settings['budget']
+
+        def timed(result, measure):
+            start = time.perf_counter()
+            try:
+                return measure()
+            except socket.timeout:
+                result['status'] = 'timeout'
+            except Exception as e:
+                logging.warning(f"Fan-out to {result['server_name']} failed: {e}")
+                result['status'] = 'error'
+            finally:
+                result['elapsed_ms'] += (time.perf_counter() - start) * 1000
+
+        def latency(server):
+            result = {
+                'server_name': server.get('sponsor', 'Unknown'),
+                'server_location': f"{server.get('name', '')}, {server.get('country', '')}",
+                'latency_ms': None, 'download_mbps': None, 'bytes': 0,
+                'elapsed_ms': 0.0, 'status': 'ok',
+            }
+            result['latency_ms'] = timed(result, lambda: self.backend.measure_latency(server, budget))
+            return result
+
+        logging.info(f"Measuring latency to {len(servers)} servers ({settings['workers']} at a time)...")
+        with ThreadPoolExecutor(max_workers=settings['workers'], thread_name_prefix='fan-out') as executor:
+            measurements = list(executor.map(latency, servers))
+
+        if settings['bytes']:
+            for server, result in zip(servers, measurements):
+                if cancel is not None and cancel.is_set():
+                    break
+                if result['status'] != 'ok':
+                    continue
+                download = timed(result, lambda: self.backend.measure_download(server, settings['bytes'], budget))
+                if download:
+                    result['download_mbps'], result['bytes'] = download
+        return measurements
+
+    def _fan_out_headline(self, measurements, ping):
+        """
+        Median latency and download across servers that answered; a single
+        slow or failing server cannot move a median of three or more.
+        Falls back to ping (and None for download) when nothing answered.
+        """
+        latencies = [m['latency_ms'] for m in measurements if m['latency_ms'] is not None]
+        downloads = [m['download_mbps'] for m in measurements if m['download_mbps'] is not None]
+        answered = sum(m['status'] == 'ok' for m in measurements)
+        logging.info(f"Fan-out: {answered}/{len(measurements)} servers answered")
+        return (statistics.median(latencies) if latencies else ping,
+                statistics.median(downloads) if downloads else None)
+
+    def _queue_write(self, write, *args):
+        """Run a database write on the background writer (inline when sequential)"""
+        if self.sequential:
+            write(*args)
+        else:
+            self.pending_writes.append(self.writer.submit(write, *args))
+
+    def save_results(self, results, timestamp, measurements=(), deadlines=None):
+        """
+        Writes one result, refreshes summaries and placeholders, and does the
+        per-run maintenance. Runs on the background writer unless sequential.
+        Parameters:
+            results (SpeedTestResult): Result returned by run_speed_test; its
+                id is set to the new row's.
+            timestamp (datetime): When the test started.
+            measurements (list): Per-server fan-out results for the run.
+            deadlines (PhaseDeadlines): The run's phases; with it, the save
+                steps are timed too and everything goes to run_phases.
+        """
+        phases = deadlines.timings if deadlines else []
+        # Save to DB (one connection, one commit for the whole write path)
+        with timed(phases, 'save'):
+            with self.db.transaction():
+                with timed(phases, 'insert'):
+                    test_id = results.id = self.db.insert_speed_test(
+                        results.download_speed, results.upload_speed, results.ping, results.server_name,
+                        results.server_location, results.device_count, timestamp, results.tier,
+                        results.device_count_age_seconds)
+                    if measurements:
+                        self.db.insert_server_measurements(test_id, timestamp, measurements)
+                with timed(phases, 'summaries'):
+                    self.db.refresh_dirty_summaries()
+                    if self.db.update_today_summary():
+                        logging.info("Daily summary updated")
+                with timed(phases, 'placeholders'):
+                    self.db.create_placeholder_entries(days_back=3)
+        with timed(phases, 'checkpoint'):
+            self.db.checkpoint('PASSIVE')
+        # One bounded incremental_vacuum step per run spreads cleanup's
+        # freed pages across runs instead of a blocking VACUUM
+        with timed(phases, 'reclaim'):
+            freed = self.db.reclaim_space(max_steps=1)
+        if freed:
+            logging.info(f"Reclaimed {freed[0]} free database pages")
+        import random
+        if random.randint(1, 100) == 1:
+            try:
+                with timed(phases, 'maintenance'):
                     speed_tests_days, _ = self.db.get_retention_policy()
                     deleted_count = self.db.archive_old_data(speed_tests_days)
                     if deleted_count[0] > 0:
@@ -88,26 +365,49 @@ class WiFiSpeedTester:
                         archived_weeks = self.db.archive_daily_to_weekly(weeks_to_keep=4)
                         if archived_weeks[0] > 0:
                             logging.info(f"Archived {archived_weeks[1]} daily summaries to {archived_weeks[0]} weekly summaries")
-                except Exception as e:
-                    logging.warning(f"Automatic cleanup failed: {e}")
-            # Return results as a dictionary
-            return {
-                "download_speed": download_speed,
-                "upload_speed": upload_speed,
-                "ping": ping,
-                "server_name": server_name,
-                "server_location": server_location,
-                "device_count": device_count
-            }
-        except Exception as e:
-            logging.error(f"Speed test failed: {e}")
-            return None
+            except Exception as e:
+                logging.warning(f"Automatic cleanup failed: {e}")
+        if deadlines:
+            self.save_phases(test_id, timestamp, deadlines)
+
+    def save_phases(self, test_id, timestamp, deadlines, status='ok'):
+        """
+        Writes the run's phase timings plus a 'total' entry (whole-run wall
+        clock, process CPU and peak RSS) to run_phases.
+        Parameters:
+            test_id (int | None): speed_tests id, None if the run saved no test.
+            status (str): Status of the total entry: ok, timeout or error.
+        """
+        self.db.insert_run_phases(test_id, timestamp, deadlines.timings + [deadlines.total(status)])
+
+    def wait_for_writes(self):
+        """
+        Blocks until every queued save has finished.
+        Returns:
+            bool: True if all of them succeeded.
+        """
+        ok = True
+        pending, self.pending_writes = self.pending_writes, []
+        for future in pending:
+            try:
+                future.result()
+            except Exception as e:
+                logging.error(f"Saving speed test failed: {e}")
+                ok = False
+        return ok
+
+    def close(self):
+        """Waits for queued saves, stops the writer and closes the database"""
+        ok = self.wait_for_writes()
+        self.writer.shutdown()
+        self.db.close()
+        return ok
 
     def print_speed_test_table(self, results):
         """
         Outputs the speed test results in a rich table format.
         Parameters:
-            results (dict): Dictionary of speed test results.
+            results (SpeedTestResult): Speed test results.
         Returns:
             None
         """
@@ -120,20 +420,27 @@ class WiFiSpeedTester:
         """
         Helper to format a speed test result row for table output.
         Parameters:
-            results (dict): Dictionary of speed test results.
+            results (SpeedTestResult): Speed test results.
         Returns:
             list: Formatted row for table output.
         """
         return [
-            f"{results['download_speed']:.2f}",
-            f"{results['upload_speed']:.2f}",
-            f"{results['ping']:.2f}",
-            f"{results['server_name']} ({results['server_location']})",
-            results['device_count']
+            f"{results.download_speed:.2f}",
+            f"{results.upload_speed:.2f}",
+            f"{results.ping:.2f}",
+            f"{results.server_name} ({results.server_location})",
+            results.device_count
         ]
 
 if __name__ == "__main__":
-    tester = WiFiSpeedTester()
+    import argparse
+    from backends import HTTPBackend
+    parser = argparse.ArgumentParser(description='Run one speed test')
+    parser.add_argument('--url', help='Measure against this HTTP endpoint (e.g. a throughput_server.py) instead of the configured backend')
+    parser.add_argument('--sequential', action='store_true', help='Run the stages one after another (for timing)')
+    args = parser.parse_args()
+    tester = WiFiSpeedTester(HTTPBackend(args.url) if args.url else None, sequential=args.sequential)
     results = tester.run_speed_test()
+    tester.close()
     if results:
         tester.print_speed_test_table(results)
\ No newline at end of file
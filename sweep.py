@@ -0,0 +1,328 @@
+"""
+Sweep
+=====
+
+Purpose:
+--------
+This module provides the Sweeper class, which finds the reachable addresses
+in a range (normally the local subnet) with one asyncio event loop instead
+of a ping subprocess per address. Addresses are probed concurrently, up to a
+bound on open probes, and each probe has its own timeout, so a sweep of a /24
+in which most addresses never answer takes about one timeout rather than one
+timeout per batch of workers.
+
+The range is consumed lazily, so memory stays bounded for a /16, and probes
+are started through a token bucket (DEFAULT_RATE a second after a burst of
+RATE_BURST). A progress callback reports sweeps of large ranges.
+
+Probes:
+-------
+icmp     One echo request per address over a single unprivileged ICMP
+         datagram socket (macOS, and Linux when net.ipv4.ping_group_range
+         allows it); replies are matched to their address as they arrive.
+tcp+udp  Where ICMP is not permitted: a TCP connect to each of TCP_PORTS and
+         a UDP datagram to UDP_PORT, all at once. An accepted or refused
+         connection, a UDP reply or an ICMP port unreachable all mean the
+         host is up; the first answer ends the probe.
+
+A sweep given a threading.Event stops when it is set: probes not yet started
+are skipped and those in flight are cancelled, within CANCEL_POLL_SECONDS.
+
+Classes:
+--------
+TokenBucket
+    Async rate limiter: await take() before each probe.
+
+Sweeper
+    Methods:
+    ---------
+    __init__(self, timeout=PROBE_TIMEOUT, concurrency=None, probe=None, rate=DEFAULT_RATE)
+        Picks the probe method; concurrency bounds the sockets open at once.
+
+    sweep(self, hosts, cancel=None, progress=None) -> list[str]
+        The reachable hosts, in the order given.
+
+    sweep_async(self, hosts, cancel=None, progress=None) -> list[str]
+        The same, as a coroutine on the running loop.
+
+Usage:
+------
+sweeper = Sweeper(timeout=1.0)
+active = sweeper.sweep(ipaddress.ip_network('192.168.0.0/22').hosts())
+print(f"{len(active)} hosts up ({sweeper.method})")
+"""
+import asyncio
+import itertools
+import resource
+import socket
+import struct
+import time
+
+PROBE_TIMEOUT = 1.0
+# Upper bound on sockets open at once; also kept under half the file limit
+MAX_CONCURRENCY = 512
+TCP_PORTS = (80, 443)
+UDP_PORT = 9  # discard: almost never open, so a live host answers "unreachable"
+# Echo requests awaiting a reply at once (they share one socket)
+ICMP_IN_FLIGHT = 4096
+CANCEL_POLL_SECONDS = 0.05
+# Probes started per second once the first RATE_BURST have gone out, so a
+# /24 still goes out at once while a /16 does not flood the network
+DEFAULT_RATE = 1000
+RATE_BURST = 256
+PROGRESS_EVERY = 4096
+_ICMP_ECHO = struct.Struct('!BBHHH')
+_PAYLOAD = b'wifi-sweep'
+
+
+def _checksum(data):
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def echo_request(sequence):
+    """An ICMP echo request packet; the kernel sets the identifier on datagram sockets"""
+    header = _ICMP_ECHO.pack(8, 0, 0, 0, sequence)
+    return _ICMP_ECHO.pack(8, 0, _checksum(header + _PAYLOAD), 0, sequence) + _PAYLOAD
+
+
+def echo_reply_sequence(packet):
+    """
+    Sequence number of an ICMP echo reply, with or without the IP header
+    (macOS includes it); None for any other packet.
+    """
+    if packet and packet[0] >> 4 == 4:
+        packet = packet[(packet[0] & 0x0f) * 4:]
+    if len(packet) >= 8 and packet[0] == 0:
+        return _ICMP_ECHO.unpack_from(packet)[4]
+    return None
+
+
+def is_echo_reply(packet):
+    """True for an ICMP echo reply, with or without the IP header (macOS includes it)"""
+    return echo_reply_sequence(packet) is not None
+
+
+def default_concurrency():
+    """MAX_CONCURRENCY, or half the open-file limit if that is lower"""
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return MAX_CONCURRENCY
+    return max(8, min(MAX_CONCURRENCY, soft // 2))
+
+
+class _IcmpEcho:
+    """One datagram ICMP socket shared by every probe of a sweep"""
+    def __init__(self, loop):
+        self.loop = loop
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+        self.sock.setblocking(False)
+        self.waiting = {}
+        self.sequence = itertools.count()
+        loop.add_reader(self.sock.fileno(), self._read)
+
+    def _read(self):
+        while True:
+            try:
+                packet, (ip, _) = self.sock.recvfrom(1024)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                # An error queued by an earlier send; the probe times out
+                continue
+            waiter = self.waiting.get(ip)
+            if waiter and not waiter.done() and is_echo_reply(packet):
+                waiter.set_result(True)
+
+    async def probe(self, ip, timeout):
+        waiter = self.loop.create_future()
+        self.waiting[ip] = waiter
+        try:
+            await self.loop.sock_sendto(self.sock, echo_request(next(self.sequence) & 0xffff), (ip, 0))
+            return await asyncio.wait_for(waiter, timeout)
+        except (asyncio.TimeoutError, OSError):
+            return False
+        finally:
+            self.waiting.pop(ip, None)
+
+    def close(self):
+        self.loop.remove_reader(self.sock.fileno())
+        self.sock.close()
+
+
+class _UdpAnswer(asyncio.DatagramProtocol):
+    def __init__(self, answered):
+        self.answered = answered
+
+    def datagram_received(self, data, addr):
+        if not self.answered.done():
+            self.answered.set_result(True)
+
+    def error_received(self, exc):
+        # ICMP port unreachable surfaces as ECONNREFUSED on a connected socket
+        if not self.answered.done():
+            self.answered.set_result(isinstance(exc, ConnectionRefusedError))
+
+
+async def tcp_probe(ip, port, timeout):
+    """True if ip accepts or refuses a connection on port within timeout"""
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+    except ConnectionRefusedError:
+        return True
+    except (asyncio.TimeoutError, OSError):
+        return False
+    writer.close()
+    return True
+
+
+async def udp_probe(ip, port, timeout):
+    """True if ip answers a datagram to port, or reports the port unreachable"""
+    loop = asyncio.get_running_loop()
+    answered = loop.create_future()
+    try:
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: _UdpAnswer(answered), remote_addr=(ip, port))
+    except OSError:
+        return False
+    try:
+        transport.sendto(b'\0')
+        return await asyncio.wait_for(answered, timeout)
+    except (asyncio.TimeoutError, OSError):
+        return False
+    finally:
+        transport.close()
+
+
+class TokenBucket:
+    """Allows rate events a second on average, with bursts of up to burst"""
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    async def take(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Sweeper:
+    def __init__(self, timeout=PROBE_TIMEOUT, concurrency=None, probe=None, rate=DEFAULT_RATE):
+        """
+        Parameters:
+            timeout (float): Seconds each probe waits for an answer.
+            concurrency (int): Sockets open at once (default_concurrency()).
+            probe (callable): Coroutine function (ip, timeout) -> bool used
+                instead of ICMP/TCP/UDP, e.g. to sweep a simulated network.
+            rate (float): Probes started per second, after an initial burst
+                of one /24; None for no limit.
+        """
+        self.timeout = timeout
+        self.concurrency = concurrency or default_concurrency()
+        self.probe = probe
+        self.rate = rate
+        if probe:
+            self.method = 'custom'
+        else:
+            try:
+                socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP).close()
+                self.method = 'icmp'
+            except OSError:
+                self.method = 'tcp+udp'
+
+    def sweep(self, hosts, cancel=None, progress=None):
+        """
+        Probes every host on a fresh event loop (safe from any thread).
+        Parameters:
+            hosts (iterable): Addresses to probe (str or ipaddress objects);
+                consumed lazily, so a generator such as network.hosts()
+                keeps memory bounded however large the range.
+            cancel (threading.Event): Stops the sweep early when set.
+            progress (callable): Called as progress(probed, found) every
+                PROGRESS_EVERY answered probes and once at the end.
+        Returns:
+            list[str]: The hosts that answered, in the order given.
+        """
+        return asyncio.run(self.sweep_async(hosts, cancel, progress))
+
+    async def sweep_async(self, hosts, cancel=None, progress=None):
+        loop = asyncio.get_running_loop()
+        icmp = _IcmpEcho(loop) if self.method == 'icmp' else None
+        if icmp:
+            # Echo requests share one socket, so only the waiters are bounded
+            slots = ICMP_IN_FLIGHT
+        else:
+            # Each fallback probe holds one socket per TCP port plus one for UDP
+            per_host = 1 if self.method != 'tcp+udp' else len(TCP_PORTS) + 1
+            slots = max(1, self.concurrency // per_host)
+        bucket = TokenBucket(self.rate, RATE_BURST) if self.rate else None
+        found = []
+        probed = 0
+        in_flight = set()
+
+        async def one(index, ip):
+            if icmp:
+                return index, ip, await icmp.probe(ip, self.timeout)
+            if self.probe:
+                return index, ip, await self.probe(ip, self.timeout)
+            return index, ip, await self._probe_fallback(ip)
+
+        def cancelled():
+            return cancel is not None and cancel.is_set()
+
+        async def settle(return_when):
+            # Waits for in-flight probes, keeping only the hosts that answered
+            nonlocal in_flight, probed
+            done, in_flight = await asyncio.wait(in_flight, timeout=CANCEL_POLL_SECONDS,
+                                                 return_when=return_when)
+            for task in done:
+                index, ip, up = task.result()
+                probed += 1
+                if up:
+                    found.append((index, ip))
+                if progress and probed % PROGRESS_EVERY == 0:
+                    progress(probed, len(found))
+
+        try:
+            for index, ip in enumerate(hosts):
+                while len(in_flight) >= slots and not cancelled():
+                    await settle(asyncio.FIRST_COMPLETED)
+                if bucket:
+                    await bucket.take()
+                if cancelled():
+                    break
+                in_flight.add(asyncio.create_task(one(index, str(ip))))
+            while in_flight and not cancelled():
+                await settle(asyncio.ALL_COMPLETED)
+        finally:
+            for task in in_flight:
+                task.cancel()
+            await asyncio.gather(*in_flight, return_exceptions=True)
+            if icmp:
+                icmp.close()
+        if progress:
+            progress(probed, len(found))
+        return [ip for _, ip in sorted(found)]
+
+    async def _probe_fallback(self, ip):
+        probes = [asyncio.create_task(tcp_probe(ip, port, self.timeout)) for port in TCP_PORTS]
+        probes.append(asyncio.create_task(udp_probe(ip, UDP_PORT, self.timeout)))
+        try:
+            for answer in asyncio.as_completed(probes):
+                if await answer:
+                    return True
+            return False
+        finally:
+            for probe in probes:
+                probe.cancel()
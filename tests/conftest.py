@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+# The modules are flat scripts at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import WiFiSpeedDB
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh database in a temporary directory, which is also the working directory"""
+    monkeypatch.chdir(tmp_path)
+    database = WiFiSpeedDB(str(tmp_path / "wifi_speed.db"))
+    yield database
+    database.close()
@@ -0,0 +1,65 @@
+import pytest
+
+from backends import DEFAULT_SERVER_CACHE_TTL_HOURS, HTTPBackend, SpeedtestCliBackend
+from throughput_server import ThroughputServer
+
+
+def test_server_cache_ttl_from_config(db):
+    db.set_config('server_cache_ttl_hours', '6')
+    assert SpeedtestCliBackend(db)._server_cache_ttl() == 6 * 3600
+
+
+def test_server_cache_ttl_not_a_number(db):
+    db.set_config('server_cache_ttl_hours', 'a day')
+    assert SpeedtestCliBackend(db)._server_cache_ttl() == DEFAULT_SERVER_CACHE_TTL_HOURS * 3600
+
+
+# HTTPBackend against the bundled server on loopback, shaped so the expected
+# rates and latency are known
+BANDWIDTH_MBPS = 40
+LATENCY_MS = 20
+TRANSFER_BYTES = 2_500_000  # ~0.5 s at BANDWIDTH_MBPS
+
+
+@pytest.fixture(scope='module')
+def shaped_server():
+    with ThroughputServer(bandwidth_mbps=BANDWIDTH_MBPS, latency_ms=LATENCY_MS) as server:
+        yield server
+
+
+@pytest.fixture
+def http_backend(shaped_server):
+    return HTTPBackend(shaped_server.url, TRANSFER_BYTES, TRANSFER_BYTES, streams=2)
+
+
+def test_http_select_server_measures_latency(http_backend, shaped_server):
+    server = http_backend.select_server()
+    assert server['url'] == shaped_server.url
+    assert LATENCY_MS <= http_backend.ping == server['latency'] < LATENCY_MS * 3
+
+
+def test_http_download_and_upload_match_shaped_bandwidth(http_backend):
+    assert BANDWIDTH_MBPS * 0.75 <= http_backend.download() <= BANDWIDTH_MBPS * 1.25
+    assert BANDWIDTH_MBPS * 0.75 <= http_backend.upload() <= BANDWIDTH_MBPS * 1.25
+
+
+def test_http_measure_download_from_candidate(http_backend):
+    candidate = http_backend.candidates(1)[0]
+    mbps, received = http_backend.measure_download(candidate, TRANSFER_BYTES)
+    assert received == TRANSFER_BYTES
+    assert BANDWIDTH_MBPS * 0.75 <= mbps <= BANDWIDTH_MBPS * 1.25
+    assert LATENCY_MS <= http_backend.measure_latency(candidate) < LATENCY_MS * 3
+
+
+def test_http_measure_download_stops_at_budget(http_backend):
+    candidate = http_backend.candidates(1)[0]
+    mbps, received = http_backend.measure_download(candidate, TRANSFER_BYTES * 4, budget=0.25)
+    assert 0 < received < TRANSFER_BYTES * 4
+    assert BANDWIDTH_MBPS * 0.5 <= mbps <= BANDWIDTH_MBPS * 1.5
+
+
+def test_http_probe_is_a_short_download(http_backend):
+    probe = http_backend.probe(250_000)
+    assert probe['server'] == '127.0.0.1'
+    assert probe['bytes'] == 250_000
+    assert probe['latency_ms'] < LATENCY_MS  # TCP connect only, no request
@@ -0,0 +1,51 @@
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from cleanup import DataCleanup
+
+
+def fill_old_tests(db, count=5000):
+    start = datetime.now() - timedelta(days=200)
+    db.insert_speed_tests_bulk(
+        (start + timedelta(minutes=i), 400.0, 40.0, 12.0, 'server', 'city', 5, 'full', 0)
+        for i in range(count))
+
+
+def wal_size(db):
+    return os.path.getsize(db.db_path + '-wal')
+
+
+def test_cleanup_old_data_truncates_wal(db):
+    fill_old_tests(db)
+    deleted, _ = db.cleanup_old_data(days_to_keep=30)
+    assert deleted == 5000
+    assert wal_size(db) == 0
+
+
+def test_auto_cleanup_truncates_wal(db):
+    fill_old_tests(db)
+    DataCleanup(db).auto_cleanup()
+    assert wal_size(db) == 0
+
+
+def test_reclaim_space_frees_a_step_per_call(db):
+    fill_old_tests(db)
+    db.cleanup_old_data(days_to_keep=30)
+    conn = db.connection()
+    conn.execute('CREATE TABLE filler (x)')
+    conn.executemany('INSERT INTO filler VALUES (?)', [('x' * 1000,)] * 2000)
+    conn.execute('DROP TABLE filler')
+    free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    assert free > 100
+
+    assert db.reclaim_space(pages_per_step=100, max_steps=1) == [100]
+    assert conn.execute('PRAGMA freelist_count').fetchone()[0] == free - 100
+
+
+def test_reclaim_space_refuses_an_open_transaction(db):
+    with pytest.raises(sqlite3.ProgrammingError):
+        with db.transaction():
+            db.reclaim_space()
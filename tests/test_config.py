@@ -0,0 +1,16 @@
+def test_config_number_parses_kind(db):
+    db.set_config('monitoring_interval', '15')
+    assert db.get_config_number('monitoring_interval', 10, int) == 15
+    db.set_config('full_test_hours', '1.5')
+    assert db.get_config_number('full_test_hours', 6.0) == 1.5
+
+
+def test_config_number_unset(db):
+    assert db.get_config_number('device_count_ttl_seconds', 600.0) == 600.0
+
+
+def test_config_number_not_a_number(db):
+    db.set_config('monitoring_interval', 'often')
+    assert db.get_config_number('monitoring_interval', 10, int) == 10
+    db.set_config('monitoring_interval', '2.5')
+    assert db.get_config_number('monitoring_interval', 10, int) == 10
@@ -0,0 +1,74 @@
+from datetime import date, datetime, timedelta
+
+from database import bad_percentage
+from records import SpeedTestResult
+from speed_test import WiFiSpeedTester
+
+GOOD = (900.0, 90.0, 10.0)
+BAD = (100.0, 10.0, 80.0)
+
+
+def add_tests(db, day, *samples):
+    """Insert (speeds, tier) samples one minute apart on `day`"""
+    start = datetime.combine(day, datetime.min.time()) + timedelta(hours=12)
+    for i, (speeds, tier) in enumerate(samples):
+        db.insert_speed_test(*speeds, timestamp=start + timedelta(minutes=i), tier=tier)
+
+
+def summary(db, day):
+    return next(s for s in db.get_daily_summaries() if s.day == day.isoformat())
+
+
+def test_departure_tests_left_out_of_pct_bad(db):
+    db.set_plan_speed("Plan", 1000, 100)
+    today = date.today()
+    add_tests(db, today, (GOOD, 'cadence'), (GOOD, 'cadence'), (GOOD, 'cadence'), (BAD, 'cadence'),
+              (BAD, 'departure'), (BAD, 'departure'))
+    db.update_daily_summary(today.isoformat())
+    day = summary(db, today)
+    assert day.sample_count == 6
+    assert day.departure_tests == 2
+    assert day.pct_bad == 25.0
+
+
+def test_rebuilt_aggregate_counts_departures(db):
+    db.set_plan_speed("Plan", 1000, 100)
+    today = date.today()
+    add_tests(db, today, (GOOD, 'full'), (BAD, 'departure'))
+    db.rebuild_daily_aggregate(today.isoformat())
+    db.update_daily_summary(today.isoformat())
+    day = summary(db, today)
+    assert (day.departure_tests, day.pct_bad) == (1, 0.0)
+
+
+def test_day_of_only_departures_rated_on_them():
+    assert bad_percentage(2, 1, departures=2, departures_bad=1) == 50.0
+    assert bad_percentage(0, 0) == 0.0
+
+
+def test_archive_summary_leaves_out_departures(db):
+    samples = [('2024-01-01',) + GOOD + ('cadence',), ('2024-01-01',) + BAD + ('departure',)]
+    row = db._archive_summary('2024-01-01', samples, (1, 'Plan', 1000, 100))
+    assert row[5] == 0.0
+    assert row[-1] == 1
+
+
+class ProbeOnlyBackend:
+    name = 'fake'
+    cancel = None
+
+    def probe(self, size):
+        return {'latency_ms': 12.0, 'download_mbps': 80.0, 'bytes': size, 'server': 'Local'}
+
+
+def test_probe_cycle_returns_a_speed_test_result(db):
+    db.set_config('probe_mode', 'on')
+    db.insert_speed_test(*GOOD, tier='cadence')
+    tester = WiFiSpeedTester(ProbeOnlyBackend())
+    try:
+        result = tester.run_cycle()
+        assert tester.wait_for_writes()
+    finally:
+        tester.close()
+    assert isinstance(result, SpeedTestResult)
+    assert (result.tier, result.ping, result.download_speed, result.upload_speed) == ('probe', 12.0, 80.0, None)
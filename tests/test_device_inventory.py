@@ -0,0 +1,48 @@
+import ipaddress
+
+import pytest
+
+from device_scanner import DeviceScanner
+
+
+@pytest.fixture
+def scanner(db, monkeypatch):
+    scanner = DeviceScanner(db=db)
+    scanner.gateway_ip = '192.168.50.1'
+    scanner.network = ipaddress.IPv4Network('192.168.50.0/24')
+    scanner.swept = []
+
+    def sweep(hosts, total, concurrency=None):
+        scanner.swept.append(total)
+        return []
+
+    monkeypatch.setattr(scanner, '_sweep', sweep)
+    monkeypatch.setattr(scanner, '_local_address', lambda: '192.168.50.9')
+    return scanner
+
+
+def arp(monkeypatch, scanner, count):
+    entries = [(f'192.168.50.{i}', f'02:00:00:00:00:{i:02x}', 'wlan0') for i in range(1, count + 1)]
+    monkeypatch.setattr(scanner, 'arp_entries', lambda: entries)
+
+
+def test_populated_arp_skips_scheduled_full_sweep(scanner, db, monkeypatch):
+    arp(monkeypatch, scanner, 5)
+    # No full sweep has ever run, so one is due
+    assert scanner.full_sweep_due()
+    assert scanner.count_active_devices() == 5
+    assert scanner.swept == [6]  # ARP entries plus this host, not 254 addresses
+    assert db.get_last_device_scan_time('full') is None
+
+
+def test_sparse_arp_sweeps_when_due(scanner, db, monkeypatch):
+    arp(monkeypatch, scanner, 1)
+    scanner.count_active_devices()
+    assert scanner.swept == [254]
+    assert db.get_last_device_scan_time('full') is not None
+
+
+def test_forced_full_sweep(scanner, db, monkeypatch):
+    arp(monkeypatch, scanner, 5)
+    scanner.count_active_devices(full=True)
+    assert scanner.swept == [254]
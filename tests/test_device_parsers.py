@@ -0,0 +1,88 @@
+import ipaddress
+import os
+
+from device_scanner import (normalize_mac, parse_arp_output, parse_ifconfig, parse_proc_arp,
+                            parse_proc_networks, parse_proc_route)
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name)) as f:
+        return f.read()
+
+
+def test_proc_route_lowest_metric_default_wins():
+    # wlan0 (metric 600) is listed before eth0 (metric 100)
+    assert parse_proc_route(fixture('proc_net_route')) == '192.168.0.1'
+
+
+def test_proc_route_order_does_not_matter():
+    header, *routes = fixture('proc_net_route').splitlines()
+    assert parse_proc_route('\n'.join([header] + routes[::-1])) == '192.168.0.1'
+
+
+def test_proc_route_without_default():
+    header, *routes = fixture('proc_net_route').splitlines()
+    on_link = [line for line in routes if not line.split()[1] == '00000000']
+    assert parse_proc_route('\n'.join([header] + on_link)) is None
+    assert parse_proc_route('') is None
+
+
+def test_proc_networks_are_on_link_routes():
+    assert parse_proc_networks(fixture('proc_net_route')) == [
+        ('docker0', ipaddress.IPv4Network('172.17.0.0/16')),
+        ('eth0', ipaddress.IPv4Network('192.168.0.0/22')),
+        ('wlan0', ipaddress.IPv4Network('192.168.1.0/24')),
+    ]
+
+
+def test_proc_arp_skips_incomplete_and_zero_entries():
+    entries = parse_proc_arp(fixture('proc_net_arp'))
+    assert entries == [
+        ('192.168.0.1', 'a4:2b:b0:c1:7e:02', 'eth0'),
+        ('192.168.0.23', 'dc:a6:32:0b:55:1f', 'eth0'),
+        ('192.168.1.77', '3c:22:fb:90:4d:11', 'wlan0'),
+        ('172.17.0.2', '02:42:ac:11:00:02', 'docker0'),
+    ]
+    ips = [ip for ip, _, _ in entries]
+    # Flags 0x0 (incomplete) and a complete entry with an all-zero MAC
+    assert '192.168.0.57' not in ips
+    assert '192.168.1.40' not in ips
+
+
+def test_arp_output_macos():
+    entries = parse_arp_output(fixture('arp_a_macos'))
+    assert ('192.168.1.1', '00:11:22:33:44:55', 'en0') in entries
+    assert ('192.168.1.23', '0a:0b:0c:0d:0e:0f', 'en0') in entries
+    assert ('192.168.1.80', '3c:2a:f4:01:02:03', 'en0') in entries
+    assert '192.168.1.57' not in [ip for ip, _, _ in entries]
+
+
+def test_arp_output_without_mac_or_interface():
+    assert parse_arp_output('host (10.0.0.2) at 1:2:3:4:5:6\n? (10.0.0.3)') == [
+        ('10.0.0.2', '01:02:03:04:05:06', None),
+        ('10.0.0.3', None, None),
+    ]
+
+
+def test_normalize_mac():
+    assert normalize_mac('a:b:c:d:e:f') == '0a:0b:0c:0d:0e:0f'
+    assert normalize_mac('0:11:A:BB:c:1') == '00:11:0a:bb:0c:01'
+    assert normalize_mac('DC:A6:32:0B:55:1F') == 'dc:a6:32:0b:55:1f'
+
+
+def test_ifconfig_macos_hex_netmask():
+    assert parse_ifconfig(fixture('ifconfig_macos')) == [
+        ipaddress.IPv4Interface('127.0.0.1/8'),
+        ipaddress.IPv4Interface('192.168.1.23/22'),
+    ]
+
+
+def test_ifconfig_net_tools():
+    # Current net-tools ("netmask 255.255.0.0") and the older "inet addr:... Mask:" layout
+    assert parse_ifconfig(fixture('ifconfig_linux')) == [
+        ipaddress.IPv4Interface('10.0.5.17/16'),
+        ipaddress.IPv4Interface('127.0.0.1/8'),
+        ipaddress.IPv4Interface('192.168.8.100/24'),
+    ]
@@ -0,0 +1,65 @@
+import errno
+import math
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import percentile
+from latency_sampler import LatencySampler, decode_batch, minute_stats
+
+
+class UnreachableSocket:
+    """An ICMP socket on a link that has just dropped"""
+    def sendto(self, packet, address):
+        raise OSError(errno.ENETUNREACH, 'Network is unreachable')
+
+    def close(self):
+        pass
+
+
+def test_network_errors_are_recorded_as_loss(db):
+    sampler = LatencySampler(db, '192.0.2.1', hz=10)
+    sampler.method, sampler._socket = 'icmp', UnreachableSocket()
+    sampler.start()
+    time.sleep(0.35)
+    sampler.stop()
+
+    assert sampler.written >= 2
+    rows = db.get_latency_batches(datetime.now() - timedelta(minutes=2), datetime.now() + timedelta(minutes=1))
+    rtts = [rtt for _, _, offsets, blob in rows for rtt in decode_batch(offsets, blob)[1]]
+    assert len(rtts) == sampler.written
+    assert all(math.isnan(rtt) for rtt in rtts)
+    assert minute_stats(db, datetime.now() - timedelta(minutes=2))[-1]['loss_pct'] == 100
+
+
+# The thread still ends with the error; the point is that it flushes first
+@pytest.mark.filterwarnings('ignore::pytest.PytestUnhandledThreadExceptionWarning')
+def test_buffer_is_flushed_when_sampling_fails(db):
+    sampler = LatencySampler(db, '192.0.2.1', hz=10)
+    calls = []
+
+    def sample():
+        calls.append(None)
+        if len(calls) > 3:
+            raise RuntimeError('unexpected')
+        return 1.5
+
+    sampler.sample = sample
+    sampler.start()
+    sampler.thread.join(2)
+
+    assert not sampler.thread.is_alive()
+    assert sampler.flushed == sampler.written == 3
+
+
+def test_minute_stats_percentiles(db):
+    sampler = LatencySampler(db, '192.0.2.1')
+    now = time.time()
+    rtts = [1.0, 2.0, 3.0, 4.0, 50.0]
+    for offset, rtt in enumerate(rtts):
+        sampler.record(now - now % 60 + offset, rtt)
+    sampler.flush()
+    (minute,) = minute_stats(db, datetime.now() - timedelta(minutes=1))
+    assert minute['p50_ms'] == percentile(rtts, 50)
+    assert math.isclose(minute['p99_ms'], percentile(rtts, 99))
@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+
+import partitions
+from database import WiFiSpeedDB
+
+
+def layout_lookups(db, call):
+    statements = []
+    conn = db.connection()
+    conn.set_trace_callback(statements.append)
+    try:
+        call()
+    finally:
+        conn.set_trace_callback(None)
+    return [sql for sql in statements if 'sqlite_master' in sql]
+
+
+def test_layout_is_cached_per_connection(db):
+    db.insert_speed_test(500.0, 50.0, 12.0)
+    assert layout_lookups(db, lambda: db.insert_speed_test(500.0, 50.0, 12.0)) == []
+
+
+def test_enable_resets_the_cached_layout(db):
+    db.insert_speed_test(500.0, 50.0, 12.0)
+    assert not db.is_partitioned()
+    db.enable_partitioning()
+    assert db.is_partitioned()
+    db.insert_speed_test(500.0, 50.0, 12.0)
+    cursor = db.connection().cursor()
+    assert sum(cursor.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+               for _, table in partitions.partitions(cursor)) == 2
+
+
+def test_partitioned_by_another_connection(db):
+    old = datetime.now() - timedelta(days=120)
+    db.insert_speed_test(500.0, 50.0, 12.0, timestamp=old)
+    # A second process (its own connections) switches the layout
+    other = WiFiSpeedDB(db.db_path)
+    other.enable_partitioning()
+    other.close()
+
+    db.insert_speed_test(500.0, 50.0, 12.0)
+    assert db.is_partitioned()
+    deleted, _ = db.cleanup_old_data(days_to_keep=30)
+    assert deleted == 1
+    assert db.connection().execute('SELECT COUNT(*) FROM speed_tests').fetchone()[0] == 1
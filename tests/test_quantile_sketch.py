@@ -0,0 +1,63 @@
+import math
+import random
+
+import pytest
+
+from database import percentile
+from quantile_sketch import QuantileSketch
+
+QUANTILES = [0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99, 1.0]
+
+
+def skewed_sample(n=20_000, seed=7):
+    """Ping-like: mostly a few ms, a long tail of spikes, some exact zeros"""
+    rng = random.Random(seed)
+    values = [rng.lognormvariate(2.5, 0.8) for _ in range(n)]
+    values += [rng.uniform(200, 2000) for _ in range(n // 50)]
+    values += [0.0] * (n // 100)
+    rng.shuffle(values)
+    return values
+
+
+def sketch_of(values, relative_accuracy=0.01):
+    sketch = QuantileSketch(relative_accuracy)
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+@pytest.mark.parametrize('relative_accuracy', [0.01, 0.05])
+def test_relative_error_bound(relative_accuracy):
+    values = skewed_sample()
+    ordered = sorted(values)
+    sketch = sketch_of(values, relative_accuracy)
+    for q in QUANTILES:
+        rank = q * (len(ordered) - 1)
+        x_lo, x_hi = ordered[math.floor(rank)], ordered[math.ceil(rank)]
+        exact = percentile(values, q * 100)
+        estimate = sketch.quantile(q)
+        assert x_lo <= exact <= x_hi
+        assert x_lo * (1 - relative_accuracy) <= estimate <= x_hi * (1 + relative_accuracy), q
+        # Against the exact interpolated percentile the error is the relative
+        # bound plus at most the gap between the two neighbouring samples
+        assert abs(estimate - exact) <= relative_accuracy * exact + (x_hi - x_lo) + 1e-9, q
+
+
+def test_merge_matches_one_sketch():
+    values = skewed_sample()
+    whole = sketch_of(values)
+    merged = QuantileSketch()
+    # Uneven parts, as days of different length would be
+    for start, end in [(0, 1), (1, 5000), (5000, 5001), (5001, len(values))]:
+        merged.merge(sketch_of(values[start:end]))
+    assert merged.count == whole.count
+    assert merged.zero_count == whole.zero_count
+    assert merged.bins == whole.bins
+    for q in QUANTILES:
+        assert merged.quantile(q) == whole.quantile(q)
+
+
+def test_round_trip_through_bytes():
+    sketch = sketch_of(skewed_sample(2000))
+    restored = QuantileSketch.from_bytes(sketch.to_bytes())
+    assert [restored.quantile(q) for q in QUANTILES] == [sketch.quantile(q) for q in QUANTILES]
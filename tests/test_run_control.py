@@ -0,0 +1,34 @@
+import threading
+import time
+
+from run_control import PhaseDeadlines, timed
+
+
+def spin(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+
+
+def test_phase_cpu_excludes_other_threads():
+    stop = threading.Event()
+    busy = threading.Thread(target=lambda: [spin(0.01) for _ in iter(stop.is_set, True)])
+    busy.start()
+    try:
+        deadlines = PhaseDeadlines()
+        deadlines.run('scan', time.sleep, 0.3)
+    finally:
+        stop.set()
+        busy.join()
+    (entry,) = deadlines.timings
+    assert entry['duration_ms'] >= 300
+    # The sleeping phase used almost no CPU, however busy the other thread was
+    assert entry['cpu_ms'] < 100
+
+
+def test_timed_counts_the_block_thread():
+    timings = []
+    with timed(timings, 'insert'):
+        spin(0.2)
+    assert timings[0]['cpu_ms'] >= 100
+    assert timings[0]['status'] == 'ok'
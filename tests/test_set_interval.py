@@ -0,0 +1,32 @@
+import sys
+
+import pytest
+
+import set_interval
+
+
+def run(monkeypatch, *argv):
+    monkeypatch.setattr(sys, 'argv', ['set_interval.py', *argv])
+    set_interval.main()
+
+
+@pytest.mark.parametrize('argv, key, value', [
+    (['--full-sweep', '30'], 'device_full_sweep_minutes', '30.0'),
+    (['--device-ttl', '0'], 'device_count_ttl_seconds', '0.0'),
+    (['--fanout', '3'], 'fanout_servers', '3'),
+])
+def test_setting_options_skip_interactive_mode(db, monkeypatch, argv, key, value):
+    def no_prompt(prompt=''):
+        raise AssertionError(f"unexpected prompt: {prompt}")
+
+    monkeypatch.setattr('builtins.input', no_prompt)
+    run(monkeypatch, *argv)
+    assert db.get_config(key) == value
+
+
+def test_no_options_is_interactive(db, monkeypatch, capsys):
+    prompts = []
+    monkeypatch.setattr('builtins.input', lambda prompt='': prompts.append(prompt) or '')
+    run(monkeypatch)
+    assert len(prompts) == 1
+    assert "Available Interval Presets" in capsys.readouterr().out
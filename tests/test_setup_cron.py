@@ -0,0 +1,32 @@
+import setup_cron
+from database import WiFiSpeedDB
+
+
+class FakeCrontab:
+    """Stands in for `crontab -l` (empty) and `crontab -` (captures the new table)"""
+
+    def __init__(self):
+        self.installed = None
+        self.returncode = 0
+
+    def run(self, args, **kwargs):
+        return setup_cron.subprocess.CompletedProcess(args, 1, stdout='', stderr='')
+
+    def popen(self, args, **kwargs):
+        return self
+
+    def communicate(self, input=None):
+        self.installed = input
+
+
+def test_cron_interval_falls_back_when_not_a_number(tmp_path, monkeypatch):
+    monkeypatch.setattr(setup_cron, '__file__', str(tmp_path / 'setup_cron.py'))
+    db = WiFiSpeedDB(str(tmp_path / 'wifi_speed.db'))
+    db.set_config('monitoring_interval', 'often')
+    db.close()
+    crontab = FakeCrontab()
+    monkeypatch.setattr(setup_cron.subprocess, 'run', crontab.run)
+    monkeypatch.setattr(setup_cron.subprocess, 'Popen', crontab.popen)
+
+    setup_cron.setup_cron_job()
+    assert crontab.installed.startswith('*/10 * * * * ')
@@ -0,0 +1,60 @@
+import sqlite3
+
+import pytest
+
+import database
+from database import WiFiSpeedDB
+from migrations import SCHEMA_VERSION
+
+
+@pytest.fixture
+def traced(monkeypatch):
+    """Statements run on each new connection after its per-connection pragmas"""
+    statements = []
+    open_connection = database.ConnectionManager._open_connection
+
+    def traced_open(manager):
+        conn = open_connection(manager)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    monkeypatch.setattr(database.ConnectionManager, '_open_connection', traced_open)
+    return statements
+
+
+def user_version(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('PRAGMA user_version').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_new_database_is_migrated(tmp_path):
+    path = str(tmp_path / 'wifi_speed.db')
+    WiFiSpeedDB(path).close()
+    assert user_version(path) == SCHEMA_VERSION
+
+
+def test_up_to_date_database_costs_one_version_read(tmp_path, traced):
+    path = str(tmp_path / 'wifi_speed.db')
+    WiFiSpeedDB(path).close()
+    traced.clear()
+
+    WiFiSpeedDB(path).close()
+
+    assert traced == ['PRAGMA user_version']
+
+
+def test_older_database_runs_pending_migrations(tmp_path, traced):
+    path = str(tmp_path / 'wifi_speed.db')
+    WiFiSpeedDB(path).close()
+    conn = sqlite3.connect(path)
+    conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION - 1}')
+    conn.close()
+    traced.clear()
+
+    WiFiSpeedDB(path).close()
+
+    assert len(traced) > 1
+    assert user_version(path) == SCHEMA_VERSION
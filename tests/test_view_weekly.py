@@ -0,0 +1,33 @@
+from view_weekly import view_weekly_summaries
+
+
+def add_week(db, week_start, week_end, pct_bad):
+    with db.transaction() as conn:
+        conn.execute('''
+            INSERT INTO weekly_summary
+            (week_start, week_end, days_with_data, total_samples,
+             avg_download_mbps, avg_upload_mbps, avg_ping_ms, weekly_pct_bad,
+             good_days, meh_days, bad_days, no_data_days, status, created_at)
+            VALUES (?, ?, 7, 168, 400, 40, 12, ?, 7, 0, 0, 0, 'excellent', ?)
+        ''', (week_start, week_end, pct_bad, week_end))
+
+
+def test_trend_with_several_weeks(db, capsys):
+    weeks = [('2026-08-30', '2026-09-05'), ('2026-09-06', '2026-09-12'),
+             ('2026-09-13', '2026-09-19'), ('2026-09-20', '2026-09-26'),
+             ('2026-09-27', '2026-10-03'), ('2026-10-04', '2026-10-10'),
+             ('2026-10-11', '2026-10-17')]
+    for pct_bad, (start, end) in zip((30, 30, 30, 30, 30, 30, 10), weeks):
+        add_week(db, start, end, pct_bad)
+
+    view_weekly_summaries(limit=12)
+
+    out = capsys.readouterr().out
+    assert "Last 7 Weekly" in out
+    # Newest week (10% bad) against the one before it (30% bad)
+    assert "Performance improving" in out
+
+
+def test_no_summaries(db, capsys):
+    view_weekly_summaries()
+    assert "No weekly summaries found." in capsys.readouterr().out
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+ThroughputServer
+================
+
+Purpose:
+--------
+This module provides a small HTTP server that stands in for a speed test
+server on localhost, so the measurement pipeline can be tested and
+benchmarked without a network. Bandwidth and latency can be shaped to make
+runs deterministic. It speaks the protocol used by HTTPBackend in backends.py:
+
+    GET  /latency               -> 'ok' after the configured latency
+    GET  /download?bytes=N      -> N bytes of payload
+    POST /upload                -> reads the body, replies with the byte count
+
+Shaping:
+--------
+latency_ms delays every response (once per request, like one round trip).
+bandwidth_mbps caps the combined rate of all downloads and uploads with one
+shared token bucket, so parallel streams split the link as they would on a
+real one. Leave either unset for raw loopback speed.
+
+Class:
+------
+ThroughputServer
+    Methods:
+    ---------
+    __init__(self, host='127.0.0.1', port=0, bandwidth_mbps=None, latency_ms=0)
+        Port 0 picks a free port.
+
+    start(self) -> ThroughputServer / stop(self)
+        Serves from a background thread; also usable as a context manager.
+
+    url -> str
+        Base URL for HTTPBackend, e.g. 'http://127.0.0.1:54321'.
+
+Usage:
+------
+with ThroughputServer(bandwidth_mbps=100, latency_ms=20) as server:
+    backend = HTTPBackend(server.url)
+
+python3 throughput_server.py --port 8080 --bandwidth 100 --latency 20
+"""
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CHUNK_SIZE = 256 * 1024
+PAYLOAD = bytes(CHUNK_SIZE)
+
+
+class TokenBucket:
+    """Shared byte-rate limiter; consume() sleeps until the bytes may pass"""
+    def __init__(self, rate_bytes, burst_bytes=CHUNK_SIZE):
+        self.rate = rate_bytes
+        self.burst = burst_bytes
+        self.tokens = burst_bytes
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, count):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= count
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class ThroughputHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without TCP_NODELAY the
+    # body waits on a delayed ACK and /latency reads ~40 ms high
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _shape(self, count):
+        bucket = self.server.bucket
+        if bucket:
+            bucket.consume(count)
+
+    def _reply(self, body):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if url.path == '/latency':
+            self._reply(b'ok')
+        elif url.path == '/download':
+            size = int(parse_qs(url.query).get('bytes', ['0'])[0])
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(size))
+            self.end_headers()
+            remaining = size
+            while remaining > 0:
+                count = min(remaining, CHUNK_SIZE)
+                self._shape(count)
+                self.wfile.write(PAYLOAD[:count] if count < CHUNK_SIZE else PAYLOAD)
+                remaining -= count
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/upload':
+            self.send_error(404)
+            return
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        size = int(self.headers.get('Content-Length', 0))
+        buffer = bytearray(CHUNK_SIZE)
+        view = memoryview(buffer)
+        received = 0
+        while received < size:
+            count = self.rfile.readinto(view[:min(CHUNK_SIZE, size - received)])
+            if not count:
+                break
+            self._shape(count)
+            received += count
+        self._reply(str(received).encode())
+
+
+class ThroughputServer:
+    def __init__(self, host='127.0.0.1', port=0, bandwidth_mbps=None, latency_ms=0):
+        """
+        Creates (but does not start) the server.
+        Parameters:
+            host (str): Address to bind; keep the loopback default for tests.
+            port (int): Port to bind, or 0 for any free port.
+            bandwidth_mbps (float): Combined rate cap in Mbps, None for unlimited.
+            latency_ms (float): Delay added to every response.
+        """
+        self.httpd = ThreadingHTTPServer((host, port), ThroughputHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.bucket = TokenBucket(bandwidth_mbps * 1_000_000 / 8) if bandwidth_mbps else None
+        self.httpd.latency = latency_ms / 1000.0
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve from a background thread"""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and release the port"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local throughput server for offline speed tests')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to bind (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8080, help='Port to bind, 0 for any (default: 8080)')
+    parser.add_argument('--bandwidth', type=float, metavar='MBPS', help='Cap combined throughput (Mbps)')
+    parser.add_argument('--latency', type=float, default=0, metavar='MS', help='Delay every response (ms)')
+    args = parser.parse_args()
+
+    server = ThroughputServer(args.host, args.port, args.bandwidth, args.latency)
+    # First line is machine-readable so scripts can start this with --port 0
+    print(server.url, flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -22,32 +22,34 @@ def view_daily_summaries(limit=14):
         return
     
     print(f"\n📅 Last {len(summaries)} Daily WiFi Performance Summaries")
-    print("=" * 95)
-    print(f"{'Day':<12} {'Samples':<8} {'Down':<10} {'Up':<8} {'Ping':<8} {'Bad%':<6} {'Devices':<8} {'Status':<12}")
-    print("-" * 95)
+    print("=" * 100)
+    print(f"{'Day':<12} {'Samples':<8} {'Dep':<4} {'Down':<10} {'Up':<8} {'Ping':<8} {'Bad%':<6} {'Devices':<8} {'Status':<12}")
+    print("-" * 100)
     
     for summary in summaries:
-        day = summary[0]
-        sample_count = summary[1]
-        median_down = f"{summary[2]:.0f} Mbps"
-        median_up = f"{summary[3]:.0f} Mbps"
-        p95_ping = f"{summary[4]:.0f} ms"
-        pct_bad = f"{summary[5]:.1f}%"
-        avg_devices = f"{summary[6]:.0f}" if summary[6] else "?"
-        status = format_status(summary[7])
+        day = summary.day
+        sample_count = summary.sample_count
+        # Full tests a probe departure triggered; not counted in Bad%
+        departures = summary.departure_tests
+        median_down = f"{summary.median_download_mbps:.0f} Mbps"
+        median_up = f"{summary.median_upload_mbps:.0f} Mbps"
+        p95_ping = f"{summary.p95_ping_ms:.0f} ms"
+        pct_bad = f"{summary.pct_bad:.1f}%"
+        avg_devices = f"{summary.avg_device_count:.0f}" if summary.avg_device_count else "?"
+        status = format_status(summary.status)
         
-        print(f"{day:<12} {sample_count:<8} {median_down:<10} {median_up:<8} {p95_ping:<8} {pct_bad:<6} {avg_devices:<8} {status:<12}")
+        print(f"{day:<12} {sample_count:<8} {departures:<4} {median_down:<10} {median_up:<8} {p95_ping:<8} {pct_bad:<6} {avg_devices:<8} {status:<12}")
     
     # Calculate overall stats
     if summaries:
-        total_samples = sum(s[1] for s in summaries)
-        avg_bad_pct = sum(s[5] for s in summaries) / len(summaries)
+        total_samples = sum(s.sample_count for s in summaries)
+        avg_bad_pct = sum(s.pct_bad for s in summaries) / len(summaries)
         
-        good_days = len([s for s in summaries if s[7] == 'good'])
-        meh_days = len([s for s in summaries if s[7] == 'meh'])
-        bad_days = len([s for s in summaries if s[7] == 'bad'])
+        good_days = len([s for s in summaries if s.status == 'good'])
+        meh_days = len([s for s in summaries if s.status == 'meh'])
+        bad_days = len([s for s in summaries if s.status == 'bad'])
         
-        print("-" * 95)
+        print("-" * 100)
         print(f"Summary: {total_samples} total samples, {avg_bad_pct:.1f}% avg bad rate")
         print(f"Days: {good_days} good, {meh_days} meh, {bad_days} bad")
 
@@ -21,58 +21,86 @@ def view_results(limit=10):
     
     if plan:
         print(f"📋 Current Plan: {plan[1]} (Down: {plan[2]} Mbps, Up: {plan[3]} Mbps)")
-        print("=" * 105)
-        print(f"{'Timestamp':<20} {'Download':<15} {'Upload':<13} {'Ping':<8} {'Devices':<8} {'Performance':<15} {'Server':<20}")
-        print("-" * 105)
+        print("=" * 115)
+        print(f"{'Timestamp':<20} {'Download':<15} {'Upload':<13} {'Ping':<8} {'Devices':<8} {'Tier':<10} {'Performance':<15} {'Server':<20}")
+        print("-" * 115)
         
         for result in results:
-            timestamp = format_timestamp(result[1])
-            download = f"{result[2]:.1f} Mbps"
-            upload = f"{result[3]:.1f} Mbps"
-            ping = f"{result[4]:.1f} ms"
-            devices = str(result[7]) if result[7] is not None else "?"
-            server = result[5] if result[5] else "Unknown"
+            timestamp = format_timestamp(result.timestamp)
+            download = f"{result.download_speed:.1f} Mbps"
+            upload = f"{result.upload_speed:.1f} Mbps"
+            ping = f"{result.ping:.1f} ms"
+            devices = str(result.device_count) if result.device_count is not None else "?"
+            server = result.server_name if result.server_name else "Unknown"
             
-            if result[9] and result[10]:
-                performance = f"↓{result[9]:.0f}% ↑{result[10]:.0f}%"
+            if result.download_percentage and result.upload_percentage:
+                performance = f"↓{result.download_percentage:.0f}% ↑{result.upload_percentage:.0f}%"
             else:
                 performance = "No plan set"
             
-            print(f"{timestamp:<20} {download:<15} {upload:<13} {ping:<8} {devices:<8} {performance:<15} {server:<20}")
+            print(f"{timestamp:<20} {download:<15} {upload:<13} {ping:<8} {devices:<8} {result.tier:<10} {performance:<15} {server:<20}")
     else:
         print("⚠️  No internet plan configured. Set one with: python3 set_plan.py")
         print(f"\n📊 Last {len(results)} WiFi Speed Test Results:")
-        print("=" * 90)
-        print(f"{'Timestamp':<20} {'Download':<12} {'Upload':<10} {'Ping':<8} {'Devices':<8} {'Server':<25}")
-        print("-" * 90)
+        print("=" * 100)
+        print(f"{'Timestamp':<20} {'Download':<12} {'Upload':<10} {'Ping':<8} {'Devices':<8} {'Tier':<10} {'Server':<25}")
+        print("-" * 100)
         
         for result in results:
-            timestamp = format_timestamp(result[1])
-            download = f"{result[2]:.1f} Mbps"
-            upload = f"{result[3]:.1f} Mbps"
-            ping = f"{result[4]:.1f} ms"
-            devices = str(result[7]) if result[7] is not None else "?"
-            server = result[5] if result[5] else "Unknown"
+            timestamp = format_timestamp(result.timestamp)
+            download = f"{result.download_speed:.1f} Mbps"
+            upload = f"{result.upload_speed:.1f} Mbps"
+            ping = f"{result.ping:.1f} ms"
+            devices = str(result.device_count) if result.device_count is not None else "?"
+            server = result.server_name if result.server_name else "Unknown"
             
-            print(f"{timestamp:<20} {download:<12} {upload:<10} {ping:<8} {devices:<8} {server:<25}")
+            print(f"{timestamp:<20} {download:<12} {upload:<10} {ping:<8} {devices:<8} {result.tier:<10} {server:<25}")
     
     if results:
-        avg_download = sum(r[2] for r in results) / len(results)
-        avg_upload = sum(r[3] for r in results) / len(results)
-        avg_ping = sum(r[4] for r in results) / len(results)
+        avg_download = sum(r.download_speed for r in results) / len(results)
+        avg_upload = sum(r.upload_speed for r in results) / len(results)
+        avg_ping = sum(r.ping for r in results) / len(results)
         
-        print("-" * 105 if plan else "-" * 90)
+        print("-" * 115 if plan else "-" * 100)
         print(f"{'Average:':<20} {avg_download:.1f} Mbps {avg_upload:.1f} Mbps {avg_ping:.1f} ms")
         
-        if plan and any(r[9] for r in results if r[9]):
-            avg_down_perf = sum(r[9] for r in results if r[9]) / len([r for r in results if r[9]])
-            avg_up_perf = sum(r[10] for r in results if r[10]) / len([r for r in results if r[10]])
+        if plan and any(r.download_percentage for r in results):
+            avg_down_perf = sum(r.download_percentage for r in results if r.download_percentage) / len([r for r in results if r.download_percentage])
+            avg_up_perf = sum(r.upload_percentage for r in results if r.upload_percentage) / len([r for r in results if r.upload_percentage])
             print(f"{'Performance:':<20} ↓{avg_down_perf:.0f}% ↑{avg_up_perf:.0f}% of plan speeds")
+    
+    probes = db.get_recent_probes(1)
+    if probes:
+        print(f"\n🔎 Latest probe {format_timestamp(probes[0][0])}: {probes[0][1]:.1f} ms connect"
+              + (f", {probes[0][2]:.1f} Mbps" if probes[0][2] else "")
+              + " (python3 view_results.py --probes for more)")
+    print("Tier: full = scheduled test, cadence/departure = full test triggered in probe mode")
+
+def view_probes(limit=10):
+    db = WiFiSpeedDB()
+    probes = db.get_recent_probes(limit)
+    
+    if not probes:
+        print("No probe results found. Enable probe mode with: python3 set_interval.py --probe on")
+        return
+    
+    print(f"\n🔎 Last {len(probes)} Probes:")
+    print("=" * 80)
+    print(f"{'Timestamp':<20} {'Connect':<12} {'Download':<14} {'Full test':<12} {'Server':<20}")
+    print("-" * 80)
+    for timestamp, latency, download, server, full_test in probes:
+        download = f"{download:.1f} Mbps" if download else "-"
+        print(f"{format_timestamp(timestamp):<20} {f'{latency:.1f} ms':<12} {download:<14} "
+              f"{full_test or '-':<12} {server or 'Unknown':<20}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='View WiFi speed test results')
     parser.add_argument('-n', '--number', type=int, default=10, 
                         help='Number of recent results to show (default: 10)')
+    parser.add_argument('--probes', action='store_true', help='Show probe results instead of full tests')
     
     args = parser.parse_args()
-    view_results(args.number)
\ No newline at end of file
+    if args.probes:
+        view_probes(args.number)
+    else:
+        view_results(args.number)
\ No newline at end of file
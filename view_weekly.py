@@ -44,22 +44,22 @@ def view_weekly_summaries(limit=12):
     print("-" * 110)
     
     for summary in summaries:
-        week_range = format_week_range(summary[0], summary[1])
-        days_with_data = summary[2]
-        total_samples = summary[3]
-        avg_download = f"{summary[4]:.0f} Mbps"
-        avg_upload = f"{summary[5]:.0f} Mbps"
-        avg_ping = f"{summary[6]:.0f} ms"
-        weekly_pct_bad = f"{summary[7]:.1f}%"
+        week_range = format_week_range(summary.week_start, summary.week_end)
+        days_with_data = summary.days_with_data
+        total_samples = summary.total_samples
+        avg_download = f"{summary.avg_download_mbps:.0f} Mbps"
+        avg_upload = f"{summary.avg_upload_mbps:.0f} Mbps"
+        avg_ping = f"{summary.avg_ping_ms:.0f} ms"
+        weekly_pct_bad = f"{summary.weekly_pct_bad:.1f}%"
         
         # Day breakdown
-        good_days = summary[8]
-        meh_days = summary[9] 
-        bad_days = summary[10]
-        no_data_days = summary[11]
+        good_days = summary.good_days
+        meh_days = summary.meh_days 
+        bad_days = summary.bad_days
+        no_data_days = summary.no_data_days
         day_breakdown = f"{good_days}/{meh_days}/{bad_days}"
         
-        status = format_weekly_status(summary[12])
+        status = format_weekly_status(summary.status)
         
         print(f"{week_range:<12} {days_with_data:<5} {total_samples:<8} {avg_download:<10} {avg_upload:<8} {avg_ping:<8} {weekly_pct_bad:<6} {day_breakdown:<12} {status:<15}")
     
@@ -67,15 +67,15 @@ def view_weekly_summaries(limit=12):
     if summaries:
         recent_4_weeks = summaries[:4] if len(summaries) >= 4 else summaries
         
-        avg_weekly_samples = sum(s[3] for s in recent_4_weeks) / len(recent_4_weeks)
-        avg_weekly_down = sum(s[4] for s in recent_4_weeks) / len(recent_4_weeks)
-        avg_weekly_up = sum(s[5] for s in recent_4_weeks) / len(recent_4_weeks)
-        avg_weekly_bad = sum(s[7] for s in recent_4_weeks) / len(recent_4_weeks)
+        avg_weekly_samples = sum(s.total_samples for s in recent_4_weeks) / len(recent_4_weeks)
+        avg_weekly_down = sum(s.avg_download_mbps for s in recent_4_weeks) / len(recent_4_weeks)
+        avg_weekly_up = sum(s.avg_upload_mbps for s in recent_4_weeks) / len(recent_4_weeks)
+        avg_weekly_bad = sum(s.weekly_pct_bad for s in recent_4_weeks) / len(recent_4_weeks)
         
-        excellent_weeks = len([s for s in recent_4_weeks if s[12] == 'excellent'])
-        good_weeks = len([s for s in recent_4_weeks if s[12] == 'good'])
-        poor_weeks = len([s for s in recent_4_weeks if s[12] == 'poor'])
-        bad_weeks = len([s for s in recent_4_weeks if s[12] == 'bad'])
+        excellent_weeks = len([s for s in recent_4_weeks if s.status == 'excellent'])
+        good_weeks = len([s for s in recent_4_weeks if s.status == 'good'])
+        poor_weeks = len([s for s in recent_4_weeks if s.status == 'poor'])
+        bad_weeks = len([s for s in recent_4_weeks if s.status == 'bad'])
         
         print("-" * 110)
         print(f"4-Week Average: {avg_weekly_samples:.0f} samples, {avg_weekly_down:.0f} Mbps down, {avg_weekly_up:.0f} Mbps up, {avg_weekly_bad:.1f}% bad")
@@ -83,8 +83,8 @@ def view_weekly_summaries(limit=12):
         
         # Trend analysis
         if len(summaries) >= 2:
-            latest_bad = summaries[0][7]
-            previous_bad = summaries[1][7] 
+            latest_bad = summaries[0].weekly_pct_bad
+            previous_bad = summaries[1].weekly_pct_bad 
             
             if latest_bad < previous_bad - 5:
                 print("📈 Trend: Performance improving")
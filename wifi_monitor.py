@@ -1,16 +1,147 @@
 #!/usr/bin/env python3
+import time
+STARTED = time.perf_counter()
+
+import argparse
+import logging
 import os
+import signal
 import sys
+from datetime import datetime
+from latency_sampler import LatencySampler
+from run_control import LOCK_PATH, PhaseDeadlines, PhaseTimeout, RunLock
+from scheduler import IntervalScheduler
 from speed_test import WiFiSpeedTester
 
+DEFAULT_INTERVAL_MINUTES = 10
+
+
+def get_interval_seconds(db):
+    """monitoring_interval from config (set_interval.py), in seconds"""
+    minutes = db.get_config_number('monitoring_interval', DEFAULT_INTERVAL_MINUTES, int)
+    return max(minutes, 1) * 60
+
+
+def run_once(tester, mode, interval_seconds):
+    """
+    One monitored run: takes the run lock, runs the cycle and waits for its
+    save under the phase deadlines, and records the outcome in monitor_runs.
+    A tick that finds the lock held records 'overlap' and does nothing else.
+    Returns:
+        bool: True if the cycle succeeded and was saved.
+    """
+    lock = RunLock(LOCK_PATH)
+    if not lock.acquire():
+        logging.warning("Another monitor run is still in progress; skipping this tick")
+        tester.db.insert_monitor_run('overlap', mode)
+        tester.timings = {}
+        tester.outcome = {'status': 'overlap', 'phase': None, 'detail': None}
+        return False
+    try:
+        timestamp = datetime.now()
+        deadlines = PhaseDeadlines.from_config(tester.db, interval_seconds)
+        result = tester.run_cycle(deadlines)
+        outcome = dict(tester.outcome)
+        try:
+            saved = deadlines.run('persist', tester.wait_for_writes, budget=False)
+        except PhaseTimeout as e:
+            logging.error(f"Save cancelled: {e}")
+            saved = False
+            outcome = {'status': 'timeout', 'phase': e.phase, 'detail': str(e)}
+        if not saved and outcome['status'] in ('ok', 'partial'):
+            outcome = {'status': 'failed', 'phase': 'persist', 'detail': 'save failed'}
+        duration_ms = (time.monotonic() - deadlines.started) * 1000
+        tester.db.insert_monitor_run(outcome['status'], mode, outcome['phase'], duration_ms,
+                                     outcome['detail'], timestamp)
+        return result is not None and saved
+    finally:
+        lock.release()
+
+
+def run_daemon(tester, latency_hz=0):
+    """
+    Run speed tests every monitoring_interval minutes in this process, reusing
+    the tester's database connection and device scanner, until SIGTERM/SIGINT.
+    With latency_hz, gateway latency is also sampled in the background.
+    """
+    # What cron pays on every tick: imports plus database and scanner setup
+    startup = time.perf_counter() - STARTED
+    logging.info(f"Monitor daemon started in {startup * 1000:.0f} ms "
+                 f"(paid once here, on every tick under cron)")
+
+    scheduler = IntervalScheduler(lambda: get_interval_seconds(tester.db))
+    signal.signal(signal.SIGTERM, lambda signum, frame: scheduler.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: scheduler.stop())
+
+    recorded_skips = 0
+
+    def record_skips():
+        # Ticks the scheduler dropped because a cycle overran its interval
+        nonlocal recorded_skips
+        for _ in range(scheduler.skipped - recorded_skips):
+            tester.db.insert_monitor_run('skipped', 'daemon', detail='previous cycle overran the interval')
+        recorded_skips = scheduler.skipped
+
+    def cycle():
+        record_skips()
+        lateness = scheduler.lateness[-1]
+        start = time.perf_counter()
+        run_once(tester, 'daemon', get_interval_seconds(tester.db))
+        elapsed = time.perf_counter() - start
+        timings, outcome = tester.timings, tester.outcome
+        if outcome['status'] not in ('ok', 'partial'):
+            phases = f"{outcome['status']} in {outcome['phase']}"
+        elif timings:
+            phases = f"discovery {timings['discovery']:.1f} s, transfer {timings['transfer']:.1f} s"
+        else:
+            phases = "probe only"
+        logging.info(f"Cycle {scheduler.ticks}: overhead {lateness * 1000:.1f} ms "
+                     f"(cron: ~{startup * 1000:.0f} ms + interpreter start), test {elapsed:.1f} s ({phases})")
+
+    sampler = None
+    if latency_hz:
+        sampler = LatencySampler(tester.db, tester.device_scanner.gateway_ip, latency_hz).start()
+        logging.info(f"Sampling gateway latency ({sampler.host}) at {1 / sampler.interval:g} Hz")
+
+    scheduler.run(cycle)
+    record_skips()
+
+    if sampler:
+        sampler.stop()
+        logging.info(f"Latency sampler stopped after {sampler.written} samples ({sampler.dropped} dropped)")
+
+    stats = scheduler.stats()
+    logging.info(f"Monitor daemon stopping after {stats['ticks']} cycles "
+                 f"({stats['skipped']} ticks skipped, max overhead {stats['max_lateness'] * 1000:.1f} ms)")
+    tester.close()
+
+
 def main():
+    parser = argparse.ArgumentParser(description='Run WiFi speed monitoring')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Keep running and test every monitoring_interval minutes (instead of cron)')
+    parser.add_argument('--sequential', action='store_true',
+                        help='Scan, select, measure and save one after another (for timing comparisons)')
+    parser.add_argument('--latency-hz', type=float, default=0, metavar='HZ',
+                        help='With --daemon, also sample gateway latency HZ times a second (1-10)')
+    args = parser.parse_args()
+
     script_dir = os.path.dirname(os.path.abspath(__file__))
     os.chdir(script_dir)
-    
-    tester = WiFiSpeedTester()
-    success = tester.run_speed_test()
-    
+
+    tester = WiFiSpeedTester(sequential=args.sequential)
+    if args.daemon:
+        run_daemon(tester, args.latency_hz)
+        sys.exit(0)
+
+    # The result is saved on a background thread; run_once waits for it
+    success = run_once(tester, 'cron', get_interval_seconds(tester.db))
+    tester.close()
+    if tester.timings:
+        logging.info(f"Run took {tester.timings['total']:.1f} s "
+                     f"(discovery {tester.timings['discovery']:.1f} s, transfer {tester.timings['transfer']:.1f} s)")
+
     sys.exit(0 if success else 1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()